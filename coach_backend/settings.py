@@ -11,14 +11,25 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 
+import tempfile
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Bulk uploads (upload/fit/batch/) can carry a whole watch export
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+# Processes used to parse batch uploads (defaults to the CPU count)
+FIT_PARSE_PROCESSES = config("FIT_PARSE_PROCESSES", default=0, cast=int)
+# Largest single .fit file accepted (uploads and ZIP members)
+FIT_UPLOAD_MAX_BYTES = config("FIT_UPLOAD_MAX_BYTES", default=50 * 1024 * 1024, cast=int)
+# .fit uploads are also kept in memory for parsing, up to this much per request
+FIT_UPLOAD_MEMORY_BYTES = config("FIT_UPLOAD_MEMORY_BYTES", default=64 * 1024 * 1024, cast=int)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -31,6 +42,12 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Per-request timing breakdown (Server-Timing header) on every response
+METRICS_TIMING_HEADER = config("METRICS_TIMING_HEADER", default=DEBUG, cast=bool)
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; unset, it is
+# only served with DEBUG on
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
 
 # Application definition
 
@@ -47,6 +64,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'training.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,12 +97,49 @@ WSGI_APPLICATION = 'coach_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) for single-node installs, DB_ENGINE=postgres
+# for several workers (psycopg[binary,pool] in requirements.txt).
+DB_ENGINE = config("DB_ENGINE", default="sqlite")
+
+if DB_ENGINE == "postgres":
+    # Persistent connections, or with DB_POOL_MAX_SIZE set Django's psycopg
+    # pool (Django doesn't allow both). Neither has been benchmarked yet:
+    # bench_db_concurrency only has SQLite numbers so far.
+    DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", default=0, cast=int)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config("DB_NAME", default="coach"),
+            'USER': config("DB_USER", default="coach"),
+            'PASSWORD': config("DB_PASSWORD", default=""),
+            'HOST': config("DB_HOST", default="localhost"),
+            'PORT': config("DB_PORT", default=5432, cast=int),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else config("DB_CONN_MAX_AGE", default=600, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if DB_POOL_MAX_SIZE:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            "min_size": config("DB_POOL_MIN_SIZE", default=2, cast=int),
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": config("DB_POOL_TIMEOUT", default=10, cast=int),
+        }
+elif DB_ENGINE == "sqlite":
+    # SQLITE_TUNED: WAL, busy_timeout and synchronous=NORMAL on every
+    # connection (training.signals.tune_sqlite), and writers take the lock
+    # when their transaction starts rather than failing to upgrade later
+    SQLITE_TUNED = config("SQLITE_TUNED", default=True, cast=bool)
+    SQLITE_BUSY_TIMEOUT_MS = config("SQLITE_BUSY_TIMEOUT_MS", default=20000, cast=int)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config("SQLITE_PATH", default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {"transaction_mode": "IMMEDIATE"} if SQLITE_TUNED else {},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgres', not {DB_ENGINE!r}")
 
 
 # Password validation
@@ -135,9 +190,38 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Shared by every worker process on the host (rendered dashboard fragments)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": config("CACHE_DIR", default=str(Path(tempfile.gettempdir()) / "coach_backend_cache")),
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
 OPENAI_API_KEY = config("OPENAI_API_KEY")
+OPENAI_BASE_URL = config("OPENAI_BASE_URL", default="https://api.openai.com/v1")
 
 # Strava API credentials
 STRAVA_CLIENT_ID = config("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = config("STRAVA_CLIENT_SECRET")
-STRAVA_REDIRECT_URI = config("STRAVA_REDIRECT_URI")
\ No newline at end of file
+STRAVA_REDIRECT_URI = config("STRAVA_REDIRECT_URI")
+# Base for both the OAuth and v3 API endpoints (overridden in tests)
+STRAVA_API_BASE = config("STRAVA_API_BASE", default="https://www.strava.com")
+# Strava's default application quota, plus a per-athlete share of it
+STRAVA_RATE_LIMIT_15MIN = config("STRAVA_RATE_LIMIT_15MIN", default=200, cast=int)
+STRAVA_RATE_LIMIT_DAILY = config("STRAVA_RATE_LIMIT_DAILY", default=2000, cast=int)
+STRAVA_USER_RATE_LIMIT_15MIN = config("STRAVA_USER_RATE_LIMIT_15MIN", default=30, cast=int)
+STRAVA_USER_RATE_LIMIT_DAILY = config("STRAVA_USER_RATE_LIMIT_DAILY", default=300, cast=int)
+# Similar-workout search (training/similarity.py): how many users' indexes a
+# process keeps in memory, and a directory to persist them in (empty: don't)
+SIMILARITY_MAX_INDEXES = config("SIMILARITY_MAX_INDEXES", default=32, cast=int)
+SIMILARITY_INDEX_DIR = config("SIMILARITY_INDEX_DIR", default="")
+# Concurrent requests while backfilling activity streams
+STRAVA_STREAMS_WORKERS = config("STRAVA_STREAMS_WORKERS", default=4, cast=int)
+# Webhook push subscription: the verify_token given when subscribing, and
+# the subscription id Strava returned (events for other ids, or any events
+# while it is unset, are rejected)
+STRAVA_WEBHOOK_VERIFY_TOKEN = config("STRAVA_WEBHOOK_VERIFY_TOKEN", default="")
+STRAVA_WEBHOOK_SUBSCRIPTION_ID = config("STRAVA_WEBHOOK_SUBSCRIPTION_ID", default=0, cast=int)
\ No newline at end of file
@@ -0,0 +1,213 @@
+# training/analytics.py
+"""
+Derived workout metrics from per-record samples, vectorized with NumPy.
+
+compute_analytics() turns the sample columns (see training/samples.py) into
+a small JSON-serializable dict that is stored on Workout.analytics:
+
+    splits             per-mile and per-km split times and average HR
+    hr_zones           seconds spent in each of five %-of-max-HR zones
+    trimp              Banister TRIMP training load
+    normalized_graded_pace_min_per_mile
+                       grade-adjusted pace, normalized over 30 s windows
+    best_efforts       fastest 1k, 1 mile, 5k and 10k inside the activity
+
+Like fit_utils this module doesn't import Django, so it can run in the
+batch upload's parse pool.
+"""
+import numpy as np
+
+from .fit_utils import M_PER_MILE, parse_fit_samples
+
+ANALYTICS_VERSION = 1
+
+DEFAULT_MAX_HR = 190
+DEFAULT_REST_HR = 60
+# Upper bounds of zones 1-4 as a fraction of max HR; zone 5 is everything above
+HR_ZONE_BOUNDS = (0.6, 0.7, 0.8, 0.9)
+# Gaps between records longer than this are pauses and don't count as time spent
+MAX_GAP_S = 30
+
+SPLIT_UNITS = {"mile": M_PER_MILE, "km": 1000.0}
+BEST_EFFORTS = {"1k": 1000.0, "1mi": M_PER_MILE, "5k": 5000.0, "10k": 10000.0}
+
+NGP_WINDOW_S = 30
+GRADE_WINDOW_S = 5
+MAX_GRADE = 0.45
+
+
+def _prepare(columns):
+    """
+    Float64 time (s since start), cumulative distance and HR arrays with
+    NaN distances filled forward and the distance made non-decreasing.
+    """
+    t = np.asarray(columns["timestamp"], dtype=np.float64)
+    t = t - t[0]
+    d = np.asarray(columns["distance"], dtype=np.float64)
+    valid = ~np.isnan(d)
+    if not valid.any():
+        d = np.zeros_like(t)
+    else:
+        # forward fill: index of the last valid sample at every position
+        idx = np.where(valid, np.arange(len(d)), 0)
+        np.maximum.accumulate(idx, out=idx)
+        d = d[idx]
+        d[:np.argmax(valid)] = 0.0
+        np.maximum.accumulate(d, out=d)
+    hr = np.asarray(columns["heart_rate"], dtype=np.float64)
+    return t, d, hr
+
+
+def _moving_dt(t):
+    """Seconds each sample accounts for (the gap to the next one), pauses zeroed."""
+    dt = np.diff(t, append=t[-1])
+    dt[dt > MAX_GAP_S] = 0.0
+    return dt
+
+
+def _strictly_increasing(t, d):
+    """Drop samples where distance doesn't move, so d can be used as an interp axis."""
+    keep = np.ones(len(d), dtype=bool)
+    keep[1:] = np.diff(d) > 0
+    return t[keep], d[keep]
+
+
+def compute_splits(t, d, hr, unit_m):
+    """Full splits of ``unit_m`` metres: elapsed seconds and average HR of each."""
+    tu, du = _strictly_increasing(t, d)
+    count = int(du[-1] // unit_m) if len(du) else 0
+    if count == 0:
+        return []
+    marks = np.arange(count + 1) * unit_m
+    times = np.interp(marks, du, tu)
+    times[0] = 0.0
+
+    # Integral of HR over time, sampled at the split boundaries
+    hr_ok = ~np.isnan(hr)
+    dt = _moving_dt(t)
+    hr_time = np.concatenate(([0.0], np.cumsum(np.where(hr_ok, hr * dt, 0.0))))
+    hr_cover = np.concatenate(([0.0], np.cumsum(np.where(hr_ok, dt, 0.0))))
+    edges = np.concatenate((t, [t[-1]]))
+    hr_at = np.interp(times, edges, hr_time)
+    cover_at = np.interp(times, edges, hr_cover)
+    hr_span = np.diff(hr_at)
+    cover_span = np.diff(cover_at)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_hr = np.where(cover_span > 0, hr_span / cover_span, np.nan)
+
+    seconds = np.diff(times)
+    return [
+        {
+            "n": i + 1,
+            "seconds": round(float(seconds[i]), 1),
+            "avg_hr": None if np.isnan(avg_hr[i]) else round(float(avg_hr[i]), 1),
+        }
+        for i in range(count)
+    ]
+
+
+def compute_hr_zones(t, hr, max_hr=DEFAULT_MAX_HR):
+    ok = ~np.isnan(hr)
+    dt = _moving_dt(t)[ok]
+    bounds = np.asarray(HR_ZONE_BOUNDS) * max_hr
+    zones = np.digitize(hr[ok], bounds)
+    seconds = np.bincount(zones, weights=dt, minlength=len(bounds) + 1)
+    return {
+        "max_hr": max_hr,
+        "bounds": [round(float(b), 1) for b in bounds],
+        "seconds": [round(float(s), 1) for s in seconds],
+    }
+
+
+def compute_trimp(t, hr, max_hr=DEFAULT_MAX_HR, rest_hr=DEFAULT_REST_HR):
+    """Banister TRIMP: minutes weighted by 0.64·e^(1.92·HR reserve fraction)."""
+    ok = ~np.isnan(hr)
+    if not ok.any():
+        return None
+    minutes = _moving_dt(t)[ok] / 60.0
+    reserve = np.clip((hr[ok] - rest_hr) / (max_hr - rest_hr), 0.0, 1.0)
+    return round(float(np.sum(minutes * reserve * 0.64 * np.exp(1.92 * reserve))), 1)
+
+
+def grade_cost_factor(grade):
+    """Minetti et al. energy cost of running at ``grade``, relative to flat ground."""
+    g = np.clip(grade, -MAX_GRADE, MAX_GRADE)
+    cost = (((((155.4 * g - 30.4) * g - 43.3) * g + 46.3) * g + 19.5) * g) + 3.6
+    return cost / 3.6
+
+
+def compute_normalized_graded_pace(t, d, altitude):
+    """
+    Resample to 1 Hz, adjust speed for grade, take 30 s rolling averages
+    and their 4th-power mean (as for normalized power). Returns min/mile.
+    """
+    duration = int(t[-1])
+    if duration < NGP_WINDOW_S or d[-1] <= 0:
+        return None
+    grid = np.arange(duration + 1, dtype=np.float64)
+    dist = np.interp(grid, t, d)
+    speed = np.gradient(dist)
+
+    alt = np.asarray(altitude, dtype=np.float64)
+    alt_ok = ~np.isnan(alt)
+    if alt_ok.sum() >= 2:
+        alt = np.interp(grid, t[alt_ok], alt[alt_ok])
+        w = GRADE_WINDOW_S
+        rise = np.empty_like(alt)
+        run = np.empty_like(dist)
+        rise[w:-w] = alt[2 * w:] - alt[:-2 * w]
+        run[w:-w] = dist[2 * w:] - dist[:-2 * w]
+        rise[:w] = rise[-w:] = 0.0
+        run[:w] = run[-w:] = 0.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grade = np.where(run > 1.0, rise / run, 0.0)
+        speed = speed * grade_cost_factor(grade)
+
+    csum = np.concatenate(([0.0], np.cumsum(speed)))
+    rolling = (csum[NGP_WINDOW_S:] - csum[:-NGP_WINDOW_S]) / NGP_WINDOW_S
+    normalized = float(np.mean(rolling ** 4) ** 0.25)
+    if normalized <= 0:
+        return None
+    return round(M_PER_MILE / normalized / 60.0, 2)
+
+
+def compute_best_efforts(t, d):
+    """Fastest time to cover each BEST_EFFORTS distance, by sliding a window along the distance axis."""
+    tu, du = _strictly_increasing(t, d)
+    efforts = {}
+    for name, length in BEST_EFFORTS.items():
+        if not len(du) or du[-1] - du[0] < length:
+            efforts[name] = None
+            continue
+        starts = du[du + length <= du[-1]]
+        start_t = tu[:len(starts)]
+        end_t = np.interp(starts + length, du, tu)
+        efforts[name] = round(float(np.min(end_t - start_t)), 1)
+    return efforts
+
+
+def compute_analytics(columns, max_hr=DEFAULT_MAX_HR, rest_hr=DEFAULT_REST_HR):
+    """All derived metrics for one workout's sample columns (or a WorkoutSamples)."""
+    if len(columns["timestamp"]) < 2:
+        return None
+    t, d, hr = _prepare(columns)
+    return {
+        "version": ANALYTICS_VERSION,
+        "splits": {unit: compute_splits(t, d, hr, length) for unit, length in SPLIT_UNITS.items()},
+        "hr_zones": compute_hr_zones(t, hr, max_hr),
+        "trimp": compute_trimp(t, hr, max_hr, rest_hr),
+        "normalized_graded_pace_min_per_mile": compute_normalized_graded_pace(t, d, columns["altitude"]),
+        "best_efforts": compute_best_efforts(t, d),
+    }
+
+
+def analyze_fit_safe(data):
+    """
+    For process pools: decode, keep the samples and derive the analytics.
+    Returns ((metrics, columns, analytics), None) or (None, error message).
+    """
+    try:
+        metrics, columns = parse_fit_samples(data)
+        return (metrics, columns, compute_analytics(columns)), None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
@@ -0,0 +1,240 @@
+# training/batch.py
+"""
+Bulk .fit ingestion: many files, or one ZIP export, in a single request.
+
+Files are handled in chunks so memory stays bounded: a chunk holds at most
+CHUNK_SIZE files and, past the first file, CHUNK_BYTES of them (a single
+file can be up to FIT_UPLOAD_MAX_BYTES). Each chunk is stored, parsed
+across a process pool and inserted with one bulk_create. Files that
+fail fit_utils.probe_fit() never reach the pool, files the user has
+uploaded before are skipped before parsing (by content hash or FIT
+file_id), and runs already imported from Strava get the file's data
+attached instead of a second workout.
+"""
+import atexit
+import hashlib
+import multiprocessing
+import os
+import posixpath
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+
+from . import dedup, rollups, versions
+from .analytics import analyze_fit_safe
+from .fit_utils import probe_fit_safe
+from .jobs import save_fit_upload, workout_from_metrics
+from .models import Workout
+from .samples import samples_path_for, write_samples
+
+CHUNK_SIZE = 64
+# File bytes held in memory per chunk; a long run's .fit is a few MB
+CHUNK_BYTES = 64 * 1024 * 1024
+# Below this many files the pool's pickling overhead isn't worth it
+MIN_FILES_FOR_POOL = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """
+    Process pool shared by every batch request in this server process.
+    Workers are spawned (not forked) and only import fit_utils and
+    analytics, so they don't carry Django state or DB connections.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, "FIT_PARSE_PROCESSES", None) or os.cpu_count() or 2
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _parse_all(datas):
+    if len(datas) < MIN_FILES_FOR_POOL:
+        return [analyze_fit_safe(d) for d in datas]
+    return list(get_parse_pool().map(analyze_fit_safe, datas))
+
+
+def iter_upload_members(files):
+    """
+    Yield (name, bytes or None, error or None, stored) for every .fit file
+    in the request. ``stored`` is (rel_path, content_hash) for files that
+    uploads.FitUploadHandler already wrote to storage, else None. ZIP
+    archives are read member by member straight out of the upload, never
+    extracted to disk.
+    """
+    max_bytes = settings.FIT_UPLOAD_MAX_BYTES
+    for f in files:
+        name = f.name or ""
+        if getattr(f, "error", None):
+            yield name, None, f.error, None
+        elif name.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(f)
+            except zipfile.BadZipFile:
+                yield name, None, "Not a valid ZIP archive", None
+                continue
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(".fit"):
+                        continue
+                    if info.file_size > max_bytes:
+                        yield info.filename, None, "File too large", None
+                        continue
+                    with archive.open(info) as member:
+                        yield info.filename, member.read(), None, None
+        elif name.lower().endswith(".fit"):
+            stored = (f.rel_path, f.content_hash) if getattr(f, "rel_path", None) else None
+            yield name, f.read(), None, stored
+        else:
+            yield name, None, "Only .fit and .zip files are allowed", None
+
+
+def _insert(user, workouts):
+    """
+    bulk_create ``workouts``. The duplicate checks in _ingest_chunk() race
+    with other uploads of the same files (the worker, another batch), so if
+    the insert hits unique_workout_upload each workout is retried on its own
+    savepoint. Returns, in order, the workout that got there first for each
+    one that lost the race, else None.
+    """
+    try:
+        with transaction.atomic():
+            Workout.objects.bulk_create(workouts, batch_size=CHUNK_SIZE)
+        return [None] * len(workouts)
+    except IntegrityError:
+        pass
+    winners = []
+    for workout in workouts:
+        workout.pk, workout._state.adding = None, True  # may be left set by the rolled back insert
+        try:
+            with transaction.atomic():
+                Workout.objects.bulk_create([workout])
+            winners.append(None)
+        except IntegrityError:
+            existing = dedup.find_duplicate(user, workout.content_hash)
+            if existing is None:
+                raise
+            winners.append(existing)
+    return winners
+
+
+def _ingest_chunk(user, chunk):
+    results = [None] * len(chunk)
+    hashes = {}  # index -> sha256 of the file
+    file_ids = {}  # index -> probe_fit()'s fit_file_id
+    for i, (name, data, error, stored) in enumerate(chunk):
+        if not error:
+            probe, error = probe_fit_safe(data, len(data))
+        if error:
+            results[i] = {"name": name, "status": "error", "error": error}
+            continue
+        hashes[i] = stored[1] if stored else hashlib.sha256(data).hexdigest()
+        file_ids[i] = probe["fit_file_id"]
+
+    # Files seen before (already stored, or earlier in this chunk) aren't parsed
+    # again, nor are other exports of a recording seen before
+    known = Workout.objects.filter(user=user)
+    existing = dict(known.filter(content_hash__in=set(hashes.values())).values_list("content_hash", "pk"))
+    existing_ids = dict(
+        known.filter(fit_file_id__in={f for f in file_ids.values() if f}).values_list("fit_file_id", "pk")
+    )
+    first_index = {}  # hash or file id -> index of its first occurrence in this chunk
+    repeats = []      # (index, first index) of in-chunk repeats, resolved after the insert
+    pending = []      # (index, data)
+    for i, content_hash in hashes.items():
+        name = chunk[i][0]
+        file_id = file_ids[i]
+        workout_id = existing.get(content_hash) or existing_ids.get(file_id)
+        first = first_index.get(content_hash, first_index.get(file_id))
+        if workout_id:
+            results[i] = {"name": name, "status": "duplicate", "workout_id": workout_id}
+        elif first is not None:
+            repeats.append((i, first))
+        else:
+            first_index[content_hash] = i
+            if file_id:
+                first_index[file_id] = i
+            pending.append((i, chunk[i][1]))
+
+    parsed = _parse_all([data for _, data in pending])
+
+    workouts = []
+    created_for = []
+    workout_ids = {}  # index -> pk, for the in-chunk repeats
+    for (i, data), (parsed_file, error) in zip(pending, parsed):
+        name = chunk[i][0]
+        if error:
+            results[i] = {"name": name, "status": "error", "error": error}
+            continue
+        metrics, columns, analytics = parsed_file
+        stored = chunk[i][3]
+        rel_path, content_hash = stored or save_fit_upload(ContentFile(data, name=posixpath.basename(name)))
+        samples_path = write_samples(samples_path_for(rel_path), columns)
+        started_at = dedup.started_at_from_samples(columns)
+        match = dedup.find_strava_match(user, started_at, metrics["distance_miles"])
+        if match is not None:
+            dedup.attach_upload(
+                match, file_path=rel_path, samples_path=samples_path, analytics=analytics, content_hash=content_hash,
+                fit_file_id=file_ids[i],
+            )
+            workout_ids[i] = match.pk
+            results[i] = {"name": name, "status": "linked", "workout_id": match.pk, "file_path": rel_path}
+            continue
+        workouts.append(workout_from_metrics(
+            user, metrics, rel_path,
+            samples_path=samples_path, analytics=analytics, content_hash=content_hash, started_at=started_at,
+            fit_file_id=file_ids[i],
+        ))
+        created_for.append(i)
+
+    winners = _insert(user, workouts)
+    inserted = [workout for workout, winner in zip(workouts, winners) if winner is None]
+    rollups.add_workouts(inserted)  # bulk_create sends no post_save
+    if inserted:
+        versions.bump([user.pk])
+    for i, workout, winner in zip(created_for, workouts, winners):
+        if winner is not None:
+            workout_ids[i] = winner.pk
+            results[i] = {"name": chunk[i][0], "status": "duplicate", "workout_id": winner.pk}
+            continue
+        workout_ids[i] = workout.pk
+        results[i] = {
+            "name": chunk[i][0],
+            "status": "created",
+            "workout_id": workout.pk,
+            "file_path": workout.file_path,
+        }
+    for i, first in repeats:
+        if results[first]["status"] == "error":
+            results[i] = {"name": chunk[i][0], "status": "error", "error": results[first]["error"]}
+        else:
+            results[i] = {"name": chunk[i][0], "status": "duplicate", "workout_id": workout_ids[first]}
+    return results
+
+
+def ingest_fit_batch(user, files, chunk_size=CHUNK_SIZE):
+    """Ingest every .fit file in ``files`` (uploads and/or ZIPs). Returns per-file results."""
+    results = []
+    chunk = []
+    chunk_bytes = 0
+    for member in iter_upload_members(files):
+        size = len(member[1] or b"")
+        if chunk and chunk_bytes + size > CHUNK_BYTES:
+            results.extend(_ingest_chunk(user, chunk))
+            chunk, chunk_bytes = [], 0
+        chunk.append(member)
+        chunk_bytes += size
+        if len(chunk) >= chunk_size:
+            results.extend(_ingest_chunk(user, chunk))
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        results.extend(_ingest_chunk(user, chunk))
+    return results
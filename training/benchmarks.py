@@ -0,0 +1,1223 @@
+# training/benchmarks.py
+"""
+Micro-benchmarks for the training app.
+
+Run with:  python -m training.benchmarks
+
+The before/after comparisons behind past optimizations are the bench_*
+functions. The regression suite (suite_*, run_suite) is what
+`manage.py benchmark` runs: absolute timings as JSON, which can be saved and
+passed back as --baseline to gate regressions.
+
+The database benchmarks run against a throwaway test database, never the
+configured one.
+"""
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from fitparse import FitFile
+
+from .fit_synth import build_fit
+from .fit_utils import parse_fit, probe_fit, M_PER_MILE
+
+# name -> activity length in seconds (1 Hz records)
+FIT_SIZES = {
+    "small": 30 * 60,
+    "medium": 2 * 3600,
+    "10h": 10 * 3600,
+}
+
+
+def parse_fit_two_pass(file_obj):
+    """
+    The original parse_fit (session pass + a second pass over records building
+    a dict per message). Kept here only as the benchmark baseline.
+    """
+    file_obj.seek(0)
+    fit = FitFile(file_obj)
+
+    total_dist_m = 0.0
+    total_time_s = 0.0
+    avg_hr = None
+    start_date = None
+
+    for msg in fit.get_messages("session"):
+        vals = {d.name: d.value for d in msg}
+        if vals.get("total_distance") is not None:
+            total_dist_m = float(vals["total_distance"] or 0.0)
+        if vals.get("total_elapsed_time") is not None:
+            total_time_s = float(vals["total_elapsed_time"] or 0.0)
+        if vals.get("avg_heart_rate") is not None:
+            avg_hr = int(vals["avg_heart_rate"])
+        if not start_date and vals.get("start_time"):
+            start_date = vals["start_time"].date()
+
+    if avg_hr is None:
+        hr_sum = 0
+        hr_count = 0
+        for rec in fit.get_messages("record"):
+            vals = {d.name: d.value for d in rec}
+            hr = vals.get("heart_rate")
+            if hr is not None:
+                hr_sum += int(hr); hr_count += 1
+        if hr_count:
+            avg_hr = int(round(hr_sum / hr_count))
+
+    distance_miles = total_dist_m / M_PER_MILE if total_dist_m else 0.0
+    duration_minutes = total_time_s / 60.0 if total_time_s else 0.0
+    avg_pace = round(duration_minutes / distance_miles, 2) if distance_miles and duration_minutes else None
+    return {
+        "date": start_date,
+        "distance_miles": round(distance_miles, 3),
+        "duration_minutes": round(duration_minutes, 2),
+        "avg_heart_rate": avg_hr,
+        "avg_pace_min_per_mile": avg_pace,
+    }
+
+
+def _time(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs)
+
+
+def bench_parse_fit(sizes=None, repeat=3, session_hr=False):
+    """
+    Compare parse_fit against the two-pass baseline.
+
+    session_hr=False (the default) is the worst case for the old parser: no
+    session avg HR, so it has to walk every record a second time.
+    """
+    results = []
+    for name, seconds in (sizes or FIT_SIZES).items():
+        data = build_fit(duration_s=seconds, session_hr=session_hr)
+        new = _time(lambda: parse_fit(io.BytesIO(data)), repeat)
+        old = _time(lambda: parse_fit_two_pass(io.BytesIO(data)), repeat)
+        results.append({
+            "name": f"parse_fit[{name}]",
+            "bytes": len(data),
+            "records": seconds + 1,
+            "seconds": new,
+            "baseline_seconds": old,
+            "speedup": old / new if new else None,
+        })
+    return results
+
+
+def _time_per_call(fn, calls, repeat):
+    return _time(lambda: [fn() for _ in range(calls)], repeat) / calls
+
+
+def bench_probe(sizes=None, repeat=5, calls=200):
+    """
+    Validating an upload with probe_fit (header, header CRC, file_id)
+    against decoding the whole file with parse_fit, plus how long the probe
+    takes to turn away a truncated copy.
+    """
+    results = []
+    for name, seconds in (sizes or FIT_SIZES).items():
+        data = build_fit(duration_s=seconds)
+        truncated = data[:-100]
+
+        def reject_truncated():
+            try:
+                probe_fit(truncated, len(truncated))
+            except ValueError:
+                return
+            raise AssertionError("truncated file passed the probe")
+
+        probe = _time_per_call(lambda: probe_fit(data, len(data)), calls, repeat)
+        parse = _time(lambda: parse_fit(io.BytesIO(data)), repeat)
+        results.append({
+            "name": f"probe_fit[{name}]",
+            "bytes": len(data),
+            "seconds": probe,
+            "reject_seconds": _time_per_call(reject_truncated, calls, repeat),
+            "baseline_seconds": parse,
+            "speedup": parse / probe,
+        })
+    return results
+
+
+def _setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "coach_backend.settings")
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(test_name=None):
+    """
+    Set up Django if needed and run the body against a fresh test database
+    (named ``test_name`` instead of the backend's default if given, e.g. a
+    file path to get a SQLite database other connections can open).
+    """
+    _setup_django()
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    if test_name:
+        test_settings["NAME"] = test_name
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+        teardown_test_environment()
+
+
+def _seed_workouts(user, count, batch_size=2000):
+    from .models import Workout
+
+    start = datetime(2015, 1, 1, 6, 0, tzinfo=dt_timezone.utc)
+    Workout.objects.bulk_create(
+        (
+            Workout(
+                user=user,
+                date=start + timedelta(hours=6 * i),
+                distance_miles=3 + (i % 70) / 10,
+                duration_minutes=30 + (i % 60),
+                avg_heart_rate=130 + i % 40,
+                avg_pace_min_per_mile=7 + (i % 40) / 10,
+            )
+            for i in range(count)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def bench_workout_list(counts=(1_000, 10_000, 50_000), repeat=5, page_size=50):
+    """
+    WorkoutListView latency as one user's history grows: first page, a page
+    from the middle of the history and a filtered page (cursor pagination),
+    against the old unpaginated list. Must run inside test_database().
+    """
+    from django.contrib.auth import get_user_model
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from .models import Workout
+    from .pagination import WorkoutCursorPagination
+    from .views import WorkoutListView
+
+    factory = APIRequestFactory()
+    view = WorkoutListView.as_view()
+    User = get_user_model()
+    results = []
+    for n in counts:
+        Workout.objects.all().delete()
+        user, _ = User.objects.get_or_create(username="bench")
+        _seed_workouts(user, n)
+        middle = Workout.objects.filter(user=user).order_by(*WorkoutCursorPagination.ordering)[n // 2]
+        cursor = WorkoutCursorPagination().encode_cursor(middle, reverse=False)
+
+        def get(**params):
+            request = factory.get("/api/workouts/", {"page_size": page_size, **params})
+            force_authenticate(request, user=user)
+            response = view(request)
+            response.render()
+            return response
+
+        def unpaginated():
+            return list(Workout.objects.filter(user=user).order_by("-date", "-created_at").values())
+
+        results.append({
+            "workouts": n,
+            "first_page": _time(get, repeat),
+            "middle_page": _time(lambda: get(cursor=cursor), repeat),
+            "filtered_page": _time(lambda: get(min_distance=5, max_pace=9, cursor=cursor), repeat),
+            "full_list_baseline": _time(unpaginated, min(repeat, 3)),
+        })
+    return results
+
+
+def bench_samples(hours=4, repeat=5):
+    """
+    Reading a stored workout's record stream: memory-mapping the sample
+    columns vs decoding the FIT file again.
+    """
+    import tempfile
+    import numpy as np
+    _setup_django()
+    from django.test import override_settings
+    from .fit_utils import parse_fit_samples
+    from .samples import load_samples, write_samples
+
+    data = build_fit(duration_s=hours * 3600)
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        _, columns = parse_fit_samples(data)
+        write_samples("bench.fit.samples", columns)
+
+        def from_samples():
+            samples = load_samples("bench.fit.samples")
+            return float(np.nanmean(samples["heart_rate"])), float(samples["distance"][-1])
+
+        def from_fit():
+            _, cols = parse_fit_samples(io.BytesIO(data))
+            return float(np.nanmean(np.frombuffer(cols["heart_rate"]))), cols["distance"][-1]
+
+        load = _time(from_samples, repeat)
+        decode = _time(from_fit, repeat)
+    return {
+        "name": f"samples[{hours}h]",
+        "records": len(columns["timestamp"]),
+        "seconds": load,
+        "baseline_seconds": decode,
+        "speedup": decode / load if load else None,
+    }
+
+
+def _io_counters():
+    """(bytes read, bytes written) through read()/write() syscalls by this process, or None off Linux."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+# 32 h is ~2.6 MB, past FILE_UPLOAD_MAX_MEMORY_SIZE, where Django spools to a temp file
+UPLOAD_SIZES = {**FIT_SIZES, "32h": 32 * 3600}
+
+
+def bench_upload(sizes=None, repeat=5):
+    """
+    One multipart .fit upload, from request body to the file stored and its
+    bytes in hand for the parser: Django's default handlers + copy into
+    MEDIA_ROOT + re-open, against FitUploadHandler teeing to storage and
+    keeping the bytes in memory. Parsing itself is the same either way and
+    is left out. Bytes copied are what the process moved through
+    read()/write() syscalls (the request body is read from memory in both).
+    """
+    import tempfile
+    _setup_django()
+    from django.conf import settings
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.files.uploadhandler import load_handler
+    from django.http.multipartparser import MultiPartParser
+    from django.test import override_settings
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+    from .jobs import save_fit_upload
+    from .uploads import FitUploadHandler
+
+    def parse_request(body, handlers):
+        meta = {"CONTENT_TYPE": MULTIPART_CONTENT, "CONTENT_LENGTH": str(len(body))}
+        return MultiPartParser(meta, io.BytesIO(body), handlers).parse()[1]["file"]
+
+    def default_path(body):
+        f = parse_request(body, [load_handler(h) for h in settings.FILE_UPLOAD_HANDLERS])
+        rel_path, _ = save_fit_upload(f)
+        f.close()
+        with open(os.path.join(settings.MEDIA_ROOT, rel_path), "rb") as saved:
+            return saved.read()
+
+    def streamed_path(body):
+        return parse_request(body, [FitUploadHandler()]).read()
+
+    def measure(fn, body):
+        before = _io_counters()
+        fn(body)
+        after = _io_counters()
+        copied = sum(a - b for a, b in zip(after, before)) if before and after else None
+        return copied, _time(lambda: fn(body), repeat)
+
+    results = []
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        for name, seconds in (sizes or UPLOAD_SIZES).items():
+            data = build_fit(duration_s=seconds)
+            body = encode_multipart(BOUNDARY, {"file": SimpleUploadedFile(f"{name}.fit", data)})
+            old_bytes, old = measure(default_path, body)
+            new_bytes, new = measure(streamed_path, body)
+            results.append({
+                "name": f"upload[{name}]",
+                "bytes": len(data),
+                "bytes_copied": new_bytes,
+                "baseline_bytes_copied": old_bytes,
+                "seconds": new,
+                "baseline_seconds": old,
+                "speedup": old / new if new else None,
+            })
+    return results
+
+
+# The in-memory SQLite test database can't take writes from several threads
+# at once; the async views funnel their ORM calls through one thread anyway
+_db_lock = threading.Lock()
+
+
+def _strava_callback_sync(code):
+    """The callback's work as the old synchronous view did it (requests + sync ORM)."""
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from . import strava
+
+    res = strava.get_session().post(strava.oauth_url("token"), data={
+        "client_id": settings.STRAVA_CLIENT_ID,
+        "client_secret": settings.STRAVA_CLIENT_SECRET,
+        "code": code,
+        "grant_type": "authorization_code",
+    }, timeout=strava.REQUEST_TIMEOUT)
+    with _db_lock:
+        user = get_user_model().objects.first()
+        strava.token_manager.save_token(user, res.json())
+        strava.request_sync(user)
+
+
+def bench_async_views(concurrency=50, latency=0.1, sync_threads=4):
+    """
+    Load test against local stub servers that answer after ``latency``
+    seconds: ``concurrency`` simultaneous Strava OAuth callbacks and as many
+    insight generations.
+
+    Callbacks: the async view on one event loop (as one ASGI worker runs
+    it) vs the old synchronous view on a worker with ``sync_threads``
+    threads. Insights: the background loop vs the old two-thread pool.
+    Must run inside test_database().
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from django.contrib.auth import get_user_model
+    from django.test import AsyncClient, override_settings
+    from django.urls import reverse
+    from openai import OpenAI
+
+    from . import services, strava
+    from .fake_openai import FakeOpenAI
+    from .fake_strava import FakeStrava
+    from .models import Workout, WorkoutInsight
+
+    user, _ = get_user_model().objects.get_or_create(username="bench")
+    Workout.objects.filter(user=user).delete()
+    _seed_workouts(user, concurrency)
+    workouts = list(Workout.objects.filter(user=user))
+    results = {"concurrency": concurrency, "latency": latency, "sync_threads": sync_threads}
+
+    with FakeStrava() as fake_strava, FakeOpenAI() as fake_openai, override_settings(
+        STRAVA_API_BASE=fake_strava.url, OPENAI_BASE_URL=fake_openai.url,
+    ):
+        fake_strava.latency = fake_openai.latency = latency
+
+        async def callbacks(count):
+            client = AsyncClient()
+            responses = await asyncio.gather(*(
+                client.get(reverse("strava-callback"), {"code": f"code-{i}"}) for i in range(count)
+            ))
+            assert all(r.status_code == 302 for r in responses)
+
+        asyncio.run(callbacks(1))  # warm up URL resolving and the middleware chain
+        started = time.perf_counter()
+        asyncio.run(callbacks(concurrency))
+        results["callbacks_async"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sync_threads) as pool:
+            list(pool.map(_strava_callback_sync, [f"code-{i}" for i in range(concurrency)]))
+        results["callbacks_sync"] = time.perf_counter() - started
+
+        def reset_insights():
+            WorkoutInsight.objects.all().delete()
+            return [(services.insight_key(w), w) for w in workouts]
+
+        pending = reset_insights()
+        WorkoutInsight.objects.bulk_create(WorkoutInsight(key=key) for key, _ in pending)
+        started = time.perf_counter()
+        loop = services._background_loop()
+        futures = [asyncio.run_coroutine_threadsafe(services.generate_insight(key, w), loop) for key, w in pending]
+        for future in futures:
+            future.result()
+        results["insights_async"] = time.perf_counter() - started
+        assert WorkoutInsight.objects.filter(status=WorkoutInsight.READY).count() == concurrency
+
+        # The old generator: the sync OpenAI client on a two-thread pool
+        client = OpenAI(api_key="bench", base_url=fake_openai.url)
+
+        def generate_sync(key, workout):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini", messages=[{"role": "user", "content": services.build_prompt(workout)}],
+                max_tokens=200,
+            )
+            with _db_lock:
+                WorkoutInsight.objects.filter(key=key).update(
+                    status=WorkoutInsight.READY, content=response.choices[0].message.content,
+                )
+
+        pending = reset_insights()
+        WorkoutInsight.objects.bulk_create(WorkoutInsight(key=key) for key, _ in pending)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda item: generate_sync(*item), pending))
+        results["insights_sync"] = time.perf_counter() - started
+    return results
+
+
+def analytics_naive(columns):
+    """
+    Pure-Python loops computing the same numbers as analytics.compute_analytics.
+    Kept here only as the benchmark baseline (and a cross-check in the tests).
+    """
+    import math
+    from .analytics import (
+        BEST_EFFORTS, GRADE_WINDOW_S, HR_ZONE_BOUNDS, MAX_GAP_S, MAX_GRADE, NGP_WINDOW_S, SPLIT_UNITS,
+        DEFAULT_MAX_HR as max_hr, DEFAULT_REST_HR as rest_hr,
+    )
+
+    t0 = columns["timestamp"][0]
+    t = [float(x - t0) for x in columns["timestamp"]]
+    n = len(t)
+    d, last, seen = [], 0.0, False
+    for x in columns["distance"]:
+        x = float(x)
+        if not math.isnan(x):
+            seen = True
+            last = max(last, x)
+        d.append(last if seen else 0.0)
+    hr = [float(x) for x in columns["heart_rate"]]
+    dt = [(t[i + 1] - t[i]) if i + 1 < n else 0.0 for i in range(n)]
+    dt = [0.0 if x > MAX_GAP_S else x for x in dt]
+    tu, du = [t[0]], [d[0]]
+    for i in range(1, n):
+        if d[i] > du[-1]:
+            tu.append(t[i]); du.append(d[i])
+
+    def time_at(target):  # linear interpolation of time along distance
+        lo, hi = 0, len(du) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if du[mid] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return tu[0]
+        f = (target - du[lo - 1]) / (du[lo] - du[lo - 1])
+        return tu[lo - 1] + f * (tu[lo] - tu[lo - 1])
+
+    def hr_integrals(times):
+        out, acc, cov, i = [], 0.0, 0.0, 0
+        for target in times:
+            while i + 1 < n and t[i + 1] <= target:
+                if not math.isnan(hr[i]):
+                    acc += hr[i] * dt[i]; cov += dt[i]
+                i += 1
+            part_acc, part_cov = acc, cov
+            if i + 1 < n and target > t[i] and not math.isnan(hr[i]):
+                f = (target - t[i]) / (t[i + 1] - t[i])
+                part_acc += f * hr[i] * dt[i]; part_cov += f * dt[i]
+            out.append((part_acc, part_cov))
+        return out
+
+    splits = {}
+    for unit, length in SPLIT_UNITS.items():
+        count = int(du[-1] // length)
+        times = [0.0] + [time_at(k * length) for k in range(1, count + 1)]
+        integ = hr_integrals(times)
+        rows = []
+        for k in range(count):
+            cov = integ[k + 1][1] - integ[k][1]
+            avg = (integ[k + 1][0] - integ[k][0]) / cov if cov > 0 else None
+            rows.append({"n": k + 1, "seconds": round(times[k + 1] - times[k], 1),
+                         "avg_hr": None if avg is None else round(avg, 1)})
+        splits[unit] = rows
+
+    bounds = [b * max_hr for b in HR_ZONE_BOUNDS]
+    zone_s = [0.0] * (len(bounds) + 1)
+    trimp, any_hr = 0.0, False
+    for i in range(n):
+        if math.isnan(hr[i]):
+            continue
+        any_hr = True
+        zone = 0
+        while zone < len(bounds) and hr[i] >= bounds[zone]:
+            zone += 1
+        zone_s[zone] += dt[i]
+        r = min(max((hr[i] - rest_hr) / (max_hr - rest_hr), 0.0), 1.0)
+        trimp += dt[i] / 60.0 * r * 0.64 * math.exp(1.92 * r)
+
+    efforts = {}
+    for name, length in BEST_EFFORTS.items():
+        best = None
+        j = 0
+        for i in range(len(du)):
+            target = du[i] + length
+            if target > du[-1]:
+                break
+            j = max(j, i)
+            while du[j] < target:
+                j += 1
+            f = (target - du[j - 1]) / (du[j] - du[j - 1]) if j > i else 0.0
+            elapsed = (tu[j - 1] + f * (tu[j] - tu[j - 1]) if j > i else tu[j]) - tu[i]
+            if best is None or elapsed < best:
+                best = elapsed
+        efforts[name] = None if best is None else round(best, 1)
+
+    # Normalized graded pace
+    ngp = None
+    duration = int(t[-1])
+    if duration >= NGP_WINDOW_S and d[-1] > 0:
+        def resample(values, xs):
+            out, k = [], 0
+            for g in range(duration + 1):
+                while k + 1 < len(xs) - 1 and xs[k + 1] <= g:
+                    k += 1
+                if g <= xs[0]:
+                    out.append(values[0])
+                elif g >= xs[-1]:
+                    out.append(values[-1])
+                else:
+                    while xs[k + 1] < g:
+                        k += 1
+                    f = (g - xs[k]) / (xs[k + 1] - xs[k])
+                    out.append(values[k] + f * (values[k + 1] - values[k]))
+            return out
+
+        dist = resample(d, t)
+        m = len(dist)
+        speed = [dist[1] - dist[0]] + [(dist[i + 1] - dist[i - 1]) / 2 for i in range(1, m - 1)] + [dist[-1] - dist[-2]]
+        alt_pts = [(t[i], float(a)) for i, a in enumerate(columns["altitude"]) if not math.isnan(float(a))]
+        if len(alt_pts) >= 2:
+            alt = resample([a for _, a in alt_pts], [x for x, _ in alt_pts])
+            w = GRADE_WINDOW_S
+            for i in range(m):
+                grade = 0.0
+                if w <= i < m - w:
+                    run = dist[i + w] - dist[i - w]
+                    if run > 1.0:
+                        grade = (alt[i + w] - alt[i - w]) / run
+                g = min(max(grade, -MAX_GRADE), MAX_GRADE)
+                cost = 155.4 * g ** 5 - 30.4 * g ** 4 - 43.3 * g ** 3 + 46.3 * g ** 2 + 19.5 * g + 3.6
+                speed[i] *= cost / 3.6
+        window = sum(speed[:NGP_WINDOW_S])
+        total, count = 0.0, 0
+        for i in range(NGP_WINDOW_S, m + 1):
+            total += (window / NGP_WINDOW_S) ** 4
+            count += 1
+            if i < m:
+                window += speed[i] - speed[i - NGP_WINDOW_S]
+        normalized = (total / count) ** 0.25
+        if normalized > 0:
+            ngp = round(M_PER_MILE / normalized / 60.0, 2)
+
+    return {
+        "splits": splits,
+        "hr_zones": [round(s, 1) for s in zone_s],
+        "trimp": round(trimp, 1) if any_hr else None,
+        "normalized_graded_pace_min_per_mile": ngp,
+        "best_efforts": efforts,
+    }
+
+
+def bench_analytics(hours=10, repeat=3):
+    """compute_analytics vs the pure-Python loops on a long recording."""
+    from .analytics import compute_analytics
+    from .fit_utils import parse_fit_samples
+
+    _, columns = parse_fit_samples(build_fit(duration_s=hours * 3600))
+    fast = _time(lambda: compute_analytics(columns), repeat)
+    slow = _time(lambda: analytics_naive(columns), 1)
+    return {
+        "name": f"analytics[{hours}h]",
+        "records": len(columns["timestamp"]),
+        "seconds": fast,
+        "baseline_seconds": slow,
+        "speedup": slow / fast if fast else None,
+    }
+
+
+
+def lttb_naive(x, y, points):
+    """
+    Textbook Largest-Triangle-Three-Buckets with Python loops, the same
+    picks as series.lttb. Benchmark baseline and test cross-check.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return list(range(n))
+    every = (n - 2) / (points - 2)
+    kept, a = [0], 0
+    for i in range(points - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        if i == points - 3:
+            cx, cy = x[n - 1], y[n - 1]
+        else:
+            next_end = int((i + 2) * every) + 1 if i < points - 4 else n - 1
+            cx = sum(x[end:next_end]) / (next_end - end)
+            cy = sum(y[end:next_end]) / (next_end - end)
+        best, pick = -1.0, start
+        for j in range(start, end):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best:
+                best, pick = area, j
+        kept.append(pick)
+        a = pick
+    kept.append(n - 1)
+    return kept
+
+
+def bench_series(hours=10, points=500, repeat=5):
+    """series.lttb vs the pure-Python loops on a long recording's heart rate."""
+    import numpy as np
+    from .fit_utils import parse_fit_samples
+    from .series import lttb
+
+    _, columns = parse_fit_samples(build_fit(duration_s=hours * 3600))
+    timestamps = np.asarray(columns["timestamp"], dtype=np.float64)
+    x, y = timestamps - timestamps[0], np.asarray(columns["heart_rate"], dtype=np.float64)
+    fast = _time(lambda: lttb(x, y, points), repeat)
+    slow = _time(lambda: lttb_naive(x.tolist(), y.tolist(), points), 1)
+    return {
+        "name": f"lttb[{hours}h->{points}]",
+        "records": len(x),
+        "seconds": fast,
+        "baseline_seconds": slow,
+        "speedup": slow / fast if fast else None,
+    }
+
+
+@contextlib.contextmanager
+def _sqlite_profile(tuned):
+    """Switch SQLite tuning (see SQLITE_TUNED in settings) for connections opened inside the block."""
+    from django.conf import settings
+    from django.db import connections
+    from django.test import override_settings
+
+    options = connections.settings["default"].setdefault("OPTIONS", {})
+    saved = dict(options)
+    options.pop("transaction_mode", None)
+    if tuned:
+        options["transaction_mode"] = "IMMEDIATE"
+    try:
+        with override_settings(
+            SQLITE_TUNED=tuned, SQLITE_BUSY_TIMEOUT_MS=getattr(settings, "SQLITE_BUSY_TIMEOUT_MS", 20000),
+        ):
+            yield
+    finally:
+        options.clear()
+        options.update(saved)
+
+
+def _db_workload(threads, ops):
+    """
+    ``threads`` threads, each on its own connection, each ingesting ``ops``
+    workouts (one transaction per workout: duplicate check, insert, rollup
+    and version updates, as an upload job does) and reading the first list page after
+    every insert. Returns (seconds, failed operations).
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, connection, transaction
+
+    from .models import Workout
+
+    users = [get_user_model().objects.create_user(f"bench-db-{i}") for i in range(threads)]
+    start = datetime(2020, 1, 1, 6, 0, tzinfo=dt_timezone.utc)
+    failed = []
+    barrier = threading.Barrier(threads)
+
+    def worker(user):
+        errors = 0
+        try:
+            barrier.wait()
+            for i in range(ops):
+                try:
+                    with transaction.atomic():
+                        content_hash = f"{user.pk:08x}{i:056x}"
+                        if not Workout.objects.filter(user=user, content_hash=content_hash).exists():
+                            Workout.objects.create(
+                                user=user, date=start + timedelta(hours=6 * i), content_hash=content_hash,
+                                distance_miles=5, duration_minutes=45, avg_heart_rate=140,
+                            )
+                    list(Workout.objects.filter(user=user).order_by("-date", "-created_at")[:50])
+                except OperationalError:  # "database is locked"
+                    errors += 1
+        finally:
+            connection.close()
+            failed.append(errors)
+
+    pool = [threading.Thread(target=worker, args=(u,)) for u in users]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, sum(failed)
+
+
+def bench_db_concurrency(threads=8, ops=50):
+    """
+    Parallel Workout inserts and reads (see _db_workload) against stock
+    SQLite, tuned SQLite and, when DB_ENGINE=postgres, PostgreSQL. The
+    SQLite runs use a file database: the in-memory test database can't be
+    shared between connections the way workers share a file. Sets up its
+    own test databases.
+    """
+    import tempfile
+
+    _setup_django()
+    from django.db import connection
+
+    profiles = []
+    if connection.vendor == "sqlite":
+        profiles += [("sqlite default", False), ("sqlite tuned", True)]
+    else:
+        profiles.append((connection.vendor, None))
+
+    results = []
+    for name, tuned in profiles:
+        with contextlib.ExitStack() as stack:
+            if tuned is not None:
+                tmp = stack.enter_context(tempfile.TemporaryDirectory())
+                stack.enter_context(_sqlite_profile(tuned))
+                stack.enter_context(test_database(os.path.join(tmp, "bench.sqlite3")))
+            else:
+                stack.enter_context(test_database())
+            seconds, failed = _db_workload(threads, ops)
+        total = threads * ops * 2
+        results.append({
+            "name": f"db_concurrency[{name}]",
+            "threads": threads,
+            "operations": total,
+            "failed": failed,
+            "seconds": seconds,
+            "ops_per_second": (total - failed) / seconds,
+        })
+    return results
+
+
+def bench_serializer(counts=(200, 1_000, 10_000), repeat=5):
+    """
+    Rows to JSON bytes for the workout list: model instances through
+    WorkoutSerializer and DRF's JSONRenderer, against .values() rows through
+    serialize_workout_rows() and ORJSONRenderer. Query time included. Must
+    run inside test_database().
+    """
+    from django.contrib.auth import get_user_model
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIRequestFactory
+
+    from .models import Workout
+    from .renderers import ORJSONRenderer
+    from .serializers import WORKOUT_VALUES, WorkoutSerializer, serialize_workout_rows
+
+    user, _ = get_user_model().objects.get_or_create(username="bench-serializer")
+    Workout.objects.filter(user=user).delete()
+    _seed_workouts(user, max(counts))
+    Workout.objects.filter(user=user).update(file_path="uploads/fit/ab/abcdef.fit", analytics={"trimp": 61.2})
+    request = APIRequestFactory().get("/api/workouts/")
+    qs = Workout.objects.filter(user=user).order_by("-date", "-created_at", "-id")
+
+    results = []
+    for n in counts:
+        def drf():
+            data = WorkoutSerializer(list(qs[:n]), many=True, context={"request": request}).data
+            return JSONRenderer().render(data)
+
+        def fast():
+            return ORJSONRenderer().render(serialize_workout_rows(qs.values(*WORKOUT_VALUES)[:n], request))
+
+        assert json.loads(drf()) == json.loads(fast())
+        new = _time(fast, repeat)
+        old = _time(drf, repeat)
+        results.append({
+            "name": f"serializer[{n}]",
+            "rows": n,
+            "seconds": new,
+            "baseline_seconds": old,
+            "speedup": old / new if new else None,
+        })
+    return results
+
+
+def similar_brute_force(user_id, workout_id, k=10):
+    """
+    The k workouts nearest to ``workout_id`` the way it was done before
+    training/similarity.py: every Workout row through the ORM, distances in
+    Python. Same metric as SimilarityIndex.neighbors (cross-checked in the
+    tests); kept as the benchmark baseline.
+    """
+    import heapq
+    import math
+    from django.utils import timezone
+    from .models import Workout
+    from .similarity import FEATURE_SCALES, MISSING_PENALTY
+
+    def features(w):
+        local = timezone.localtime(w.started_at or w.date)
+        angle = 2 * math.pi * (local.hour * 3600 + local.minute * 60 + local.second) / 86400
+        raw = [w.distance_miles, w.avg_pace_min_per_mile, w.avg_heart_rate,
+               math.cos(angle), math.sin(angle), (w.analytics or {}).get("trimp")]
+        return [None if value is None else value / scale for value, scale in zip(raw, FEATURE_SCALES)]
+
+    def squared_distance(query, other):
+        total = 0.0
+        for q, x in zip(query, other):
+            if q is not None:
+                total += MISSING_PENALTY if x is None else (x - q) ** 2
+        return total
+
+    workouts = list(Workout.objects.filter(user_id=user_id))
+    query = features(next(w for w in workouts if w.pk == workout_id))
+    scored = ((squared_distance(query, features(w)), w.pk) for w in workouts if w.pk != workout_id)
+    return [(pk, math.sqrt(d2)) for d2, pk in heapq.nsmallest(k, scored)]
+
+
+def bench_similar(counts=(1_000, 100_000), k=10, repeat=5):
+    """
+    Similar-workout search per history size: building the index, a query
+    on it, the whole /similar/ request, and the brute-force ORM scan.
+    """
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from . import similarity, versions
+    from .models import Workout
+
+    User = get_user_model()
+    rows = []
+    for n in counts:
+        user = User.objects.create_user(f"bench-similar-{n}-{User.objects.count()}")
+        _seed_workouts(user, n)
+        versions.bump([user.pk])
+        target = Workout.objects.filter(user=user).order_by("id").values_list("id", flat=True)[n // 2]
+        api = APIClient()
+        api.force_authenticate(user)
+        url = reverse("workout-similar", args=[target])
+
+        def build():
+            similarity.clear()
+            similarity.get_index(user.pk)
+
+        build_seconds = _time(build, min(repeat, 3))
+        index = similarity.get_index(user.pk)
+        query = _time(lambda: index.neighbors(target, k), repeat)
+        endpoint = _time(lambda: api.get(url, {"k": k}), repeat)
+        brute = _time(lambda: similar_brute_force(user.pk, target, k), 1)
+        rows.append({
+            "name": f"similar[{n}]",
+            "workouts": n,
+            "build_seconds": build_seconds,
+            "endpoint_seconds": endpoint,
+            "seconds": query,
+            "baseline_seconds": brute,
+            "speedup": brute / query if query else None,
+        })
+    similarity.clear()
+    return rows
+
+
+# ---------- Regression suite (manage.py benchmark) ----------
+# Absolute numbers for the main request paths, as flat JSON that can be
+# saved as a baseline and compared against on the next run.
+SUITE_WORKOUT_COUNTS = (100, 1_000, 10_000, 100_000)
+SUITE_SYNC_COUNTS = (100, 1_000, 10_000)
+QUICK_WORKOUT_COUNTS = (100, 1_000)
+QUICK_SYNC_COUNTS = (100,)
+SUITE_FIT_SIZES = {"30min": 30 * 60, "2h": 2 * 3600, "10h": 10 * 3600}
+QUICK_FIT_SIZES = {"30min": 30 * 60}
+SUITE_PAGE_SIZE = 50
+
+# Ratios current / baseline past which a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def _metric(results, name, value, unit="s", better="lower"):
+    results.append({"name": name, "value": value, "unit": unit, "better": better})
+
+
+def suite_parse_fit(sizes, repeat):
+    results = []
+    for name, seconds in sizes.items():
+        data = build_fit(duration_s=seconds)
+        elapsed = _time(lambda: parse_fit(io.BytesIO(data)), repeat)
+        _metric(results, f"parse_fit[{name}].seconds", elapsed)
+        _metric(results, f"parse_fit[{name}].records_per_second", (seconds + 1) / elapsed, "records/s", "higher")
+        _metric(results, f"probe_fit[{name}].seconds", _time_per_call(lambda: probe_fit(data, len(data)), 200, repeat))
+    return results
+
+
+def suite_upload(sizes, repeat):
+    """POST upload/fit/ through to the worker having created the Workout."""
+    import tempfile
+    from django.contrib.auth import get_user_model
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from . import jobs
+    from .models import UploadJob, Workout
+
+    user, _ = get_user_model().objects.get_or_create(username="bench-upload")
+    client = APIClient()
+    client.force_authenticate(user)
+    results = []
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        for name, seconds in sizes.items():
+            data = build_fit(duration_s=seconds)
+
+            def upload():
+                # Same bytes every run: forget the last one so it isn't a duplicate
+                Workout.objects.filter(user=user).delete()
+                UploadJob.objects.filter(user=user).delete()
+                res = client.post(reverse("upload-fit"), {"file": SimpleUploadedFile(f"{name}.fit", data)})
+                assert res.status_code == 202, res.status_code
+                assert jobs.run_pending() == 1
+
+            _metric(results, f"upload[{name}].seconds", _time(upload, repeat))
+    return results
+
+
+def suite_views(counts, repeat):
+    """WorkoutListView, DashboardView (cold, cached, 304) and WorkoutSerializer per history size."""
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient, APIRequestFactory
+
+    from . import versions
+    from .models import Workout
+    from .serializers import WORKOUT_VALUES, WorkoutSerializer, serialize_workout_rows
+
+    User = get_user_model()
+    request = APIRequestFactory().get("/api/workouts/")
+    results = []
+    with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+        for n in counts:
+            # A fresh user per size; deleting rows one by one (signals) would take longer than the run
+            user = User.objects.create_user(f"bench-{n}-{User.objects.count()}")
+            _seed_workouts(user, n)
+            versions.bump([user.pk])
+            api = APIClient()
+            api.force_authenticate(user)
+            web = Client()
+            web.force_login(user)
+            url = reverse("web-dashboard")
+
+            def list_page():
+                assert api.get(reverse("workout-list"), {"page_size": SUITE_PAGE_SIZE}).status_code == 200
+
+            def dashboard_cold():
+                cache.clear()
+                assert web.get(url).status_code == 200
+
+            etag = web.get(url)["ETag"]  # also sets the CSRF cookie
+            etag = web.get(url)["ETag"]
+            page = list(Workout.objects.filter(user=user).order_by("-date")[:SUITE_PAGE_SIZE])
+            rows = list(Workout.objects.filter(user=user).order_by("-date")[:1_000])
+
+            _metric(results, f"workout_list[{n}].seconds", _time(list_page, repeat))
+            _metric(results, f"dashboard[{n}].cold_seconds", _time(dashboard_cold, repeat))
+            _metric(results, f"dashboard[{n}].cached_seconds", _time(lambda: web.get(url), repeat))
+            _metric(results, f"dashboard[{n}].not_modified_seconds",
+                    _time(lambda: web.get(url, HTTP_IF_NONE_MATCH=etag), repeat))
+            if n == counts[-1]:
+                _metric(results, f"serializer[{len(page)}].seconds", _time(
+                    lambda: WorkoutSerializer(page, many=True, context={"request": request}).data, repeat,
+                ))
+                _metric(results, f"serializer[{len(rows)}].seconds", _time(
+                    lambda: WorkoutSerializer(rows, many=True, context={"request": request}).data, repeat,
+                ))
+                values = list(Workout.objects.filter(user=user).order_by("-date").values(*WORKOUT_VALUES)[:1_000])
+                _metric(results, f"row_serializer[{len(values)}].seconds", _time(
+                    lambda: serialize_workout_rows(values, request), repeat,
+                ))
+    return results
+
+
+def suite_strava_sync(counts, repeat):
+    """A full sync of ``count`` activities from the local fake Strava."""
+    from django.contrib.auth import get_user_model
+    from django.test import override_settings
+
+    from . import strava
+    from .fake_strava import FakeStrava, make_activities
+
+    User = get_user_model()
+    results = []
+    for n in counts:
+        with FakeStrava(activities=make_activities(n)) as fake, override_settings(
+            STRAVA_API_BASE=fake.url, STRAVA_USER_RATE_LIMIT_15MIN=10**6, STRAVA_USER_RATE_LIMIT_DAILY=10**6,
+            STRAVA_RATE_LIMIT_15MIN=10**6, STRAVA_RATE_LIMIT_DAILY=10**6,
+        ):
+            def sync():
+                user = User.objects.create_user(f"bench-strava-{User.objects.count()}")
+                assert strava.sync_strava_activities(user, access_token=fake.access_token) == n
+
+            _metric(results, f"strava_sync[{n}].seconds", _time(sync, repeat))
+    return results
+
+
+def suite_similar(counts, repeat):
+    """Similar-workout index build, query and endpoint, plus the brute-force scan, per history size."""
+    results = []
+    for row in bench_similar(counts, repeat=repeat):
+        name = row["name"]
+        _metric(results, f"{name}.query_seconds", row["seconds"])
+        _metric(results, f"{name}.endpoint_seconds", row["endpoint_seconds"])
+        _metric(results, f"{name}.build_seconds", row["build_seconds"])
+        _metric(results, f"{name}.brute_force_seconds", row["baseline_seconds"])
+    return results
+
+
+SUITE = {
+    "parse_fit": lambda quick, repeat: suite_parse_fit(QUICK_FIT_SIZES if quick else SUITE_FIT_SIZES, repeat),
+    "upload": lambda quick, repeat: suite_upload(QUICK_FIT_SIZES if quick else SUITE_FIT_SIZES, repeat),
+    "views": lambda quick, repeat: suite_views(QUICK_WORKOUT_COUNTS if quick else SUITE_WORKOUT_COUNTS, repeat),
+    "strava_sync": lambda quick, repeat: suite_strava_sync(QUICK_SYNC_COUNTS if quick else SUITE_SYNC_COUNTS,
+                                                           min(repeat, 3)),
+    "similar": lambda quick, repeat: suite_similar(QUICK_WORKOUT_COUNTS if quick else (1_000, 100_000), repeat),
+}
+
+
+def run_suite(only=None, quick=False, repeat=5):
+    """
+    Run the regression suite (or the ``only`` groups of it) against a
+    throwaway test database. Returns a JSON-serializable report.
+    """
+    import platform
+
+    groups = only or list(SUITE)
+    unknown = set(groups) - set(SUITE)
+    if unknown:
+        raise ValueError(f"Unknown benchmark group(s): {', '.join(sorted(unknown))}")
+    results = []
+    with test_database():
+        for group in groups:
+            results += SUITE[group](quick, repeat)
+    return {
+        "meta": {
+            "created_at": datetime.now(dt_timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "quick": quick,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Metrics in both reports, each with its change vs the baseline. A metric
+    has regressed when it moved the wrong way by more than ``tolerance``
+    (relative).
+    """
+    previous = {r["name"]: r["value"] for r in baseline["results"]}
+    rows = []
+    for r in report["results"]:
+        old = previous.get(r["name"])
+        if not old:
+            continue
+        ratio = r["value"] / old
+        worse = ratio - 1 if r["better"] == "lower" else 1 / ratio - 1 if ratio else float("inf")
+        rows.append({**r, "baseline": old, "ratio": ratio, "regressed": worse > tolerance})
+    return rows
+
+
+def main():
+    for row in bench_parse_fit():
+        print(
+            f"{row['name']:<20} {row['bytes'] / 1024:>8.0f} KiB  "
+            f"two-pass {row['baseline_seconds'] * 1000:>9.1f} ms  "
+            f"single-pass {row['seconds'] * 1000:>9.1f} ms  "
+            f"x{row['speedup']:.2f}"
+        )
+
+    for row in bench_probe():
+        print(
+            f"{row['name']:<20} {row['bytes'] / 1024:>8.0f} KiB  "
+            f"parse_fit {row['baseline_seconds'] * 1000:>8.1f} ms  "
+            f"probe {row['seconds'] * 1e6:>6.1f} us  reject truncated {row['reject_seconds'] * 1e6:>6.1f} us"
+        )
+
+    row = bench_samples()
+    print(
+        f"{row['name']:<20} {row['records']:>8} recs  "
+        f"FIT decode {row['baseline_seconds'] * 1000:>7.1f} ms  "
+        f"mmap load {row['seconds'] * 1000:>7.2f} ms  "
+        f"x{row['speedup']:.0f}"
+    )
+
+    for row in bench_upload():
+        print(
+            f"{row['name']:<20} {row['bytes'] / 1024:>8.0f} KiB  "
+            f"default {row['baseline_bytes_copied'] / 1024:>7.0f} KiB copied {row['baseline_seconds'] * 1000:>7.1f} ms  "
+            f"streamed {row['bytes_copied'] / 1024:>7.0f} KiB copied {row['seconds'] * 1000:>7.1f} ms"
+        )
+
+    row = bench_analytics()
+    print(
+        f"{row['name']:<20} {row['records']:>8} recs  "
+        f"python {row['baseline_seconds'] * 1000:>9.1f} ms  "
+        f"numpy {row['seconds'] * 1000:>7.1f} ms  "
+        f"x{row['speedup']:.0f}"
+    )
+
+    row = bench_series()
+    print(
+        f"{row['name']:<20} {row['records']:>8} recs  "
+        f"python {row['baseline_seconds'] * 1000:>9.1f} ms  "
+        f"numpy {row['seconds'] * 1000:>7.1f} ms  "
+        f"x{row['speedup']:.0f}"
+    )
+
+    for row in bench_db_concurrency():
+        print(
+            f"{row['name']:<28} {row['threads']} threads  {row['operations']} ops  "
+            f"{row['seconds']:.2f} s  {row['ops_per_second']:>7.0f} ops/s  {row['failed']} failed"
+        )
+
+    with test_database():
+        row = bench_async_views()
+        print(
+            f"async_views[{row['concurrency']} concurrent, {row['latency'] * 1000:.0f} ms upstream]  "
+            f"callbacks: sync x{row['sync_threads']} threads {row['callbacks_sync']:.2f} s, "
+            f"async {row['callbacks_async']:.2f} s  "
+            f"insights: 2 threads {row['insights_sync']:.2f} s, async {row['insights_async']:.2f} s"
+        )
+
+    with test_database():
+        for row in bench_serializer():
+            print(
+                f"{row['name']:<20} {row['rows']:>8} rows  "
+                f"DRF {row['baseline_seconds'] * 1000:>8.1f} ms  "
+                f"rows+orjson {row['seconds'] * 1000:>7.1f} ms  "
+                f"x{row['speedup']:.1f}"
+            )
+
+    with test_database():
+        for row in bench_similar():
+            print(
+                f"{row['name']:<20} build {row['build_seconds'] * 1000:>7.1f} ms  "
+                f"ORM scan {row['baseline_seconds'] * 1000:>8.1f} ms  "
+                f"index {row['seconds'] * 1000:>6.2f} ms  endpoint {row['endpoint_seconds'] * 1000:>6.1f} ms  "
+                f"x{row['speedup']:.0f}"
+            )
+
+    with test_database():
+        for row in bench_workout_list():
+            print(
+                f"workout_list[{row['workouts']:>6}]  "
+                f"first {row['first_page'] * 1000:>6.1f} ms  "
+                f"middle {row['middle_page'] * 1000:>6.1f} ms  "
+                f"filtered {row['filtered_page'] * 1000:>6.1f} ms  "
+                f"(unpaginated query alone {row['full_list_baseline'] * 1000:>7.1f} ms)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# training/dedup.py
+"""
+Keeping one Workout per real-world run.
+
+Uploads are content-addressed: jobs.save_fit_upload() hashes the file while
+it streams to disk, and a file whose hash the user already has maps back to
+the existing workout without being parsed again. So does a file whose
+file_id (recording device and creation time, read by fit_utils.probe_fit)
+matches one already uploaded, even if its bytes differ. Separately, a FIT upload
+and a Strava import of the same run are paired up by start time and
+distance, so watch sync plus Strava doesn't show every run twice.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from . import versions
+from .models import Workout, normalize_media_path
+
+# How far apart the two sources' start times and distances may be
+MATCH_WINDOW = timedelta(minutes=2)
+DISTANCE_TOLERANCE = 0.03  # relative
+
+
+def find_duplicate(user, content_hash):
+    """The user's workout created from identical file content, if any."""
+    if not content_hash:
+        return None
+    return Workout.objects.filter(user=user, content_hash=content_hash).first()
+
+
+def find_same_recording(user, fit_file_id):
+    """
+    The user's workout from the same device recording (FIT file_id), e.g. a
+    re-export whose bytes differ from the file uploaded before.
+    """
+    if not fit_file_id:
+        return None
+    return Workout.objects.filter(user=user, fit_file_id=fit_file_id).first()
+
+
+def started_at_from_samples(columns):
+    """Aware UTC start time from sample columns (first record timestamp)."""
+    timestamps = columns["timestamp"]
+    if not len(timestamps):
+        return None
+    return datetime.fromtimestamp(int(timestamps[0]), tz=dt_timezone.utc)
+
+
+def same_distance(a, b):
+    a, b = a or 0.0, b or 0.0
+    return abs(a - b) <= DISTANCE_TOLERANCE * max(a, b, 0.1)
+
+
+def _best_match(started_at, distance_miles, candidates):
+    matches = [
+        w for w in candidates
+        if abs(w.started_at - started_at) <= MATCH_WINDOW and same_distance(w.distance_miles, distance_miles)
+    ]
+    return min(matches, key=lambda w: abs(w.started_at - started_at), default=None)
+
+
+def find_strava_match(user, started_at, distance_miles):
+    """A Strava-imported workout for the same run that has no uploaded file yet."""
+    if started_at is None:
+        return None
+    candidates = Workout.objects.filter(
+        user=user, strava_id__isnull=False, content_hash__isnull=True,
+        started_at__range=(started_at - MATCH_WINDOW, started_at + MATCH_WINDOW),
+    )
+    return _best_match(started_at, distance_miles, candidates)
+
+
+def attach_upload(workout, **fields):
+    """
+    Add an uploaded file's data (file_path, samples_path, analytics,
+    content_hash, fit_file_id) to a matching Strava workout instead of creating a
+    second row. The Strava-owned columns are left alone.
+    """
+    if "file_path" in fields:
+        fields["file_path"] = normalize_media_path(fields["file_path"])
+    for name, value in fields.items():
+        setattr(workout, name, value)
+    Workout.objects.filter(pk=workout.pk).update(updated_at=timezone.now(), **fields)
+    versions.bump([workout.user_id])
+    return workout
+
+
+def match_uploads_to_activities(user, workouts):
+    """
+    {strava_id: uploaded workout} pairing unsaved Strava workouts (from
+    strava.workout_from_activity) with uploaded, not yet linked workouts of
+    the same run. One query for the whole page of activities.
+    """
+    workouts = [w for w in workouts if w.started_at is not None]
+    if not workouts:
+        return {}
+    earliest = min(w.started_at for w in workouts) - MATCH_WINDOW
+    latest = max(w.started_at for w in workouts) + MATCH_WINDOW
+    candidates = list(Workout.objects.filter(
+        user=user, strava_id__isnull=True, started_at__range=(earliest, latest),
+    ))
+    matched = {}
+    for w in workouts:
+        upload = _best_match(w.started_at, w.distance_miles, candidates)
+        if upload is not None:
+            matched[w.strava_id] = upload
+            candidates.remove(upload)
+    return matched
@@ -0,0 +1,93 @@
+# training/fake_openai.py
+"""
+A local stand-in for OpenAI's chat completions endpoint, used by the tests
+and benchmarks.
+
+    with FakeOpenAI(reply="Run easy tomorrow.") as fake:
+        with override_settings(OPENAI_BASE_URL=fake.url):
+            ...
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAI:
+    def __init__(self, reply="Run easy tomorrow.", status=200):
+        self.reply = reply  # str, or callable(prompt) -> str
+        self.status = status
+        self.latency = 0.0  # seconds added to every response
+        self.prompts = []
+        self.lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            server_state = fake
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def completion(self, body):
+        prompt = body["messages"][-1]["content"]
+        with self.lock:
+            self.prompts.append(prompt)
+        if self.status != 200:
+            return self.status, {"error": {"message": "Rate limit reached", "type": "requests"}}
+        reply = self.reply(prompt) if callable(self.reply) else self.reply
+        return 200, {
+            "id": f"chatcmpl-{len(self.prompts)}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # load tests open many connections at once
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server_state
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if fake.latency:
+            time.sleep(fake.latency)
+        if self.path == "/v1/chat/completions":
+            status, payload = fake.completion(body)
+        else:
+            status, payload = 404, {"error": {"message": "Not found"}}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
@@ -0,0 +1,231 @@
+# training/fake_strava.py
+"""
+A local stand-in for the Strava API, used by the tests and benchmarks.
+
+Serves the handful of endpoints the app calls from an in-memory activity
+list on a real HTTP port, so the sync code runs against an actual socket.
+
+    with FakeStrava(activities=make_activities(500)) as fake:
+        with override_settings(STRAVA_API_BASE=fake.url):
+            ...
+"""
+import json
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_activities(count, start=None, start_id=1000):
+    """``count`` daily runs ending at ``start`` + count days."""
+    start = start or datetime(2024, 1, 1, 7, 0, tzinfo=timezone.utc)
+    activities = []
+    for i in range(count):
+        started = start + timedelta(days=i)
+        distance = 5000.0 + 37.0 * (i % 50)
+        moving_time = int(distance / 2.9)
+        activities.append({
+            "id": start_id + i,
+            "name": f"Run {i}",
+            "type": "Run",
+            "start_date": started.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_date_local": started.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "distance": distance,
+            "moving_time": moving_time,
+            "elapsed_time": moving_time + 60,
+            "average_heartrate": 140.0 + (i % 20),
+        })
+    return activities
+
+
+def make_streams(activity):
+    """
+    Per-second streams (key -> data) for a make_activities() run: steady
+    pace, gently rolling hills. Manual entries (``"manual": True``) have none.
+    """
+    moving_time = activity.get("moving_time") or 0
+    if activity.get("manual") or not moving_time:
+        return {}
+    speed = activity["distance"] / moving_time
+    elapsed = list(range(moving_time + 1))
+    distance = [round(t * speed, 1) for t in elapsed]
+    hr = int(activity.get("average_heartrate") or 140)
+    return {
+        "time": elapsed,
+        "distance": distance,
+        "velocity_smooth": [round(speed, 3)] * len(elapsed),
+        "heartrate": [hr + t % 7 - 3 for t in elapsed],
+        "cadence": [86] * len(elapsed),
+        "altitude": [round(180 + 8 * math.sin(t / 300), 1) for t in elapsed],
+        "latlng": [[round(41.88 + d / 111000, 6), -87.63] for d in distance],
+    }
+
+
+class FakeStrava:
+    def __init__(self, activities=(), access_token="fake-access", refresh_token="fake-refresh"):
+        self.activities = list(activities)
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_in = 6 * 3600
+        self.latency = 0.0  # seconds added to every response
+        self.rate_limit_usage = None  # (15min, daily) reported in X-RateLimit-Usage
+        self.streams = {}  # activity id -> streams, instead of make_streams()
+        self.requests = []  # (method, path, query dict)
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # ----- lifecycle -----
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            server_state = fake
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def revoke(self):
+        """The athlete deauthorizes the app: every token stops working."""
+        with self.lock:
+            self.access_token = self.refresh_token = None
+
+    def count(self, path_prefix):
+        with self.lock:
+            return sum(1 for _, path, _ in self.requests if path.startswith(path_prefix))
+
+    # ----- endpoint logic -----
+    def token(self, form):
+        grant = form.get("grant_type")
+        valid = (
+            (grant == "authorization_code" and form.get("code"))
+            or (grant == "refresh_token" and form.get("refresh_token") == self.refresh_token)
+        )
+        if not valid:
+            return 400, {"message": "Bad Request", "errors": [{"field": "grant_type"}]}
+        with self.lock:
+            self.access_token = f"access-{len(self.requests)}"
+            self.refresh_token = f"refresh-{len(self.requests)}"
+        return 200, {
+            "token_type": "Bearer",
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": int(time.time()) + self.expires_in,
+            "expires_in": self.expires_in,
+            "athlete": {"id": 4242},
+        }
+
+    def athlete_activities(self, query):
+        page = int(query.get("page", 1))
+        per_page = int(query.get("per_page", 30))
+        after = query.get("after")
+        acts = self.activities
+        if after is not None:
+            cutoff = datetime.fromtimestamp(int(after), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            acts = sorted((a for a in acts if a["start_date"] > cutoff), key=lambda a: a["start_date"])
+        else:
+            acts = sorted(acts, key=lambda a: a["start_date"], reverse=True)
+        start = (page - 1) * per_page
+        return 200, acts[start:start + per_page]
+
+    def activity(self, activity_id):
+        for act in self.activities:
+            if act["id"] == activity_id:
+                return 200, act
+        return 404, {"message": "Record Not Found", "errors": [{"resource": "Activity", "code": "not found"}]}
+
+    def activity_streams(self, activity_id, query):
+        act = next((a for a in self.activities if a["id"] == activity_id), None)
+        if act is None:
+            return self.activity(activity_id)
+        streams = self.streams[activity_id] if activity_id in self.streams else make_streams(act)
+        # Like Strava: distance and time always come back, whatever was asked for
+        keys = {"time", "distance", *query.get("keys", "").split(",")}
+        streams = {key: data for key, data in streams.items() if key in keys}
+        if query.get("key_by_type") == "true":
+            return 200, {
+                key: {"data": data, "series_type": "distance", "original_size": len(data), "resolution": "high"}
+                for key, data in streams.items()
+            }
+        return 200, [{"type": key, "data": data} for key, data in streams.items()]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # load tests open many connections at once
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        usage = self.server_state.rate_limit_usage
+        if usage:
+            self.send_header("X-RateLimit-Usage", f"{usage[0]},{usage[1]}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, query):
+        fake = self.server_state
+        path = urlparse(self.path).path
+        with fake.lock:
+            fake.requests.append((self.command, path, query))
+        if fake.latency:
+            time.sleep(fake.latency)
+        return fake, path
+
+    def _authorized(self, fake):
+        return self.headers.get("Authorization") == f"Bearer {fake.access_token}"
+
+    def do_GET(self):
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        fake, path = self._record(query)
+        if not self._authorized(fake):
+            return self._send(401, {"message": "Authorization Error"})
+        if path == "/api/v3/athlete":
+            return self._send(200, {"id": 4242, "resource_state": 2})
+        if path == "/api/v3/athlete/activities":
+            return self._send(*fake.athlete_activities(query))
+        parts = path.split("/")
+        if path.startswith("/api/v3/activities/") and path.endswith("/streams") and parts[-2].isdigit():
+            return self._send(*fake.activity_streams(int(parts[-2]), query))
+        if path.startswith("/api/v3/activities/") and path.rsplit("/", 1)[1].isdigit():
+            return self._send(*fake.activity(int(path.rsplit("/", 1)[1])))
+        return self._send(404, {"message": "Record Not Found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode()
+        form = {k: v[-1] for k, v in parse_qs(raw).items()}
+        fake, path = self._record(form)
+        if path == "/oauth/token":
+            return self._send(*fake.token(form))
+        return self._send(404, {"message": "Record Not Found"})
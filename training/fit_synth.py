@@ -0,0 +1,184 @@
+# training/fit_synth.py
+"""
+Tiny FIT *writer* used by the tests and benchmarks.
+
+fitparse can only read, so this builds just enough of the FIT protocol
+(header, definition + data messages, CRC) to produce realistic activity
+files of any length without shipping binary fixtures in the repo.
+"""
+import math
+import struct
+from datetime import datetime, timezone
+
+from .fit_utils import fit_crc
+
+# Seconds between the Unix epoch and the FIT epoch (1989-12-31 00:00 UTC)
+FIT_EPOCH_OFFSET = 631065600
+
+# FIT base type ids
+ENUM, UINT8, UINT16, SINT32, UINT32, UINT32Z = 0x00, 0x02, 0x84, 0x85, 0x86, 0x8C
+
+_STRUCT_FMT = {ENUM: "B", UINT8: "B", UINT16: "H", SINT32: "i", UINT32: "I", UINT32Z: "I"}
+
+# (field_def_num, base_type) per global message, in write order
+FILE_ID_FIELDS = [(0, ENUM), (1, UINT16), (2, UINT16), (3, UINT32Z), (4, UINT32)]
+RECORD_FIELDS = [
+    (253, UINT32),  # timestamp
+    (0, SINT32),    # position_lat (semicircles)
+    (1, SINT32),    # position_long (semicircles)
+    (2, UINT16),    # altitude (scale 5, offset 500)
+    (3, UINT8),     # heart_rate
+    (4, UINT8),     # cadence
+    (5, UINT32),    # distance (scale 100)
+    (6, UINT16),    # speed (scale 1000)
+]
+SESSION_FIELDS = [
+    (253, UINT32),  # timestamp
+    (2, UINT32),    # start_time
+    (5, ENUM),      # sport
+    (7, UINT32),    # total_elapsed_time (scale 1000)
+    (8, UINT32),    # total_timer_time (scale 1000)
+    (9, UINT32),    # total_distance (scale 100)
+    (16, UINT8),    # avg_heart_rate
+]
+SESSION_FIELDS_NO_HR = SESSION_FIELDS[:-1]
+
+# Declaring a developer field: developer_data_id, then a field_description
+DEVELOPER_DATA_ID_FIELDS = [(3, UINT8)]  # developer_data_index
+FIELD_DESCRIPTION_FIELDS = [
+    (0, UINT8),  # developer_data_index
+    (1, UINT8),  # field_definition_number
+    (2, UINT8),  # fit_base_type_id
+]
+# (field number, base type) of the developer field appended to each record
+RECORD_DEV_FIELD = (0, UINT16)
+
+# Compressed-timestamp records carry a full timestamp this often
+FULL_TIMESTAMP_EVERY = 60
+
+
+def _definition(local_num, global_num, fields, dev_fields=()):
+    header = 0x40 | local_num | (0x20 if dev_fields else 0)
+    out = struct.pack("<BBBHB", header, 0, 0, global_num, len(fields))
+    for num, base in fields:
+        out += struct.pack("<BBB", num, struct.calcsize(_STRUCT_FMT[base]), base)
+    if dev_fields:
+        out += struct.pack("<B", len(dev_fields))
+        for num, base in dev_fields:
+            out += struct.pack("<BBB", num, struct.calcsize(_STRUCT_FMT[base]), 0)
+    return out
+
+
+def _data_struct(fields, dev_fields=()):
+    return struct.Struct("<B" + "".join(_STRUCT_FMT[base] for _, base in list(fields) + list(dev_fields)))
+
+
+def to_fit_timestamp(dt):
+    return int(dt.timestamp()) - FIT_EPOCH_OFFSET
+
+
+def build_fit(
+    duration_s=1800,
+    interval_s=1,
+    start=None,
+    pace_min_per_mile=9.0,
+    with_session=True,
+    session_hr=True,
+    with_hr=True,
+    manufacturer=1,
+    product=3415,
+    serial_number=123456789,
+    time_created=None,
+    compressed_timestamps=False,
+    developer_fields=False,
+    timestamps=True,
+):
+    """
+    Build an activity FIT file and return its bytes.
+
+    A steady run (with a little HR/pace wobble) of ``duration_s`` seconds,
+    one ``record`` every ``interval_s`` seconds, optionally followed by a
+    ``session`` summary. file_id.time_created defaults to the end of the
+    run, when a watch would save the file.
+
+    ``compressed_timestamps`` writes most records with a compressed
+    timestamp header instead of a timestamp field (``interval_s`` must stay
+    under 32); ``developer_fields`` declares a developer field and appends
+    it to every record, as Connect IQ apps do. Without ``timestamps`` the
+    records have no time at all (pass with_session=False too for a file
+    that never says when it was recorded).
+    """
+    start = start or datetime(2025, 8, 1, 12, 0, tzinfo=timezone.utc)
+    start_ts = to_fit_timestamp(start)
+    base_speed = 1609.344 / (pace_min_per_mile * 60.0)  # m/s
+
+    body = bytearray()
+    body += _definition(0, 0, FILE_ID_FIELDS)
+    if time_created is None:
+        time_created = to_fit_timestamp(start) + duration_s
+    elif isinstance(time_created, datetime):
+        time_created = to_fit_timestamp(time_created)
+    body += _data_struct(FILE_ID_FIELDS).pack(0, 4, manufacturer, product, serial_number, time_created)
+
+    dev_fields = [RECORD_DEV_FIELD] if developer_fields else []
+    if developer_fields:
+        body += _definition(4, 207, DEVELOPER_DATA_ID_FIELDS)
+        body += _data_struct(DEVELOPER_DATA_ID_FIELDS).pack(4, 0)
+        body += _definition(5, 206, FIELD_DESCRIPTION_FIELDS)
+        body += _data_struct(FIELD_DESCRIPTION_FIELDS).pack(5, 0, RECORD_DEV_FIELD[0], RECORD_DEV_FIELD[1])
+
+    body += _definition(1, 20, RECORD_FIELDS, dev_fields)
+    rec = _data_struct(RECORD_FIELDS, dev_fields)
+    if compressed_timestamps or not timestamps:
+        # Local 3: the same record without its timestamp field
+        body += _definition(3, 20, RECORD_FIELDS[1:], dev_fields)
+        compressed = _data_struct(RECORD_FIELDS[1:], dev_fields)
+    lat0, lon0 = int(42.05 * 2**31 / 180), int(-87.68 * 2**31 / 180)
+    distance_m = 0.0
+    hr_sum = hr_n = 0
+    for t in range(0, duration_s + 1, interval_s):
+        speed = base_speed * (1.0 + 0.05 * math.sin(t / 97.0))
+        if t:
+            distance_m += speed * interval_s
+        hr = 140 + int(15 * math.sin(t / 300.0)) if with_hr else 0xFF
+        if with_hr:
+            hr_sum += hr
+            hr_n += 1
+        altitude = 180.0 + 20.0 * math.sin(t / 600.0)
+        values = [
+            lat0 + t * 40,
+            lon0 + t * 25,
+            int((altitude + 500) * 5),
+            hr,
+            85,
+            int(distance_m * 100),
+            int(speed * 1000),
+        ]
+        if developer_fields:
+            values.append(200 + t % 50)
+        if not timestamps:
+            body += compressed.pack(3, *values)
+        elif compressed_timestamps and (t // interval_s) % FULL_TIMESTAMP_EVERY:
+            body += compressed.pack(0x80 | (3 << 5) | ((start_ts + t) & 0x1F), *values)
+        else:
+            body += rec.pack(1, start_ts + t, *values)
+
+    if with_session:
+        fields = SESSION_FIELDS if session_hr else SESSION_FIELDS_NO_HR
+        values = [
+            start_ts + duration_s,
+            start_ts,
+            1,  # running
+            duration_s * 1000,
+            duration_s * 1000,
+            int(distance_m * 100),
+        ]
+        if session_hr:
+            values.append(int(round(hr_sum / hr_n)) if hr_n else 0xFF)
+        body += _definition(2, 18, fields)
+        body += _data_struct(fields).pack(2, *values)
+
+    header = struct.pack("<BBHI4s", 14, 0x20, 2132, len(body), b".FIT")
+    header += struct.pack("<H", fit_crc(header))
+    data = header + bytes(body)
+    return data + struct.pack("<H", fit_crc(data))
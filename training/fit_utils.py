@@ -1,52 +1,476 @@
 # training/fit_utils.py
-from fitparse import FitFile
+import math
+import struct
+from array import array
 from datetime import datetime, timezone
 
+import numpy as np
+from fitparse.utils import FitCRCError, FitEOFError, FitHeaderError, FitParseError
+
+from .metrics import timed
+
 KM_PER_MILE = 1.609344
 M_PER_MILE = 1609.344
 
-def parse_fit(file_obj):
+# FIT timestamps are seconds since 1989-12-31 00:00 UTC
+FIT_EPOCH_OFFSET = 631065600
+
+# The subset of the FIT profile we decode: message name -> (global message
+# number, {field name: (field def number, scale, offset)}).  Fields we don't
+# list here are skipped over as padding and never unpacked.
+FIT_PROFILE = {
+    "file_id": (0, {
+        "type": (0, None, None),
+        "manufacturer": (1, None, None),
+        "product": (2, None, None),
+        "serial_number": (3, None, None),
+        "time_created": (4, None, None),
+    }),
+    "session": (18, {
+        "timestamp": (253, None, None),
+        "start_time": (2, None, None),
+        "sport": (5, None, None),
+        "total_elapsed_time": (7, 1000, None),
+        "total_timer_time": (8, 1000, None),
+        "total_distance": (9, 100, None),
+        "avg_heart_rate": (16, None, None),
+    }),
+    "record": (20, {
+        "timestamp": (253, None, None),
+        "position_lat": (0, None, None),
+        "position_long": (1, None, None),
+        "altitude": (2, 5, 500),
+        "heart_rate": (3, None, None),
+        "cadence": (4, None, None),
+        "distance": (5, 100, None),
+        "speed": (6, 1000, None),
+        "enhanced_speed": (73, 1000, None),
+        "enhanced_altitude": (78, 5, 500),
+    }),
+}
+TIMESTAMP_FIELD = 253
+
+# base type id -> (struct format, invalid value)
+BASE_TYPES = {
+    0x00: ("B", 0xFF),                 # enum
+    0x01: ("b", 0x7F),                 # sint8
+    0x02: ("B", 0xFF),                 # uint8
+    0x83: ("h", 0x7FFF),               # sint16
+    0x84: ("H", 0xFFFF),               # uint16
+    0x85: ("i", 0x7FFFFFFF),           # sint32
+    0x86: ("I", 0xFFFFFFFF),           # uint32
+    0x0A: ("B", 0x00),                 # uint8z
+    0x8B: ("H", 0x0000),               # uint16z
+    0x8C: ("I", 0x00000000),           # uint32z
+    0x8E: ("q", 0x7FFFFFFFFFFFFFFF),   # sint64
+    0x8F: ("Q", 0xFFFFFFFFFFFFFFFF),   # uint64
+    0x90: ("Q", 0x0000000000000000),   # uint64z
+}
+
+# What parse_fit needs; nothing else is unpacked
+PARSE_FIELDS = {
+    "session": ("start_time", "total_distance", "total_elapsed_time", "avg_heart_rate"),
+    "record": ("timestamp", "heart_rate", "distance"),
+}
+
+# Per-record columns kept by parse_fit_samples(), in storage order
+SAMPLE_COLUMNS = (
+    "timestamp", "distance", "speed", "heart_rate", "cadence", "altitude", "position_lat", "position_long",
+)
+SAMPLE_FIELDS = {
+    "session": PARSE_FIELDS["session"],
+    "record": (
+        "timestamp", "distance", "speed", "enhanced_speed", "heart_rate", "cadence",
+        "altitude", "enhanced_altitude", "position_lat", "position_long",
+    ),
+}
+SEMICIRCLES_TO_DEGREES = 180 / 2 ** 31
+
+# What probe_fit() reads: the header plus the file_id message, which the
+# FIT protocol puts first in every file. No real file_id needs this much.
+PROBE_BYTES = 2048
+PROBE_FIELDS = {"file_id": ("type", "manufacturer", "product", "serial_number", "time_created")}
+FIT_FILE_ACTIVITY = 4  # file_id.type
+
+_CRC_TABLE = (
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+)
+
+
+def _crc_nibbles(crc, byte):
+    # One byte of the CRC as the FIT SDK computes it, four bits at a time
+    tmp = _CRC_TABLE[crc & 0xF]
+    crc = (crc >> 4) & 0x0FFF
+    crc = crc ^ tmp ^ _CRC_TABLE[byte & 0xF]
+    tmp = _CRC_TABLE[crc & 0xF]
+    crc = (crc >> 4) & 0x0FFF
+    return crc ^ tmp ^ _CRC_TABLE[(byte >> 4) & 0xF]
+
+
+_CRC_BYTE_TABLE = tuple(_crc_nibbles(0, byte) for byte in range(256))
+
+# Below this size fit_crc's byte loop beats setting up file_crc's lanes
+CRC_LANES_MIN_BYTES = 64 * 1024
+
+
+def fit_crc(data, crc=0):
+    """The FIT protocol's CRC-16 of ``data``, continuing from ``crc``."""
+    table = _CRC_BYTE_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def file_crc(data):
     """
-    Returns: date, distance_miles, duration_minutes, avg_heart_rate, avg_pace_min_per_mile
+    fit_crc(data), fast enough to check every upload: a byte loop in
+    Python costs more than decoding the file.
+
+    The CRC starts at 0 and has no final XOR, so it is linear: the CRC of
+    A + B is the CRC of A advanced over len(B) zero bytes, XOR the CRC of
+    B, and leading zero bytes change nothing. The data is zero-padded in
+    front, split into ~sqrt(n) equal lanes whose CRCs NumPy computes side
+    by side, one byte column at a time, and the lane CRCs are then folded
+    together. Sixteen extra all-zero lanes start from each single bit, so
+    they end up holding what advancing over one lane does to that bit.
     """
+    n = len(data)
+    if n < CRC_LANES_MIN_BYTES:
+        return fit_crc(data)
+    lanes = math.isqrt(n)
+    length = -(-n // lanes)
+    padded = np.zeros(lanes * length, dtype=np.uint8)
+    padded[lanes * length - n:] = np.frombuffer(data, dtype=np.uint8)
+    columns = np.zeros((length, lanes + 16), dtype=np.uint8)
+    columns[:, :lanes] = padded.reshape(lanes, length).T
+    crc = np.zeros(lanes + 16, dtype=np.uint32)
+    crc[lanes:] = 1 << np.arange(16)
+    table = np.array(_CRC_BYTE_TABLE, dtype=np.uint32)
+    for column in columns:
+        crc = (crc >> 8) ^ table[(crc ^ column) & 0xFF]
+
+    # Advancing a CRC over one lane of zeros, as lookups by its low and high byte
+    shift = crc[lanes:].astype(np.int64)
+    bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+    low = np.bitwise_xor.reduce(bits * shift[:8], axis=1).tolist()
+    high = np.bitwise_xor.reduce(bits * shift[8:], axis=1).tolist()
+    result = 0
+    for lane in crc[:lanes].tolist():
+        result = low[result & 0xFF] ^ high[result >> 8] ^ lane
+    return result
+
+
+def fit_datetime(value):
+    """FIT date_time (seconds since the FIT epoch) -> aware UTC datetime."""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(FIT_EPOCH_OFFSET + value, tz=timezone.utc)
+
+
+def _read_all(file_obj):
+    if isinstance(file_obj, (bytes, bytearray, memoryview)):
+        return bytes(file_obj)
     try:
         file_obj.seek(0)
     except Exception:
         pass
+    return file_obj.read()
 
-    fit = FitFile(file_obj)
-
-    total_dist_m = 0.0
-    total_time_s = 0.0
-    avg_hr = None
-    start_date = None
-
-    for msg in fit.get_messages("session"):
-        vals = {d.name: d.value for d in msg}
-        if vals.get("total_distance") is not None:
-            total_dist_m = float(vals["total_distance"] or 0.0)
-        if vals.get("total_elapsed_time") is not None:
-            total_time_s = float(vals["total_elapsed_time"] or 0.0)
-        if vals.get("avg_heart_rate") is not None:
-            try:
-                avg_hr = int(vals["avg_heart_rate"])
-            except Exception:
-                pass
-        if not start_date and vals.get("start_time"):
-            st = vals["start_time"]
-            if isinstance(st, datetime):
-                start_date = st.astimezone(timezone.utc).date() if st.tzinfo else st.date()
-
-    if avg_hr is None:
-        hr_sum = 0
-        hr_count = 0
-        for rec in fit.get_messages("record"):
-            vals = {d.name: d.value for d in rec}
-            hr = vals.get("heart_rate")
-            if hr is not None:
-                hr_sum += int(hr); hr_count += 1
-        if hr_count:
-            avg_hr = int(round(hr_sum / hr_count))
+
+def _compile_definition(data, pos, header, wanted_by_num):
+    """
+    Parse a definition message starting at ``pos`` (just after its header
+    byte). Returns (next_pos, definition) where definition is
+    (name, struct, size, slots, count, ts_index); name is None when the
+    message isn't one we want.  ``slots`` is a list of
+    (out_index, raw_index, invalid, scale, offset) for the decoded fields.
+    """
+    if pos + 5 > len(data):
+        raise FitEOFError("Truncated definition message")
+    endian = ">" if data[pos + 1] else "<"
+    global_num, num_fields = struct.unpack_from(endian + "HB", data, pos + 2)
+    pos += 5
+    field_defs = data[pos:pos + 3 * num_fields]
+    pos += 3 * num_fields
+    dev_size = 0
+    if header & 0x20:
+        if pos >= len(data):
+            raise FitEOFError("Truncated definition message")
+        num_dev = data[pos]
+        dev_defs = data[pos + 1:pos + 1 + 3 * num_dev]
+        pos += 1 + 3 * num_dev
+        dev_size = sum(dev_defs[i + 1] for i in range(0, len(dev_defs), 3))
+    if pos > len(data):
+        raise FitEOFError("Truncated definition message")
+
+    wanted = wanted_by_num.get(global_num)
+    fmt = [endian]
+    size = dev_size
+    slots = []
+    raw_index = 0
+    for i in range(0, len(field_defs), 3):
+        num, field_size, base = field_defs[i], field_defs[i + 1], field_defs[i + 2]
+        size += field_size
+        spec = wanted and wanted[1].get(num)
+        base_type = BASE_TYPES.get(base)
+        # Only single-value numeric fields are decoded; arrays, strings and
+        # byte blobs are skipped like any other unwanted field.
+        if spec and base_type and struct.calcsize(base_type[0]) == field_size:
+            fmt.append(base_type[0])
+            out_index, scale, offset = spec
+            slots.append((out_index, raw_index, base_type[1], scale, offset))
+            raw_index += 1
+        elif num == TIMESTAMP_FIELD and base_type and field_size == 4:
+            # Always track timestamps so compressed-timestamp headers work
+            fmt.append(base_type[0])
+            slots.append((None, raw_index, base_type[1], None, None))
+            raw_index += 1
+        else:
+            fmt.append(f"{field_size}x")
+    if dev_size:
+        fmt.append(f"{dev_size}x")
+
+    name, _, count, ts_index = wanted or (None, None, 0, None)
+    return pos, (name, struct.Struct("".join(fmt)), size, slots, count, ts_index)
+
+
+def _wanted_by_num(fields):
+    """{global message number: (name, {field num: (index, scale, offset)}, count, ts_index)}"""
+    wanted_by_num = {}
+    for name, names in fields.items():
+        global_num, profile = FIT_PROFILE[name]
+        ts_index = names.index("timestamp") if "timestamp" in names else None
+        by_num = {}
+        for i, field_name in enumerate(names):
+            num, scale, offset = profile[field_name]
+            by_num[num] = (i, scale, offset)
+        wanted_by_num[global_num] = (name, by_num, len(names), ts_index)
+    return wanted_by_num
+
+
+_PROBE_WANTED = _wanted_by_num(PROBE_FIELDS)
+
+
+def probe_fit(data, size=None):
+    """
+    Cheap validity check from the first bytes of a FIT file, without
+    decoding it: the 12- or 14-byte header (and its CRC, if set) and the
+    file_id message that must open the file. ``data`` can be the whole file
+    or just its first PROBE_BYTES; pass the full length as ``size`` to also
+    reject files shorter than their header says.
+
+    Returns a dict: header_size, protocol_version, profile_version,
+    data_size, file_size (header + data + CRC), file_type, manufacturer,
+    product, serial_number, time_created (aware datetime) and fit_file_id,
+    the device + creation time key that identifies one recording however
+    it was exported (None if the device left those fields out). Raises
+    FitHeaderError, FitEOFError or FitParseError.
+    """
+    data = bytes(data[:PROBE_BYTES])
+    if len(data) < 12:
+        raise FitEOFError("Truncated .FIT file header")
+    header_size = data[0]
+    if header_size not in (12, 14) or data[8:12] != b".FIT":
+        raise FitHeaderError("Invalid .FIT File Header")
+    if len(data) < header_size:
+        raise FitEOFError("Truncated .FIT file header")
+    protocol_version = data[1]
+    profile_version, data_size = struct.unpack_from("<HI", data, 2)
+    if protocol_version >> 4 > 2:
+        raise FitHeaderError(f"Unsupported FIT protocol version {protocol_version >> 4}")
+    if header_size == 14:
+        crc = struct.unpack_from("<H", data, 12)[0]
+        if crc and crc != fit_crc(data[:12]):
+            raise FitCRCError("Invalid .FIT file header CRC")
+    if not data_size:
+        raise FitParseError("Empty .FIT file")
+    file_size = header_size + data_size + 2
+    if size is not None and size < file_size:
+        raise FitEOFError("Truncated .FIT file")
+
+    end = min(len(data), header_size + data_size)
+    pos = header_size
+    local_defs = {}
+    while True:
+        if pos >= end:
+            raise FitEOFError("Truncated .FIT file")
+        header = data[pos]
+        pos += 1
+        if header & 0x80:
+            local_num = (header >> 5) & 0x3
+        elif header & 0x40:
+            pos, definition = _compile_definition(data, pos, header, _PROBE_WANTED)
+            local_defs[header & 0x0F] = definition
+            continue
+        else:
+            local_num = header & 0x0F
+        definition = local_defs.get(local_num)
+        if definition is None or definition[0] != "file_id":
+            raise FitParseError("FIT file doesn't start with a file_id message")
+        _, st, msg_size, slots, count, _ = definition
+        if pos + msg_size > end:
+            raise FitEOFError("Truncated file_id message")
+        raw = st.unpack_from(data, pos)
+        break
+
+    values = [None] * count
+    for out_index, raw_index, invalid, _, _ in slots:
+        if out_index is not None and raw[raw_index] != invalid:
+            values[out_index] = raw[raw_index]
+    file_type, manufacturer, product, serial_number, time_created = values
+    if file_type is not None and file_type != FIT_FILE_ACTIVITY:
+        raise FitParseError("Not an activity file")
+
+    fit_file_id = None
+    if serial_number is not None and time_created is not None:
+        fit_file_id = f"{manufacturer or 0}-{product or 0}-{serial_number}-{time_created}"
+    return {
+        "header_size": header_size,
+        "protocol_version": protocol_version,
+        "profile_version": profile_version,
+        "data_size": data_size,
+        "file_size": file_size,
+        "file_type": file_type,
+        "manufacturer": manufacturer,
+        "product": product,
+        "serial_number": serial_number,
+        "time_created": fit_datetime(time_created),
+        "fit_file_id": fit_file_id,
+    }
+
+
+def iter_fit_messages(file_obj, fields):
+    """
+    The data messages of a FIT file, decoded in a single pass.
+
+    The file is read into memory whole (uploads already are, see
+    FIT_UPLOAD_MEMORY_BYTES) so that each file's trailing CRC can be checked
+    before any of its messages are yielded: a corrupted file raises
+    FitCRCError instead of parsing into wrong numbers.
+
+    ``fields`` maps message names from FIT_PROFILE to the field names wanted,
+    e.g. {"record": ("timestamp", "heart_rate")}.  Yields (name, values)
+    where ``values`` is a list aligned with the requested field names (None
+    for absent or invalid values).  Only the requested fields are unpacked;
+    everything else is skipped by offset.  date_time fields are returned as
+    raw FIT seconds, see fit_datetime().
+    """
+    data = _read_all(file_obj)
+    wanted_by_num = _wanted_by_num(fields)
+
+    pos = 0
+    end = len(data)
+    if end < 12:
+        raise FitHeaderError("Invalid .FIT File Header")
+
+    while pos < end:
+        # File header (FIT files can be chained back to back)
+        header_size = data[pos]
+        if header_size < 12 or data[pos + 8:pos + 12] != b".FIT":
+            raise FitHeaderError("Invalid .FIT File Header")
+        data_size = struct.unpack_from("<I", data, pos + 4)[0]
+        pos += header_size
+        data_end = pos + data_size
+        if data_end + 2 > end:
+            raise FitEOFError("Tried to read past the end of the .FIT file")
+        # The CRC covers the header too; over the CRC bytes it comes out 0
+        if file_crc(memoryview(data)[pos - header_size:data_end + 2]):
+            raise FitCRCError("Invalid .FIT file CRC")
+
+        local_defs = {}
+        last_timestamp = 0
+        while pos < data_end:
+            header = data[pos]
+            pos += 1
+            if header & 0x80:
+                local_num = (header >> 5) & 0x3
+                time_offset = header & 0x1F
+            elif header & 0x40:
+                pos, definition = _compile_definition(data, pos, header, wanted_by_num)
+                local_defs[header & 0x0F] = definition
+                continue
+            else:
+                local_num = header & 0x0F
+                time_offset = None
+
+            definition = local_defs.get(local_num)
+            if definition is None:
+                raise FitParseError(f"Got data message with invalid local message type {local_num}")
+            name, st, size, slots, count, ts_index = definition
+            if pos + size > data_end:
+                raise FitEOFError("Truncated data message")
+            if not slots and time_offset is None:
+                pos += size
+                continue
+
+            raw = st.unpack_from(data, pos)
+            pos += size
+
+            if name is None:
+                # Not wanted, but keep the timestamp accumulator in sync
+                for out_index, raw_index, invalid, _, _ in slots:
+                    if out_index is None and raw[raw_index] != invalid:
+                        last_timestamp = raw[raw_index]
+                if time_offset is not None:
+                    last_timestamp += (time_offset - last_timestamp) & 0x1F
+                continue
+
+            values = [None] * count
+            for out_index, raw_index, invalid, scale, offset in slots:
+                value = raw[raw_index]
+                if value == invalid:
+                    continue
+                if out_index is None:
+                    last_timestamp = value
+                    continue
+                if out_index == ts_index:
+                    last_timestamp = value
+                if scale:
+                    value = value / scale
+                if offset:
+                    value = value - offset
+                values[out_index] = value
+            if time_offset is not None:
+                last_timestamp += (time_offset - last_timestamp) & 0x1F
+                if ts_index is not None:
+                    values[ts_index] = last_timestamp
+            yield name, values
+
+        pos = data_end + 2  # past the file CRC, checked above
+
+
+def _new_totals():
+    return {"distance_m": 0.0, "time_s": 0.0, "avg_hr": None, "start_date": None}
+
+
+def _add_session(totals, values):
+    start_time, dist, elapsed, hr = values
+    if dist is not None:
+        totals["distance_m"] = float(dist)
+    if elapsed is not None:
+        totals["time_s"] = float(elapsed)
+    if hr is not None:
+        totals["avg_hr"] = int(hr)
+    if not totals["start_date"] and start_time is not None:
+        totals["start_date"] = fit_datetime(start_time).date()
+
+
+def _metrics(totals, hr_sum, hr_count, first_ts, last_ts, last_dist_m):
+    """Session totals, falling back to the record stream for anything missing."""
+    total_dist_m = totals["distance_m"]
+    total_time_s = totals["time_s"]
+    avg_hr = totals["avg_hr"]
+    start_date = totals["start_date"]
+
+    if avg_hr is None and hr_count:
+        avg_hr = int(round(hr_sum / hr_count))
+    if not total_dist_m and last_dist_m:
+        total_dist_m = float(last_dist_m)
+    if not total_time_s and first_ts is not None and last_ts is not None:
+        total_time_s = float(last_ts - first_ts)
+    if not start_date and first_ts is not None:
+        start_date = fit_datetime(first_ts).date()
 
     distance_miles = total_dist_m / M_PER_MILE if total_dist_m else 0.0
     duration_minutes = total_time_s / 60.0 if total_time_s else 0.0
@@ -62,3 +486,123 @@ def parse_fit(file_obj):
         "avg_heart_rate": avg_hr,
         "avg_pace_min_per_mile": avg_pace_min_per_mile,
     }
+
+
+@timed("parse_fit")
+def parse_fit(file_obj):
+    """
+    Returns: date, distance_miles, duration_minutes, avg_heart_rate, avg_pace_min_per_mile
+
+    Single pass over the file: session totals are preferred, and the record
+    stream (timestamps, distance, heart rate) is used as a fallback for files
+    without a session summary.
+    """
+    totals = _new_totals()
+
+    # Gathered from records in the same sweep
+    hr_sum = 0
+    hr_count = 0
+    first_ts = None
+    last_ts = None
+    last_dist_m = None
+
+    for name, values in iter_fit_messages(file_obj, PARSE_FIELDS):
+        if name == "record":
+            ts, hr, dist = values
+            if hr is not None:
+                hr_sum += hr; hr_count += 1
+            if ts is not None:
+                if first_ts is None:
+                    first_ts = ts
+                last_ts = ts
+            if dist is not None:
+                last_dist_m = dist
+            continue
+        _add_session(totals, values)
+
+    return _metrics(totals, hr_sum, hr_count, first_ts, last_ts, last_dist_m)
+
+
+@timed("parse_fit_samples")
+def parse_fit_samples(file_obj):
+    """
+    parse_fit() plus the full record stream, from the same single pass.
+
+    Returns (metrics, columns). ``columns`` maps each SAMPLE_COLUMNS name to
+    a compact array: "timestamp" is array('q') of Unix seconds, the rest are
+    array('d') with NaN where a record had no value. Units are m, m/s, bpm,
+    rpm, m and degrees. Records without a timestamp are dropped.
+    """
+    totals = _new_totals()
+    columns = {name: array("d") for name in SAMPLE_COLUMNS}
+    columns["timestamp"] = array("q")
+    (timestamps, distances, speeds, heart_rates, cadences, altitudes, lats, longs) = (
+        columns[name] for name in SAMPLE_COLUMNS
+    )
+    nan = math.nan
+    hr_sum = 0
+    hr_count = 0
+    last_dist_m = None
+
+    for name, values in iter_fit_messages(file_obj, SAMPLE_FIELDS):
+        if name != "record":
+            _add_session(totals, values)
+            continue
+        ts, dist, speed, enh_speed, hr, cad, alt, enh_alt, lat, lon = values
+        if ts is None:
+            continue
+        if enh_speed is not None:
+            speed = enh_speed
+        if enh_alt is not None:
+            alt = enh_alt
+        if hr is not None:
+            hr_sum += hr; hr_count += 1
+        if dist is not None:
+            last_dist_m = dist
+        timestamps.append(ts + FIT_EPOCH_OFFSET)
+        distances.append(nan if dist is None else dist)
+        speeds.append(nan if speed is None else speed)
+        heart_rates.append(nan if hr is None else hr)
+        cadences.append(nan if cad is None else cad)
+        altitudes.append(nan if alt is None else alt)
+        lats.append(nan if lat is None else _semicircles(lat))
+        longs.append(nan if lon is None else _semicircles(lon))
+
+    first_ts = timestamps[0] - FIT_EPOCH_OFFSET if timestamps else None
+    last_ts = timestamps[-1] - FIT_EPOCH_OFFSET if timestamps else None
+    return _metrics(totals, hr_sum, hr_count, first_ts, last_ts, last_dist_m), columns
+
+
+def _semicircles(value):
+    # position fields are sint32 semicircles, but unpacked unsigned when the
+    # file declares them that way
+    if value >= 2 ** 31:
+        value -= 2 ** 32
+    return value * SEMICIRCLES_TO_DEGREES
+
+
+def parse_fit_safe(data):
+    """
+    parse_fit() for process pools: takes raw bytes and returns
+    (metrics, None) or (None, error message) instead of raising.
+    """
+    try:
+        return parse_fit(data), None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
+
+
+def probe_fit_safe(data, size=None):
+    """probe_fit() that returns (probe, None) or (None, error message) instead of raising."""
+    try:
+        return probe_fit(data, size), None
+    except FitParseError as e:
+        return None, str(e) or e.__class__.__name__
+
+
+def parse_fit_samples_safe(data):
+    """parse_fit_samples() for process pools: ((metrics, columns), None) or (None, error)."""
+    try:
+        return parse_fit_samples(data), None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
@@ -1,5 +1,7 @@
 from django import forms
 
+from .uploads import FILE_TOO_LARGE, probe_upload
+
 class FitUploadForm(forms.Form):
     file = forms.FileField(
         label="Upload .fit file",
@@ -12,4 +14,9 @@ class FitUploadForm(forms.Form):
         name = (f.name or "").lower()
         if not name.endswith(".fit"):
             raise forms.ValidationError("Only .fit files are allowed.")
+        if getattr(f, "error", None) == FILE_TOO_LARGE:
+            raise forms.ValidationError(f"{f.error}.")
+        _, error = probe_upload(f)
+        if error:
+            raise forms.ValidationError(f"Not a valid .fit file: {error}.")
         return f
@@ -0,0 +1,40 @@
+# training/http.py
+"""
+Shared async HTTP connection pool for the async views and background tasks.
+
+An httpx.AsyncClient is tied to the event loop it is first used on, so
+there is one client per running loop. Under ASGI that is one keep-alive
+pool per worker process, shared by every request the worker serves.
+"""
+import asyncio
+import weakref
+
+import httpx
+
+REQUEST_TIMEOUT = 30
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncClient
+
+
+def get_async_client():
+    """The pooled AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose_client():
+    """Close the running loop's pool, e.g. on ASGI lifespan shutdown."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,262 @@
+# training/jobs.py
+"""
+Background FIT ingestion.
+
+Uploads are written to MEDIA_ROOT and recorded as an UploadJob row; the
+request returns straight away. Worker processes (manage.py run_fit_worker)
+claim queued rows, parse the file and create the Workout.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from . import dedup
+from .analytics import compute_analytics
+from .fit_utils import parse_fit_samples, probe_fit
+from .models import UploadJob, Workout, normalize_media_path
+from .samples import samples_path_for, write_samples
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+STALE_AFTER = timedelta(minutes=10)
+# How often the pool's parent checks its workers and requeues stale jobs
+SUPERVISE_INTERVAL = 30.0
+
+
+def fit_path_for(content_hash):
+    """Content-addressed location of an upload: uploads/fit/ab/abcd....fit."""
+    return f"uploads/fit/{content_hash[:2]}/{content_hash}.fit"
+
+
+def fit_tmp_dir():
+    """Where uploads are written before their hash (and so their final name) is known."""
+    path = os.path.join(settings.MEDIA_ROOT, "uploads", "fit", "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def store_fit_tmp(tmp_path, content_hash):
+    """
+    Move a fully written upload from fit_tmp_dir() to its content-addressed
+    path, or drop it if that content is already stored. Returns the path.
+    """
+    rel_path = fit_path_for(content_hash)
+    final = os.path.join(settings.MEDIA_ROOT, rel_path)
+    if os.path.exists(final):
+        os.unlink(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(tmp_path, final)
+    return rel_path
+
+
+def save_fit_upload(f):
+    """
+    Stream an uploaded file to its content-addressed path, hashing it on
+    the way. Returns (relative path, sha256 hex digest). Identical files
+    share one copy on disk. Files already stored by uploads.FitUploadHandler
+    are not copied again.
+    """
+    if getattr(f, "rel_path", None):
+        return f.rel_path, f.content_hash
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=fit_tmp_dir(), suffix=".fit")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in f.chunks():
+                digest.update(chunk)
+                out.write(chunk)
+        content_hash = digest.hexdigest()
+        return store_fit_tmp(tmp_path, content_hash), content_hash
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def enqueue_fit_upload(user, rel_path, content_hash=""):
+    """
+    Queue a saved upload. If the same file is already waiting or being
+    parsed for this user, that job is returned instead of a second one.
+    """
+    if content_hash:
+        pending = UploadJob.objects.filter(
+            user=user, content_hash=content_hash, status__in=[UploadJob.QUEUED, UploadJob.PARSING],
+        ).first()
+        if pending is not None:
+            return pending
+    return UploadJob.objects.create(user=user, file_path=rel_path, content_hash=content_hash)
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to PARSING and return it, or None.
+    The conditional UPDATE is the lock: if another worker got there first it
+    matches zero rows and we try the next candidate.
+    """
+    while True:
+        job = UploadJob.objects.filter(status=UploadJob.QUEUED).order_by("created_at", "id").first()
+        if job is None:
+            return None
+        claimed = UploadJob.objects.filter(pk=job.pk, status=UploadJob.QUEUED).update(
+            status=UploadJob.PARSING, updated_at=timezone.now(),
+        )
+        if claimed:
+            job.status = UploadJob.PARSING
+            return job
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def workout_from_metrics(user, metrics, rel_path, **extra):
+    """
+    Unsaved Workout for parse_fit() output. ``extra`` sets further Workout
+    fields (samples_path, analytics, content_hash, started_at, fit_file_id).
+    """
+    return Workout(
+        user=user,
+        date=_start_of_day(metrics["date"]) if metrics["date"] else timezone.now(),
+        distance_miles=metrics["distance_miles"],
+        duration_minutes=metrics["duration_minutes"],
+        avg_heart_rate=metrics["avg_heart_rate"],
+        avg_pace_min_per_mile=metrics["avg_pace_min_per_mile"],
+        file_path=normalize_media_path(rel_path),
+        **extra,
+    )
+
+
+def create_workout_from_metrics(user, metrics, rel_path, **extra):
+    workout = workout_from_metrics(user, metrics, rel_path, **extra)
+    workout.save()
+    return workout
+
+
+def process_job(job):
+    """Parse a claimed job's file and create its Workout. Never raises."""
+    try:
+        workout = dedup.find_duplicate(job.user, job.content_hash)
+        if workout is None:
+            workout = _ingest_job(job)
+    except Exception as e:
+        logger.exception("FIT upload job %s failed", job.pk)
+        job.status = UploadJob.FAILED
+        job.error = str(e) or e.__class__.__name__
+        job.save(update_fields=["status", "error", "updated_at"])
+        return job
+
+    job.status = UploadJob.DONE
+    job.workout = workout
+    job.save(update_fields=["status", "workout", "updated_at"])
+    return job
+
+
+def _ingest_job(job):
+    """
+    Parse the job's file and create its Workout, or attach the data to the
+    Strava import of the same run if there is one. Another export of a
+    recording the user already has (same FIT file_id) isn't parsed at all.
+    """
+    saved_path = os.path.join(settings.MEDIA_ROOT, job.file_path)
+    with open(saved_path, "rb") as saved_file:
+        data = saved_file.read()
+    fit_file_id = probe_fit(data, len(data))["fit_file_id"]
+    existing = dedup.find_same_recording(job.user, fit_file_id)
+    if existing is not None:
+        return existing
+    metrics, columns = parse_fit_samples(data)
+    started_at = dedup.started_at_from_samples(columns)
+    fields = {
+        "file_path": job.file_path,
+        "samples_path": write_samples(samples_path_for(job.file_path), columns),
+        "analytics": compute_analytics(columns),
+        "content_hash": job.content_hash or None,
+        "fit_file_id": fit_file_id,
+    }
+    match = dedup.find_strava_match(job.user, started_at, metrics["distance_miles"])
+    if match is not None:
+        return dedup.attach_upload(match, **fields)
+    rel_path = fields.pop("file_path")
+    try:
+        with transaction.atomic():
+            return create_workout_from_metrics(job.user, metrics, rel_path, started_at=started_at, **fields)
+    except IntegrityError:
+        # Another worker finished the same file first
+        existing = dedup.find_duplicate(job.user, job.content_hash)
+        if existing is None:
+            raise
+        return existing
+
+
+def run_pending(limit=None):
+    """Process queued jobs in this process until the queue is empty. Returns the count."""
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        process_job(job)
+        done += 1
+    return done
+
+
+def requeue_stale_jobs(older_than=STALE_AFTER):
+    """Put back jobs whose worker died mid-parse."""
+    cutoff = timezone.now() - older_than
+    return UploadJob.objects.filter(status=UploadJob.PARSING, updated_at__lt=cutoff).update(
+        status=UploadJob.QUEUED, updated_at=timezone.now(),
+    )
+
+
+def run_worker(poll_interval=POLL_INTERVAL):
+    """Worker loop: drain the queue, sleep, repeat."""
+    while True:
+        if not run_pending():
+            time.sleep(poll_interval)
+
+
+def _worker_main(poll_interval):
+    # Each process needs its own DB connection, never one inherited from the parent
+    connections.close_all()
+    run_worker(poll_interval)
+
+
+def _start_worker(poll_interval):
+    connections.close_all()
+    w = multiprocessing.Process(target=_worker_main, args=(poll_interval,), daemon=True)
+    w.start()
+    return w
+
+
+def start_worker_pool(processes, poll_interval=POLL_INTERVAL, supervise_interval=SUPERVISE_INTERVAL):
+    """
+    Run ``processes`` worker processes until interrupted. Every
+    ``supervise_interval`` seconds a worker that died is replaced and jobs
+    left mid-parse (by it or anyone else) are requeued once stale.
+    """
+    workers = []
+    try:
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                logger.warning("Requeued %d stale upload job(s)", requeued)
+            for i, w in enumerate(workers):
+                if not w.is_alive():
+                    logger.warning("FIT worker %s exited with code %s; starting another", w.pid, w.exitcode)
+                    workers[i] = _start_worker(poll_interval)
+            while len(workers) < processes:
+                workers.append(_start_worker(poll_interval))
+            time.sleep(supervise_interval)
+    except KeyboardInterrupt:
+        for w in workers:
+            w.terminate()
@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import connection
+from django.core.management.base import BaseCommand
+
+from training import services
+from training.models import Workout
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _generate(batch):
+    try:
+        return services.generate_insights_batch(batch)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = "Generate cached AI insights for every workout that doesn't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=services.BATCH_SIZE,
+                            help="Workouts packed into each LLM call")
+        parser.add_argument("--concurrency", type=int, default=2,
+                            help="LLM calls in flight at once")
+        parser.add_argument("--user", help="Only backfill this username")
+
+    def handle(self, *args, **options):
+        workouts = Workout.objects.order_by("-date")
+        if options["user"]:
+            workouts = workouts.filter(user__username=options["user"])
+
+        missing = list(services.workouts_missing_insights(workouts))
+        if not missing:
+            self.stdout.write("All workouts already have insights.")
+            return
+
+        batches = list(_batches(missing, max(1, options["batch_size"])))
+        self.stdout.write(f"Generating insights for {len(missing)} workout(s) in {len(batches)} batch(es)...")
+
+        if options["concurrency"] <= 1:
+            stored = sum(map(_generate, batches))
+        else:
+            # The executor bounds how many completions are in flight at once
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                stored = sum(pool.map(_generate, batches))
+
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} insight(s)."))
@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from training import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the performance regression suite against a throwaway test database and "
+        "write the results as JSON. With --baseline, fail if a metric got worse by more "
+        "than --tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", action="append", choices=list(benchmarks.SUITE),
+                            help="Run only this group (repeatable)")
+        parser.add_argument("--quick", action="store_true",
+                            help="Smaller inputs (up to 1,000 workouts, 30 min FIT files), e.g. for CI")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the median is kept)")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+        parser.add_argument("--baseline", help="A saved report to compare against")
+        parser.add_argument("--tolerance", type=float, default=benchmarks.DEFAULT_TOLERANCE,
+                            help="Allowed relative slowdown before a metric counts as regressed "
+                                 "(default %(default)s)")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        report = benchmarks.run_suite(only=options["only"], quick=options["quick"], repeat=options["repeat"])
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text + "\n")
+            self.stderr.write(f"Wrote {len(report['results'])} metrics to {options['output']}.")
+        else:
+            self.stdout.write(text)
+
+        if baseline is None:
+            return
+        rows = benchmarks.compare(report, baseline, options["tolerance"])
+        for row in rows:
+            line = (f"{row['name']:<44} {row['baseline']:>12.6g} -> {row['value']:>12.6g} {row['unit']:<10} "
+                    f"x{row['ratio']:.2f}")
+            self.stderr.write(self.style.ERROR(line) if row["regressed"] else line)
+        regressed = [row["name"] for row in rows if row["regressed"]]
+        if regressed:
+            raise CommandError(f"{len(regressed)} metric(s) regressed: {', '.join(regressed)}")
+        self.stderr.write(self.style.SUCCESS(f"No regressions in {len(rows)} compared metric(s)."))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from training import similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the similar-workout indexes and save them to SIMILARITY_INDEX_DIR, "
+        "so servers load them instead of building on the first query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only build this username's index")
+
+    def handle(self, *args, **options):
+        if not settings.SIMILARITY_INDEX_DIR:
+            raise CommandError("Set SIMILARITY_INDEX_DIR to persist similarity indexes.")
+        users = get_user_model().objects.filter(workout__isnull=False).distinct()
+        if options["user"]:
+            users = users.filter(username=options["user"])
+        built = workouts = 0
+        for user_id in users.values_list("pk", flat=True).iterator():
+            index = similarity.build_index(user_id)
+            built += 1
+            workouts += len(index)
+        similarity.clear()
+        self.stdout.write(self.style.SUCCESS(f"Built {built} index(es) covering {workouts} workout(s)."))
@@ -0,0 +1,57 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from training import versions
+from training.analytics import compute_analytics
+from training.fit_utils import parse_fit_samples
+from training.models import Workout
+from training.samples import samples_path_for, write_samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract per-record samples for uploaded workouts that don't have them yet, "
+        "and derive analytics for workouts that have samples but no analytics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this username's workouts")
+        parser.add_argument("--recompute", action="store_true",
+                            help="Recompute analytics for every workout with samples "
+                                 "(e.g. after ANALYTICS_VERSION changes)")
+
+    def handle(self, *args, **options):
+        missing_samples = Q(samples_path__isnull=True, file_path__isnull=False) & ~Q(file_path="")
+        with_samples = Q(samples_path__isnull=False)
+        if not options["recompute"]:
+            with_samples &= Q(analytics__isnull=True)
+        workouts = Workout.objects.filter(missing_samples | with_samples)
+        if options["user"]:
+            workouts = workouts.filter(user__username=options["user"])
+
+        done = failed = 0
+        users = set()
+        for workout in workouts.iterator():
+            try:
+                samples = workout.samples
+                if samples is None:
+                    with open(os.path.join(settings.MEDIA_ROOT, workout.file_path), "rb") as f:
+                        _, columns = parse_fit_samples(f)
+                    workout.samples_path = write_samples(samples_path_for(workout.file_path), columns)
+                    samples = columns
+                analytics = compute_analytics(samples)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Workout {workout.pk}: {e}")
+                continue
+            Workout.objects.filter(pk=workout.pk).update(
+                samples_path=workout.samples_path, analytics=analytics, updated_at=timezone.now(),
+            )
+            users.add(workout.user_id)
+            done += 1
+        versions.bump(users)
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} workout(s), {failed} failed."))
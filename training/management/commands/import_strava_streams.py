@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from training import strava
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch per-second activity streams for Strava-imported workouts that don't have samples "
+        "yet and derive their analytics. Resumable: finished activities are never fetched again, "
+        "so just re-run it after a rate limit or a crash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this username's workouts")
+        parser.add_argument("--workers", type=int, help="Concurrent requests (default STRAVA_STREAMS_WORKERS)")
+        parser.add_argument("--limit", type=int, help="Stop after this many activities")
+
+    def handle(self, *args, **options):
+        workouts = strava.pending_streams()
+        if options["user"]:
+            workouts = workouts.filter(user__username=options["user"])
+        importer = strava.StreamImporter(options["workers"]).run(workouts, limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported streams for {importer.imported} workout(s); {importer.skipped} had none, "
+            f"{importer.failed} failed."
+        ))
+        if importer.retry_at:
+            self.stdout.write(f"Stopped early; run again after {importer.retry_at:%Y-%m-%d %H:%M:%S %Z}.")
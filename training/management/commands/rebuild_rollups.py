@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from training import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the weekly and monthly workout rollups from the Workout table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this username's rollups")
+
+    def handle(self, *args, **options):
+        users = None
+        if options["user"]:
+            users = get_user_model().objects.filter(username=options["user"])
+        count = rollups.rebuild(users)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup row(s)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from training import jobs
+
+
+class Command(BaseCommand):
+    help = "Parse queued .fit uploads into Workouts using a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2, help="Number of worker processes")
+        parser.add_argument("--poll-interval", type=float, default=jobs.POLL_INTERVAL,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the queue in this process and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            jobs.requeue_stale_jobs()
+            count = jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f"Processed {count} upload job(s)."))
+            return
+
+        self.stdout.write(f"Starting {options['processes']} FIT worker process(es)...")
+        jobs.start_worker_pool(options["processes"], options["poll_interval"])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from training import strava
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply queued Strava webhook events and run queued Strava syncs, respecting the "
+        "per-user and app-wide API rate limits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schedule-all", action="store_true",
+                            help="Queue a sync for every user with a Strava connection first "
+                                 "(run this from cron for periodic syncing)")
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep polling the queue instead of exiting when it is empty")
+        parser.add_argument("--poll-interval", type=float, default=strava.SYNC_POLL_INTERVAL,
+                            help="Seconds to sleep when nothing is due (with --loop)")
+
+    def handle(self, *args, **options):
+        if options["schedule_all"]:
+            queued = strava.schedule_all_syncs()
+            self.stdout.write(f"Queued {queued} Strava sync(s).")
+
+        if options["loop"]:
+            self.stdout.write("Starting Strava sync worker...")
+            strava.run_sync_worker(options["poll_interval"])
+            return
+
+        events = strava.run_pending_events()
+        count = strava.run_due_syncs()
+        self.stdout.write(self.style.SUCCESS(f"Applied {events} webhook event(s), ran {count} Strava sync(s)."))
@@ -0,0 +1,188 @@
+# training/metrics.py
+"""
+Request-level instrumentation, exported in Prometheus text format at /metrics.
+
+    MetricsMiddleware   latency per view, and DB queries / DB time per request
+    span(name)          time a block or a function (sync or async) as a
+                        named span: FIT parsing, OpenAI and Strava calls
+
+Every database connection gets an execute wrapper (installed from
+training.signals on connection_created) that times each query. Query and
+span timings are also collected for the current request through a
+ContextVar, which follows the request into sync_to_async threads, so
+METRICS_TIMING_HEADER can return a per-request breakdown as a
+Server-Timing header.
+
+Under a multi-process server set PROMETHEUS_MULTIPROC_DIR and /metrics
+aggregates every worker (prometheus_client's multiprocess mode).
+"""
+import contextvars
+import functools
+import hmac
+import inspect
+import os
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "coach_request_seconds", "View latency, middleware to response.", ["view", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "coach_request_db_queries", "Database queries per request.", ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "coach_request_db_seconds", "Time spent in database queries per request.", ["view"],
+)
+DB_QUERIES = Counter("coach_db_queries", "Database queries executed.", ["alias"])
+SPAN_SECONDS = Histogram(
+    "coach_span_seconds", "Duration of instrumented operations.", ["span"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+# Request methods labelled as themselves; anything else a client sends is "other"
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+# Timings for the request being served: {"db": [count, seconds], span: [count, seconds]}
+_timings = contextvars.ContextVar("coach_request_timings", default=None)
+
+
+def _record(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+@contextmanager
+def span(name):
+    """Time the block as span ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.labels(name).observe(elapsed)
+        _record(name, elapsed)
+
+
+def timed(name):
+    """Decorator form of span(); works on coroutine functions too."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_connection(connection):
+    """Count and time every query run on ``connection``."""
+    alias = connection.alias
+
+    def execute(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            DB_QUERIES.labels(alias).inc()
+            _record("db", time.perf_counter() - started)
+
+    connection.execute_wrappers.append(execute)
+
+
+class MetricsMiddleware:
+    """Put first in MIDDLEWARE so the latency covers the whole stack."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = self._finish(token)
+        return self._observe(request, response, started, timings)
+
+    async def __acall__(self, request):
+        started, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = self._finish(token)
+        return self._observe(request, response, started, timings)
+
+    @staticmethod
+    def _start():
+        return time.perf_counter(), _timings.set({})
+
+    @staticmethod
+    def _finish(token):
+        timings = _timings.get()
+        _timings.reset(token)
+        return timings
+
+    def _observe(self, request, response, started, timings):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        # Unresolved paths (404s, scanners) share one label to bound cardinality
+        view = match.view_name if match else "<unresolved>"
+        method = request.method if request.method in HTTP_METHODS else "other"
+        queries, db_seconds = timings.get("db", (0, 0.0))
+        REQUEST_LATENCY.labels(view, method, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(view).observe(queries)
+        REQUEST_DB_SECONDS.labels(view).observe(db_seconds)
+        if settings.METRICS_TIMING_HEADER:
+            response["Server-Timing"] = server_timing(elapsed, timings)
+        return response
+
+
+def server_timing(total, timings):
+    """Server-Timing header value: total, db and every span, durations in ms."""
+    parts = [f"total;dur={total * 1000:.1f}"]
+    for name, (count, seconds) in timings.items():
+        parts.append(f'{name};dur={seconds * 1000:.1f};desc="{count}x"')
+    return ", ".join(parts)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires METRICS_TOKEN as a bearer token;
+    without one configured it is only open with DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return HttpResponse(status=401)
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0004_stravasyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stravasyncstate',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='stravasyncstate',
+            name='sync_requested_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stravasyncstate',
+            name='sync_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='StravaApiUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=32)),
+                ('period', models.CharField(choices=[('15min', '15 minutes'), ('daily', 'Daily')], max_length=8)),
+                ('window_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'period', 'window_start'), name='unique_strava_usage_window')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0005_strava_sync_queue_and_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', '-date', '-created_at', '-id'], name='workout_user_date_idx'),
+        ),
+    ]
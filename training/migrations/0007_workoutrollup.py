@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0006_workout_user_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=8)),
+                ('period_start', models.DateField()),
+                ('workout_count', models.PositiveIntegerField(default=0)),
+                ('distance_miles', models.FloatField(default=0)),
+                ('duration_minutes', models.FloatField(default=0)),
+                ('heart_rate_sum', models.FloatField(default=0)),
+                ('heart_rate_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workout_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'period_start'), name='unique_workout_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0007_workoutrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='samples_path',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
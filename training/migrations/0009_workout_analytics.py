@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0008_workout_samples_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='analytics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.db.models import Value
+from django.db.models.functions import Replace
+
+
+def normalize_file_paths(apps, schema_editor):
+    # Workout.file_path is served as-is now; it used to be rewritten on every read
+    Workout = apps.get_model("training", "Workout")
+    Workout.objects.filter(file_path__contains="\\").update(
+        file_path=Replace("file_path", Value("\\"), Value("/")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0011_workoutlistversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_file_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0012_normalize_file_paths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StravaWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('aspect_type', models.CharField(max_length=16)),
+                ('owner_id', models.BigIntegerField()),
+                ('event_time', models.BigIntegerField()),
+                ('updates', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('available_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='training_st_status_2c2b3e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('object_type', 'object_id', 'aspect_type', 'event_time'), name='unique_strava_event')],
+            },
+        ),
+    ]
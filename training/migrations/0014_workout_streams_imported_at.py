@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training', '0013_strava_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='streams_imported_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -5,6 +5,11 @@ from django.contrib.auth.models import User
 
 User = get_user_model()
 
+def normalize_media_path(path):
+    """Media paths are stored with "/" separators (rows written on Windows had backslashes)."""
+    return path.replace("\\", "/") if path else path
+
+
 class Workout(models.Model):
     strava_id = models.BigIntegerField(unique=True, null=True, blank=True)
     date = models.DateTimeField()
@@ -13,9 +18,59 @@ class Workout(models.Model):
     avg_heart_rate = models.IntegerField(null=True, blank=True)
     avg_pace_min_per_mile = models.FloatField(null=True, blank=True)
     file_path = models.CharField(max_length=255, null=True, blank=True)
+    # Directory (under MEDIA_ROOT) holding the per-record sample columns
+    samples_path = models.CharField(max_length=255, null=True, blank=True)
+    # Splits, HR zones, TRIMP etc. derived from the samples (training.analytics)
+    analytics = models.JSONField(null=True, blank=True)
+    # sha256 of the uploaded .fit file; identical uploads map to one workout
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+    # Actual UTC start of the activity, used to match uploads with Strava imports
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Device + creation time from the FIT file_id (fit_utils.probe_fit), the
+    # same for every export of one recording
+    fit_file_id = models.CharField(max_length=64, null=True, blank=True)
+    # When the Strava streams were fetched into samples_path (or found empty)
+    streams_imported_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last write to the row. auto_now covers save() and bulk_create; paths
+    # that use .update() set it themselves (see similarity.SimilarityIndex.catch_up)
+    updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Matches the list ordering so a page is one index range scan
+            models.Index(fields=["user", "-date", "-created_at", "-id"], name="workout_user_date_idx"),
+            models.Index(fields=["user", "started_at"], name="workout_user_started_idx"),
+            models.Index(fields=["user", "fit_file_id"], name="workout_user_fit_file_idx"),
+            models.Index(fields=["user", "updated_at"], name="workout_user_updated_idx"),
+        ]
+        constraints = [
+            # Also the hash index used to spot re-uploads
+            models.UniqueConstraint(
+                fields=["user", "content_hash"], condition=models.Q(content_hash__isnull=False),
+                name="unique_workout_upload",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored date, so saving a moved workout can also refresh the
+        # rollups of the period it left (see signals.workout_saved)
+        instance._stored_date = instance.__dict__.get("date")
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.file_path = normalize_media_path(self.file_path)
+        super().save(*args, **kwargs)
+
+    @property
+    def samples(self):
+        """Lazily memory-mapped record samples (training.samples.WorkoutSamples), or None."""
+        from .samples import load_samples
+        return load_samples(self.samples_path)
+
     def __str__(self):
         return f"{self.user.username} – {self.date} – {self.distance_miles:.2f} mi"
     
@@ -28,3 +83,203 @@ class StravaToken(models.Model):
 
     def __str__(self):
         return f"StravaToken for athlete {self.athlete_id}"
+
+
+class UploadJob(models.Model):
+    """
+    A stored .fit upload waiting to be parsed into a Workout. The table is the
+    queue: run_fit_worker processes claim rows by flipping their status.
+    """
+    QUEUED = "queued"
+    PARSING = "parsing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (PARSING, "Parsing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_jobs")
+    file_path = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    workout = models.ForeignKey(Workout, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"UploadJob {self.pk} ({self.status}) – {self.file_path}"
+
+
+class WorkoutInsight(models.Model):
+    """
+    Cached AI coaching insights. Keyed by a hash of the workout metrics and
+    the prompt version (see services.insight_key), so identical inputs are
+    only ever sent to the LLM once.
+    """
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (READY, "Ready"),
+        (FAILED, "Failed"),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    content = models.TextField(blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"WorkoutInsight {self.key[:12]} ({self.status})"
+
+
+class StravaSyncState(models.Model):
+    """
+    Per-user cursor so Strava syncs only fetch activities newer than the last
+    one seen. Also the sync queue: a row with sync_requested_at in the past
+    is due, and the sync_strava worker claims it by setting sync_started_at.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="strava_sync")
+    last_activity_at = models.DateTimeField(null=True, blank=True)  # newest activity start (UTC)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    activities_synced = models.PositiveIntegerField(default=0)
+    sync_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    sync_started_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return f"StravaSyncState for {self.user} (through {self.last_activity_at})"
+
+
+class StravaWebhookEvent(models.Model):
+    """
+    An event Strava pushed to the webhook (activity created / updated /
+    deleted, athlete deauthorized). The view stores it and answers at once;
+    the sync_strava worker claims queued rows like run_fit_worker claims
+    UploadJobs. Strava retries deliveries it thinks failed, so the same
+    event is stored only once.
+    """
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    object_type = models.CharField(max_length=16)  # "activity" or "athlete"
+    object_id = models.BigIntegerField()
+    aspect_type = models.CharField(max_length=16)  # "create", "update" or "delete"
+    owner_id = models.BigIntegerField()  # Strava athlete id
+    event_time = models.BigIntegerField()  # epoch seconds, as sent
+    updates = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    # Not before this time (set when Strava's rate limit defers the event)
+    available_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["object_type", "object_id", "aspect_type", "event_time"], name="unique_strava_event",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Strava {self.object_type} {self.object_id} {self.aspect_type} ({self.status})"
+
+
+class StravaApiUsage(models.Model):
+    """
+    Strava API calls made per rate-limit window, for the whole app
+    (scope "app") and per user (scope "user:<id>"). Strava resets its
+    15-minute windows on the quarter hour and its daily window at midnight UTC.
+    """
+    FIFTEEN_MINUTES = "15min"
+    DAILY = "daily"
+    PERIOD_CHOICES = [(FIFTEEN_MINUTES, "15 minutes"), (DAILY, "Daily")]
+
+    scope = models.CharField(max_length=32)
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    window_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "period", "window_start"], name="unique_strava_usage_window"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.period} @ {self.window_start}: {self.count}"
+
+
+class WorkoutRollup(models.Model):
+    """
+    Running totals of a user's workouts per ISO week (starting Monday) and
+    per calendar month, kept current by training.rollups as workouts are
+    created and deleted. Averages are derived from the sums on read.
+    """
+    WEEK = "week"
+    MONTH = "month"
+    PERIOD_CHOICES = [(WEEK, "Week"), (MONTH, "Month")]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="workout_rollups")
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    workout_count = models.PositiveIntegerField(default=0)
+    distance_miles = models.FloatField(default=0)
+    duration_minutes = models.FloatField(default=0)
+    # Sum and count of avg_heart_rate over the workouts that have one
+    heart_rate_sum = models.FloatField(default=0)
+    heart_rate_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "period", "period_start"], name="unique_workout_rollup"),
+        ]
+
+    @property
+    def avg_pace_min_per_mile(self):
+        if not self.distance_miles or not self.duration_minutes:
+            return None
+        return round(self.duration_minutes / self.distance_miles, 2)
+
+    @property
+    def avg_heart_rate(self):
+        if not self.heart_rate_count:
+            return None
+        return round(self.heart_rate_sum / self.heart_rate_count, 1)
+
+    def __str__(self):
+        return f"{self.user_id} {self.period} {self.period_start}: {self.workout_count} workouts"
+
+
+class WorkoutListVersion(models.Model):
+    """
+    Per-user stamp bumped whenever the user's workouts change (see
+    training/versions.py). Drives ETag / Last-Modified on the dashboard and
+    keys its cached workout table.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="workout_list_version")
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} v{self.version}"
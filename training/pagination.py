@@ -0,0 +1,131 @@
+# training/pagination.py
+"""
+Keyset ("cursor") pagination for workout lists.
+
+Pages are addressed by the (date, created_at, id) of the row at the page
+edge rather than by an offset, so fetching page 500 costs the same index
+seek as page 1 and rows inserted meanwhile don't shift pages around.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class WorkoutCursorPagination(BasePagination):
+    """
+    Newest first, ordered by (-date, -created_at, -id); ``id`` breaks ties
+    so the order is total and no row is skipped or repeated.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 50
+    max_page_size = 200
+    ordering = ("-date", "-created_at", "-id")
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # ----- cursor encoding -----
+    def encode_cursor(self, workout, reverse):
+        """``workout`` is a Workout or a .values() row dict."""
+        if isinstance(workout, dict):
+            date, created_at, pk = workout["date"], workout["created_at"], workout["id"]
+        else:
+            date, created_at, pk = workout.date, workout.created_at, workout.pk
+        payload = [date.isoformat(), created_at.isoformat(), pk, int(reverse)]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            padded = raw + "=" * (-len(raw) % 4)
+            date, created_at, pk, reverse = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return datetime.fromisoformat(date), datetime.fromisoformat(created_at), int(pk), bool(reverse)
+        except (TypeError, ValueError, json.JSONDecodeError):
+            raise NotFound("Invalid cursor")
+
+    @staticmethod
+    def _after(date, created_at, pk):
+        """Rows strictly after the cursor in newest-first order."""
+        # The leading date__lte is redundant but gives the planner a range to seek on
+        return Q(date__lte=date) & (
+            Q(date__lt=date)
+            | Q(date=date, created_at__lt=created_at)
+            | Q(date=date, created_at=created_at, id__lt=pk)
+        )
+
+    @staticmethod
+    def _before(date, created_at, pk):
+        return Q(date__gte=date) & (
+            Q(date__gt=date)
+            | Q(date=date, created_at__gt=created_at)
+            | Q(date=date, created_at=created_at, id__gt=pk)
+        )
+
+    # ----- BasePagination API -----
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[3])
+
+        if cursor is None:
+            qs = queryset.order_by(*self.ordering)
+        elif reverse:
+            qs = queryset.filter(self._before(*cursor[:3])).order_by("date", "created_at", "id")
+        else:
+            qs = queryset.filter(self._after(*cursor[:3])).order_by(*self.ordering)
+
+        rows = list(qs[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+
+        # Whichever way we moved, the row the cursor pointed at lies behind us
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = self.encode_cursor(self.page[-1], reverse=False)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        cursor = self.encode_cursor(self.page[0], reverse=True)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,23 @@
+# training/renderers.py
+"""JSON rendering with orjson for the large list responses."""
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+_default = JSONEncoder().default  # Decimal, lazy strings etc., as DRF's JSONRenderer encodes them
+
+
+class ORJSONRenderer(renderers.BaseRenderer):
+    """
+    Compact UTF-8 JSON like DRF's JSONRenderer (with its default settings),
+    several times faster on big payloads. Parses to the same data; only
+    the spelling of very large or small floats can differ (1e16 vs 1e+16).
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return orjson.dumps(data, default=_default)
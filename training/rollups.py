@@ -0,0 +1,171 @@
+# training/rollups.py
+"""
+Weekly and monthly training totals per user (WorkoutRollup).
+
+Single workouts adjust their two rows (week and month) additively as they
+are created or deleted, via the signal handlers in training/signals.py.
+Bulk paths skip signals, so they call add_workouts() or refresh_periods()
+themselves. rebuild() recomputes everything from the Workout table.
+"""
+import calendar
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Workout, WorkoutRollup
+
+TOTAL_FIELDS = ["workout_count", "distance_miles", "duration_minutes", "heart_rate_sum", "heart_rate_count"]
+
+
+def _as_date(value):
+    """Workout.date as a local calendar date, whatever form it is in on an unsaved instance."""
+    if isinstance(value, str):
+        value = parse_datetime(value) or parse_date(value)
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def period_starts(day):
+    """{period: first day of the ISO week / month containing ``day``}."""
+    return {
+        WorkoutRollup.WEEK: day - timedelta(days=day.weekday()),
+        WorkoutRollup.MONTH: day.replace(day=1),
+    }
+
+
+def period_bounds(period, start):
+    """[start, end) of a period as aware datetimes, for filtering Workout.date."""
+    if period == WorkoutRollup.WEEK:
+        end = start + timedelta(days=7)
+    else:
+        end = start + timedelta(days=calendar.monthrange(start.year, start.month)[1])
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end, time.min)),
+    )
+
+
+def _totals(workouts):
+    """{(user_id, period, period_start): [count, miles, minutes, hr sum, hr count]}."""
+    totals = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0])
+    for w in workouts:
+        day = _as_date(w.date)
+        for period, start in period_starts(day).items():
+            row = totals[(w.user_id, period, start)]
+            row[0] += 1
+            row[1] += w.distance_miles or 0
+            row[2] += w.duration_minutes or 0
+            if w.avg_heart_rate is not None:
+                row[3] += w.avg_heart_rate
+                row[4] += 1
+    return totals
+
+
+def _increments(values, sign):
+    return {name: F(name) + sign * value for name, value in zip(TOTAL_FIELDS, values)}
+
+
+def add_workouts(workouts):
+    """Add newly created workouts to their week and month totals."""
+    for (user_id, period, start), values in _totals(workouts).items():
+        rollup, _ = WorkoutRollup.objects.get_or_create(user_id=user_id, period=period, period_start=start)
+        WorkoutRollup.objects.filter(pk=rollup.pk).update(**_increments(values, 1))
+
+
+def remove_workouts(workouts):
+    """Take deleted workouts back out of their totals; empty periods are dropped."""
+    keys = _totals(workouts)
+    for (user_id, period, start), values in keys.items():
+        WorkoutRollup.objects.filter(user_id=user_id, period=period, period_start=start).update(
+            **_increments(values, -1),
+        )
+    for user_id, period, start in keys:
+        WorkoutRollup.objects.filter(
+            user_id=user_id, period=period, period_start=start, workout_count__lte=0,
+        ).delete()
+
+
+def _grouped(workouts, period):
+    """Per-(user, period_start) totals computed in the database."""
+    trunc = TruncWeek if period == WorkoutRollup.WEEK else TruncMonth
+    return (
+        workouts.annotate(period_start=trunc("date", output_field=DateField()))
+        .values("user_id", "period_start")
+        .annotate(
+            workout_count=Count("id"),
+            total_distance=Sum("distance_miles"),
+            total_duration=Sum("duration_minutes"),
+            heart_rate_sum=Sum("avg_heart_rate"),
+            heart_rate_count=Count("avg_heart_rate"),
+        )
+        .order_by()
+    )
+
+
+def _rollup_from_group(period, g):
+    return WorkoutRollup(
+        user_id=g["user_id"],
+        period=period,
+        period_start=g["period_start"],
+        workout_count=g["workout_count"],
+        distance_miles=g["total_distance"] or 0,
+        duration_minutes=g["total_duration"] or 0,
+        heart_rate_sum=g["heart_rate_sum"] or 0,
+        heart_rate_count=g["heart_rate_count"],
+    )
+
+
+def refresh_periods(user, dates):
+    """
+    Recompute the weeks and months containing ``dates`` from the Workout
+    table. Used where rows are updated in place (e.g. Strava upserts) and
+    the old values aren't known.
+    """
+    days = {_as_date(d) for d in dates}
+    if not days:
+        return
+    rows = []
+    stale = []
+    for period in (WorkoutRollup.WEEK, WorkoutRollup.MONTH):
+        starts = {period_starts(day)[period] for day in days}
+        lower = period_bounds(period, min(starts))[0]
+        upper = period_bounds(period, max(starts))[1]
+        workouts = Workout.objects.filter(user=user, date__gte=lower, date__lt=upper)
+        found = {g["period_start"]: g for g in _grouped(workouts, period) if g["period_start"] in starts}
+        rows += [_rollup_from_group(period, g) for g in found.values()]
+        stale += [(period, start) for start in starts - found.keys()]
+
+    with transaction.atomic():
+        WorkoutRollup.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["user", "period", "period_start"],
+            update_fields=TOTAL_FIELDS,
+        )
+        for period, start in stale:
+            WorkoutRollup.objects.filter(user=user, period=period, period_start=start).delete()
+
+
+def rebuild(users=None, batch_size=1000):
+    """Recompute rollups from scratch for ``users`` (a queryset or ids), or for everyone."""
+    workouts = Workout.objects.all()
+    rollups = WorkoutRollup.objects.all()
+    if users is not None:
+        workouts = workouts.filter(user__in=users)
+        rollups = rollups.filter(user__in=users)
+
+    rows = [
+        _rollup_from_group(period, g)
+        for period in (WorkoutRollup.WEEK, WorkoutRollup.MONTH)
+        for g in _grouped(workouts, period)
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        WorkoutRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
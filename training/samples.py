@@ -0,0 +1,136 @@
+# training/samples.py
+"""
+Per-record workout samples stored as columns of .npy files.
+
+Each workout's record stream is written once at ingestion to a directory
+next to its upload, one file per column:
+
+    uploads/fit/2025/08/01/run.fit.samples/timestamp.npy
+                                          /heart_rate.npy
+                                          ...
+
+WorkoutSamples memory-maps a column the first time it is read, so charts
+and analytics never touch the FIT file again and only pay for the columns
+they use.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+from .fit_utils import SAMPLE_COLUMNS
+
+SAMPLES_SUFFIX = ".samples"
+
+# Storage dtype per column. Positions need float64 to keep metre precision;
+# float32 is plenty for everything else.
+COLUMN_DTYPES = {
+    "timestamp": np.int64,
+    "distance": np.float32,
+    "speed": np.float32,
+    "heart_rate": np.float32,
+    "cadence": np.float32,
+    "altitude": np.float32,
+    "position_lat": np.float64,
+    "position_long": np.float64,
+}
+
+
+def samples_path_for(rel_path):
+    """Relative samples directory for an upload at ``rel_path``."""
+    return f"{rel_path}{SAMPLES_SUFFIX}"
+
+
+def write_samples(rel_dir, columns):
+    """
+    Write ``columns`` (as returned by parse_fit_samples) under MEDIA_ROOT/rel_dir.
+    The directory is built under a temporary name and renamed into place,
+    so readers never see a half-written set. Returns ``rel_dir``.
+    """
+    final = os.path.join(settings.MEDIA_ROOT, rel_dir)
+    parent = os.path.dirname(final)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".samples-")
+    try:
+        for name in SAMPLE_COLUMNS:
+            values = np.asarray(columns[name], dtype=COLUMN_DTYPES[name])
+            np.save(os.path.join(tmp, f"{name}.npy"), values, allow_pickle=False)
+        if os.path.isdir(final):
+            shutil.rmtree(final)
+        os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return rel_dir
+
+
+class WorkoutSamples:
+    """
+    Lazy, read-only view of a workout's sample columns.
+
+        samples = workout.samples
+        hr = samples["heart_rate"]   # np.memmap, loaded on first access
+        samples.elapsed              # seconds since the first record
+
+    Missing values are NaN.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._columns = {}
+
+    def __getitem__(self, name):
+        if name not in COLUMN_DTYPES:
+            raise KeyError(name)
+        column = self._columns.get(name)
+        if column is None:
+            column = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            self._columns[name] = column
+        return column
+
+    def __len__(self):
+        return len(self["timestamp"])
+
+    def __contains__(self, name):
+        return name in COLUMN_DTYPES
+
+    @property
+    def columns(self):
+        return list(SAMPLE_COLUMNS)
+
+    @property
+    def elapsed(self):
+        ts = self["timestamp"]
+        return ts - ts[0] if len(ts) else ts
+
+    def to_dict(self, names=None):
+        """Fully loaded (non-mmapped) copies of the requested columns."""
+        return {name: np.array(self[name]) for name in (names or SAMPLE_COLUMNS)}
+
+
+def samples_version(rel_dir):
+    """
+    A token that changes whenever the samples at ``rel_dir`` are rewritten,
+    or None if there are none. write_samples() renames a freshly built
+    directory into place, so its inode and mtime identify one write; this
+    costs a single stat().
+    """
+    if not rel_dir:
+        return None
+    try:
+        st = os.stat(os.path.join(settings.MEDIA_ROOT, rel_dir))
+    except OSError:
+        return None
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}"
+
+
+def load_samples(rel_dir):
+    """WorkoutSamples for a stored samples directory, or None if there isn't one."""
+    if not rel_dir:
+        return None
+    path = os.path.join(settings.MEDIA_ROOT, rel_dir)
+    if not os.path.isfile(os.path.join(path, "timestamp.npy")):
+        return None
+    return WorkoutSamples(path)
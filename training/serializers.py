@@ -1,6 +1,11 @@
+import re
+
 from rest_framework import serializers
 from django.conf import settings
-from .models import Workout
+from django.utils import timezone
+from .models import Workout, UploadJob, WorkoutRollup
+from .series import DEFAULT_POINTS, MAX_POINTS, SERIES
+from .similarity import DEFAULT_NEIGHBORS, MAX_NEIGHBORS
 
 class WorkoutSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
@@ -10,17 +15,146 @@ class WorkoutSerializer(serializers.ModelSerializer):
         fields = [
             "id","date","distance_miles","duration_minutes",
             "avg_heart_rate","avg_pace_min_per_mile",
-            "file_path","created_at","file_url",
+            "file_path","created_at","file_url","analytics",
         ]
 
     def get_file_url(self, obj):
-        rel = (obj.file_path or "").replace("\\", "/")
-        url = settings.MEDIA_URL + rel
+        # file_path is stored normalized (models.normalize_media_path)
+        url = settings.MEDIA_URL + (obj.file_path or "")
         request = self.context.get("request")
         return request.build_absolute_uri(url) if request else url
 
+
+# Columns behind WorkoutSerializer's fields, for .values() querysets
+WORKOUT_VALUES = (
+    "id", "date", "distance_miles", "duration_minutes", "avg_heart_rate", "avg_pace_min_per_mile",
+    "file_path", "created_at", "analytics",
+)
+
+# Paths build_absolute_uri() passes through unchanged: nothing to quote, and
+# no "." segments to resolve (checked separately)
+_PLAIN_PATH = re.compile(r"[A-Za-z0-9_.~/-]*")
+
+
+def _datetime(value, tz):
+    # DateTimeField.to_representation with the default ISO 8601 format
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def serialize_workout_rows(rows, request=None):
+    """
+    WorkoutSerializer(rows, many=True).data, for rows from
+    ``.values(*WORKOUT_VALUES)``, without DRF's per-field machinery: the
+    absolute media URL prefix is worked out once per call instead of once
+    per row. The output is identical (see WorkoutRowSerializationTests).
+    """
+    tz = timezone.get_current_timezone()
+    media = request.build_absolute_uri(settings.MEDIA_URL) if request else settings.MEDIA_URL
+    data = []
+    for row in rows:
+        path = row["file_path"]
+        if not path:
+            url = media
+        elif request is None or _PLAIN_PATH.fullmatch(path) and "/." not in "/" + path:
+            url = media + path
+        else:
+            url = request.build_absolute_uri(settings.MEDIA_URL + path)
+        heart_rate = row["avg_heart_rate"]
+        pace = row["avg_pace_min_per_mile"]
+        data.append({
+            "id": row["id"],
+            "date": _datetime(row["date"], tz),
+            "distance_miles": float(row["distance_miles"]),
+            "duration_minutes": float(row["duration_minutes"]),
+            "avg_heart_rate": int(heart_rate) if heart_rate is not None else None,
+            "avg_pace_min_per_mile": float(pace) if pace is not None else None,
+            "file_path": path,
+            "created_at": _datetime(row["created_at"], tz),
+            "file_url": url,
+            "analytics": row["analytics"],
+        })
+    return data
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    workout = WorkoutSerializer(read_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = ["id", "status", "error", "file_path", "workout", "created_at", "updated_at"]
+
+
+class WorkoutFilterSerializer(serializers.Serializer):
+    """Query-string filters for the workout list; every bound is optional and inclusive."""
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+    min_distance = serializers.FloatField(required=False, min_value=0)
+    max_distance = serializers.FloatField(required=False, min_value=0)
+    min_pace = serializers.FloatField(required=False, min_value=0)
+    max_pace = serializers.FloatField(required=False, min_value=0)
+
+    LOOKUPS = {
+        "date_from": "date__gte",
+        "date_to": "date__lte",
+        "min_distance": "distance_miles__gte",
+        "max_distance": "distance_miles__lte",
+        "min_pace": "avg_pace_min_per_mile__gte",
+        "max_pace": "avg_pace_min_per_mile__lte",
+    }
+
+    def to_internal_value(self, data):
+        values = super().to_internal_value(data)
+        for low, high in (("date_from", "date_to"), ("min_distance", "max_distance"), ("min_pace", "max_pace")):
+            if low in values and high in values and values[low] > values[high]:
+                raise serializers.ValidationError({low: f"Must not be greater than {high}."})
+        return values
+
+    def filter_queryset(self, queryset):
+        return queryset.filter(**{self.LOOKUPS[name]: value for name, value in self.validated_data.items()})
+
+
+class WorkoutRollupSerializer(serializers.ModelSerializer):
+    avg_pace_min_per_mile = serializers.FloatField(read_only=True)
+    avg_heart_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = WorkoutRollup
+        fields = [
+            "period", "period_start", "workout_count", "distance_miles",
+            "duration_minutes", "avg_pace_min_per_mile", "avg_heart_rate",
+        ]
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        if data.get("file_path"):
-            data["file_path"] = data["file_path"].replace("\\", "/")
+        data["distance_miles"] = round(data["distance_miles"], 2)
+        data["duration_minutes"] = round(data["duration_minutes"], 2)
         return data
+
+
+class StatsFilterSerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=WorkoutRollup.PERIOD_CHOICES, default=WorkoutRollup.WEEK)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class SeriesParamsSerializer(serializers.Serializer):
+    """?series=pace,heart_rate (default: all) and ?points= for the series endpoint."""
+    series = serializers.CharField(required=False)
+    points = serializers.IntegerField(min_value=3, max_value=MAX_POINTS, default=DEFAULT_POINTS)
+
+    def validate_series(self, value):
+        names = list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+        unknown = [name for name in names if name not in SERIES]
+        if unknown or not names:
+            raise serializers.ValidationError(f"Choose from: {', '.join(SERIES)}.")
+        return names
+
+    def to_internal_value(self, data):
+        values = super().to_internal_value(data)
+        values.setdefault("series", list(SERIES))
+        return values
+
+
+class SimilarParamsSerializer(serializers.Serializer):
+    k = serializers.IntegerField(min_value=1, max_value=MAX_NEIGHBORS, default=DEFAULT_NEIGHBORS)
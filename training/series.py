@@ -0,0 +1,169 @@
+# training/series.py
+"""
+Chart series from stored samples, downsampled for the browser.
+
+A marathon recorded at 1 Hz is 10k+ records per column, far more than a
+chart can show. series_for() reads one column set from the workout's
+samples (training/samples.py) and keeps ``points`` of them with
+Largest-Triangle-Three-Buckets, which preserves the visual shape (peaks,
+surges, walk breaks) much better than taking every n-th record.
+
+A downsampled series is a pure function of (samples, series, points).
+Samples can be rewritten in place (a re-import, extract_samples), so they
+are identified by samples_version() rather than by their path: results are
+cached under that key and the API serves them with a strong ETag built
+from the same inputs.
+"""
+import hashlib
+
+import numpy as np
+
+from .fit_utils import M_PER_MILE
+
+# Bump when a series definition or the downsampling changes; it is part of
+# every cache key and ETag.
+SERIES_VERSION = 1
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+SERIES_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# Below this speed (m/s, ~27 min/mile) the runner is standing; pace is a gap
+MIN_PACE_SPEED = 1.0
+
+# Vectorized passes lttb() makes before finishing sequentially
+LTTB_SWEEPS = 8
+
+
+def _pace(samples):
+    speed = np.asarray(samples["speed"], dtype=np.float64)
+    if np.isnan(speed).all():
+        # Some Strava streams have no velocity; derive it from distance
+        distance = np.asarray(samples["distance"], dtype=np.float64)
+        elapsed = np.asarray(samples.elapsed, dtype=np.float64)
+        if len(distance) > 1 and not np.isnan(distance).all():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                speed = np.gradient(distance, elapsed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(speed >= MIN_PACE_SPEED, M_PER_MILE / speed / 60.0, np.nan)
+
+
+# name: (unit, values from WorkoutSamples)
+SERIES = {
+    "pace": ("min/mi", _pace),
+    "heart_rate": ("bpm", lambda samples: samples["heart_rate"]),
+    "elevation": ("m", lambda samples: samples["altitude"]),
+}
+
+
+def lttb(x, y, points):
+    """
+    Indices of the ``points`` samples Largest-Triangle-Three-Buckets keeps
+    (the first and last always among them), in order.
+
+    The records between the endpoints are split into points - 2 buckets and
+    each bucket keeps the record forming the largest triangle with the one
+    kept from the previous bucket and the mean of the next. With a the
+    previously kept record, the doubled area is |ax*U + ay*V + W| where U,
+    V, W depend only on the record and its bucket, so every bucket's pick
+    for a given set of a's is one vectorized argmax over all records.
+
+    The chain through a is resolved by sweeping: start with each previous
+    bucket's mean as a, recompute all picks from the last sweep's, and stop
+    when nothing changes. Sweep k gets at least the first k buckets right
+    and the picks usually settle within a few sweeps; after LTTB_SWEEPS,
+    buckets whose previous pick still moved are recomputed one at a time.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    buckets = points - 2
+    edges = (np.arange(buckets + 1) * ((n - 2) / buckets)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, sizes = edges[:-1], np.diff(edges)
+
+    # Mean of each bucket; the last bucket looks ahead to the final record
+    inner_x, inner_y = x[1:-1], y[1:-1]
+    mean_x = np.add.reduceat(inner_x, starts - 1) / sizes
+    mean_y = np.add.reduceat(inner_y, starts - 1) / sizes
+    cx = np.append(mean_x[1:], x[-1])[:, None]
+    cy = np.append(mean_y[1:], y[-1])[:, None]
+
+    # One row per bucket. Buckets differ in size by at most one; short ones
+    # are padded by repeating their last record, which can't win the argmax
+    # over its first occurrence.
+    width = int(sizes.max())
+    rows = np.minimum(starts[:, None] - 1 + np.arange(width), (starts + sizes - 2)[:, None])
+    px, py = inner_x[rows], inner_y[rows]
+    u, v, w = py - cy, cx - px, px * cy - cx * py
+
+    everything = np.arange(buckets)
+    ax = np.concatenate([x[:1], mean_x[:-1]])[:, None]
+    ay = np.concatenate([y[:1], mean_y[:-1]])[:, None]
+    picks = rows[everything, np.abs(ax * u + ay * v + w).argmax(axis=1)]
+    previous = np.full(buckets, -1)  # the a's each pick was computed from (-1: a bucket mean)
+    for _ in range(LTTB_SWEEPS):
+        ax[1:, 0], ay[1:, 0] = inner_x[picks[:-1]], inner_y[picks[:-1]]
+        previous, picks = picks, rows[everything, np.abs(ax * u + ay * v + w).argmax(axis=1)]
+        if np.array_equal(picks, previous):
+            break
+    else:
+        # picks[i] stands if the record it was computed from is the exact
+        # picks[i - 1]; only the rest are recomputed
+        picks, previous = picks.tolist(), previous.tolist()
+        for i in range(1, buckets):
+            j = picks[i - 1]
+            if j != previous[i - 1]:
+                picks[i] = int(rows[i, np.abs(inner_x[j] * u[i] + inner_y[j] * v[i] + w[i]).argmax()])
+        picks = np.array(picks)
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    kept[1:-1] = picks + 1
+    return kept
+
+
+def downsample(x, y, points):
+    """(x, y) reduced to at most ``points`` pairs; NaN values (gaps) are dropped first."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    kept = lttb(x, y, points)
+    return x[kept], y[kept]
+
+
+def series_for(samples, name, points):
+    """
+    {"unit", "t", "values"} for series ``name``: elapsed seconds and values,
+    at most ``points`` of each, ready for JSON.
+    """
+    unit, values = SERIES[name]
+    t, v = downsample(samples.elapsed, values(samples), points)
+    return {
+        "unit": unit,
+        "t": t.astype(np.int64).tolist(),
+        "values": np.round(v, 2).tolist(),
+    }
+
+
+def series_key(workout, version, name, points):
+    """Cache key for one downsampled series of ``workout``'s samples at ``version`` (samples_version())."""
+    digest = hashlib.sha256(f"{workout.samples_path}:{version}:{SERIES_VERSION}".encode()).hexdigest()[:16]
+    return f"workout-series:{workout.pk}:{digest}:{name}:{points}"
+
+
+def series_etag(workout, version, names, points):
+    """
+    Strong ETag for a response with ``names`` at ``points``: the output is
+    fully determined by the samples (``version``), the series definitions
+    and these parameters, so it can be checked without loading anything.
+    """
+    parts = [
+        str(workout.pk), workout.samples_path or "", version, str(SERIES_VERSION), ",".join(names), str(points),
+    ]
+    return hashlib.sha256(":".join(parts).encode()).hexdigest()[:32]
@@ -1,14 +1,47 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
+from django.db import connection
+from django.utils import timezone
 from openai import OpenAI
 
+from . import http
+from .metrics import timed
+from .models import WorkoutInsight
+
+logger = logging.getLogger(__name__)
+
 # Initialize client with your API key
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
 
-def get_workout_insights(workout):
-    """
-    Send workout data to OpenAI and return recommendations.
-    """
-    prompt = f"""
+# Bump whenever the prompt below changes so cached insights are regenerated
+PROMPT_VERSION = 1
+
+# Failed (or abandoned pending) generations are retried on a later page view,
+# but not more often than this
+RETRY_AFTER = timedelta(minutes=5)
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+# Batch mode: workouts per completion and the token budget for each
+BATCH_SIZE = 10
+BATCH_TOKENS_PER_WORKOUT = 200
+
+# Event loop (in its own thread) that runs background insight generation;
+# every pending completion shares the loop's httpx pool
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def build_prompt(workout):
+    return f"""
     You are a running coach. Analyze this workout and provide 2-3
     actionable coaching tips.
 
@@ -19,6 +52,14 @@ def get_workout_insights(workout):
     Pace: {workout.avg_pace_min_per_mile if workout.avg_pace_min_per_mile else "N/A"} min/mile
     """
 
+
+@timed("openai.insights")
+def get_workout_insights(workout):
+    """
+    Send workout data to OpenAI and return recommendations.
+    """
+    prompt = build_prompt(workout)
+
     response = client.chat.completions.create(
         model="gpt-4o-mini",  # or gpt-4o, gpt-3.5-turbo, etc.
         messages=[{"role": "user", "content": prompt}],
@@ -26,3 +67,267 @@ def get_workout_insights(workout):
     )
 
     return response.choices[0].message.content
+
+
+@timed("openai.insights")
+async def aget_workout_insights(workout):
+    """get_workout_insights() over the shared async connection pool."""
+    res = await http.get_async_client().post(
+        f"{settings.OPENAI_BASE_URL.rstrip('/')}/chat/completions",
+        headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"},
+        json={
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": build_prompt(workout)}],
+            "max_tokens": 200,
+        },
+    )
+    res.raise_for_status()
+    return res.json()["choices"][0]["message"]["content"]
+
+
+def _workout_summary(workout):
+    return {
+        "id": workout.id,
+        "date": str(workout.date),
+        "distance_miles": round(workout.distance_miles, 2),
+        "duration_minutes": round(workout.duration_minutes, 2),
+        "avg_heart_rate": workout.avg_heart_rate,
+        "pace_min_per_mile": workout.avg_pace_min_per_mile,
+    }
+
+
+def build_batch_prompt(workouts):
+    summaries = json.dumps([_workout_summary(w) for w in workouts], indent=1)
+    return f"""
+    You are a running coach. For EACH workout below, provide 2-3 actionable
+    coaching tips. Judge every workout on its own.
+
+    Reply with JSON only, in the form
+    {{"insights": [{{"id": <workout id>, "tips": "<tips as plain text>"}}, ...]}}
+    with exactly one entry per workout id.
+
+    Workouts:
+    {summaries}
+    """
+
+
+@timed("openai.insights_batch")
+def get_workout_insights_batch(workouts):
+    """
+    One completion for many workouts. Returns {workout.id: text}; workouts
+    the model left out of its reply are simply missing from the dict.
+    """
+    workouts = list(workouts)
+    if not workouts:
+        return {}
+
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": build_batch_prompt(workouts)}],
+        response_format={"type": "json_object"},
+        max_tokens=min(BATCH_TOKENS_PER_WORKOUT * len(workouts), 4000),
+    )
+
+    data = json.loads(response.choices[0].message.content or "{}")
+    wanted = {w.id for w in workouts}
+    results = {}
+    for item in data.get("insights") or []:
+        try:
+            workout_id = int(item["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        tips = item.get("tips")
+        if workout_id in wanted and isinstance(tips, str) and tips.strip():
+            results[workout_id] = tips.strip()
+    return results
+
+
+# ---------- Cached insights ----------
+def insight_key(workout):
+    """Hash of everything the prompt depends on."""
+    payload = json.dumps({
+        "v": PROMPT_VERSION,
+        "date": str(workout.date),
+        "distance_miles": workout.distance_miles,
+        "duration_minutes": workout.duration_minutes,
+        "avg_heart_rate": workout.avg_heart_rate,
+        "avg_pace_min_per_mile": workout.avg_pace_min_per_mile,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_insight_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_insight_cache_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="insights", daemon=True).start()
+        return _loop
+
+
+def _run_in_background(fn, *args):
+    """Schedule coroutine function ``fn`` on the background loop and return at once."""
+    asyncio.run_coroutine_threadsafe(fn(*args), _background_loop())
+
+
+def _release_connection():
+    if threading.current_thread() is not threading.main_thread():
+        connection.close()
+
+
+async def generate_insight(key, workout):
+    """Call the LLM and store the result under ``key``. Never raises."""
+    try:
+        content = await aget_workout_insights(workout)
+    except Exception as e:
+        logger.exception("Insight generation failed for %s", key)
+        await WorkoutInsight.objects.filter(key=key).aupdate(
+            status=WorkoutInsight.FAILED, error=str(e), updated_at=timezone.now(),
+        )
+    else:
+        await WorkoutInsight.objects.filter(key=key).aupdate(
+            status=WorkoutInsight.READY, content=(content or "").strip(), error="",
+            updated_at=timezone.now(),
+        )
+    finally:
+        await sync_to_async(_release_connection)()
+
+
+def _stale(key):
+    """FAILED or abandoned PENDING row for ``key`` that is due a retry."""
+    cutoff = timezone.now() - RETRY_AFTER
+    return WorkoutInsight.objects.filter(
+        key=key, status__in=[WorkoutInsight.FAILED, WorkoutInsight.PENDING], updated_at__lt=cutoff,
+    )
+
+
+def _claim_stale(key):
+    """Take over a FAILED or abandoned PENDING row; only one caller can win."""
+    return bool(_stale(key).update(status=WorkoutInsight.PENDING, updated_at=timezone.now()))
+
+
+async def _aclaim_stale(key):
+    return bool(await _stale(key).aupdate(status=WorkoutInsight.PENDING, updated_at=timezone.now()))
+
+
+async def _aclaim_failed(key):
+    """Take over a FAILED row right away, without waiting out RETRY_AFTER."""
+    return bool(await WorkoutInsight.objects.filter(key=key, status=WorkoutInsight.FAILED).aupdate(
+        status=WorkoutInsight.PENDING, updated_at=timezone.now(),
+    ))
+
+
+async def aget_cached_insights(workout, retry=False):
+    """
+    Return (status, content) of the cached insights for ``workout``: READY
+    with the text, PENDING while they are being generated, or FAILED with
+    None if the last attempt errored.
+
+    On a miss the first caller creates a PENDING row (the unique key makes
+    that race-free) and schedules generation on the background loop; anyone
+    else arriving meanwhile just sees PENDING. Failures are retried after
+    RETRY_AFTER, or straight away with ``retry``. Never blocks on the LLM.
+    """
+    key = insight_key(workout)
+    insight, created = await WorkoutInsight.objects.aget_or_create(key=key)
+
+    if insight.status == WorkoutInsight.READY:
+        _count("hits")
+        return WorkoutInsight.READY, insight.content
+
+    _count("misses")
+    if created or await _aclaim_stale(key) or (retry and await _aclaim_failed(key)):
+        _run_in_background(generate_insight, key, workout)
+        return WorkoutInsight.PENDING, None
+    return insight.status, None
+
+
+def get_cached_insights(workout, retry=False):
+    """Sync version of aget_cached_insights()."""
+    return async_to_sync(aget_cached_insights)(workout, retry)
+
+
+def _claim_key(key):
+    """Create or take over the PENDING row for ``key``. True if we own generation."""
+    insight, created = WorkoutInsight.objects.get_or_create(key=key)
+    if created:
+        return True
+    if insight.status == WorkoutInsight.READY:
+        return False
+    return _claim_stale(key)
+
+
+def generate_insights_batch(workouts):
+    """
+    Fill the insight cache for ``workouts`` with a single LLM call.
+
+    Workouts whose key is already cached (or being generated elsewhere) are
+    skipped, as are duplicates sharing a key. Returns the number of insights
+    stored. Never raises; keys the model didn't answer for are marked FAILED.
+    """
+    by_key = {}
+    for workout in workouts:
+        key = insight_key(workout)
+        if key not in by_key and _claim_key(key):
+            by_key[key] = workout
+    if not by_key:
+        return 0
+
+    try:
+        results = get_workout_insights_batch(by_key.values())
+    except Exception as e:
+        logger.exception("Batch insight generation failed for %d workouts", len(by_key))
+        results, error = {}, str(e)
+    else:
+        error = "Missing from batch response"
+
+    stored = 0
+    now = timezone.now()
+    for key, workout in by_key.items():
+        content = results.get(workout.id)
+        if content:
+            WorkoutInsight.objects.filter(key=key).update(
+                status=WorkoutInsight.READY, content=content, error="", updated_at=now,
+            )
+            stored += 1
+        else:
+            WorkoutInsight.objects.filter(key=key).update(
+                status=WorkoutInsight.FAILED, error=error, updated_at=now,
+            )
+    return stored
+
+
+def workouts_missing_insights(queryset, chunk_size=500):
+    """Yield workouts from ``queryset`` that have no READY cached insight."""
+    chunk = []
+
+    def flush():
+        keys = {insight_key(w): w for w in chunk}
+        ready = set(WorkoutInsight.objects.filter(
+            key__in=keys, status=WorkoutInsight.READY,
+        ).values_list("key", flat=True))
+        return [w for k, w in keys.items() if k not in ready]
+
+    for workout in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(workout)
+        if len(chunk) >= chunk_size:
+            yield from flush()
+            chunk = []
+    if chunk:
+        yield from flush()
@@ -0,0 +1,55 @@
+# training/signals.py
+"""
+Keep WorkoutRollup, the list version stamp and loaded similarity indexes in
+step with single-row Workout saves and deletes, and set up new database
+connections (SQLite tuning, query metrics).
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics, rollups, similarity, versions
+from .models import Workout
+
+
+@receiver(post_save, sender=Workout)
+def workout_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        rollups.add_workouts([instance])
+    else:
+        stored = getattr(instance, "_stored_date", None)
+        rollups.refresh_periods(instance.user, [instance.date] + ([stored] if stored else []))
+    instance._stored_date = instance.date
+    versions.bump([instance.user_id])
+    similarity.workout_saved(instance)
+
+
+@receiver(post_delete, sender=Workout)
+def workout_deleted(sender, instance, **kwargs):
+    rollups.remove_workouts([instance])
+    versions.bump([instance.user_id])
+    similarity.workout_deleted(instance)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """
+    WAL lets readers carry on while one writer commits, busy_timeout makes
+    writers queue instead of failing with "database is locked", and
+    synchronous=NORMAL is safe under WAL (a power cut can lose the last
+    commits, never corrupt the file).
+    """
+    if connection.vendor != "sqlite" or not getattr(settings, "SQLITE_TUNED", False):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    metrics.instrument_connection(connection)
@@ -0,0 +1,389 @@
+# training/similarity.py
+"""
+"Runs like this one": nearest neighbours over per-user workout features.
+
+Each workout is a point in a small feature space (FEATURES), scaled so one
+unit is roughly a noticeable difference: a mile, half a minute per mile of
+pace, 5 bpm, a couple of hours in the day, 20 TRIMP. SimilarityIndex keeps
+a user's workouts as rows of a NumPy matrix, so a query is one
+matrix-vector product over every row plus a partial sort, a few
+milliseconds even for 100k workouts.
+
+Indexes live in process memory, one per user (least recently used are
+evicted past SIMILARITY_MAX_INDEXES), and are tagged with the user's
+WorkoutListVersion:
+
+    - single-row saves and deletes in this process (training/signals.py)
+      update a loaded index in place and move its tag along;
+    - anything else that changes workouts (bulk paths, the upload worker
+      and other processes) leaves the tag behind, and the next query
+      catches the index up from the database: rows whose updated_at is
+      past the index's last sync are re-read, deleted ones dropped. Only
+      if that doesn't add up is the index rebuilt.
+
+Catching up and building run under a per-user lock, so concurrent queries
+for a stale index wait for one refresh instead of each doing their own.
+
+With SIMILARITY_INDEX_DIR set, built indexes are also written there and a
+process starting up loads them (catching up if needed) instead of
+rebuilding.
+"""
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import metrics, versions
+from .models import Workout
+
+# Bump when FEATURES or their scales change; persisted indexes are rebuilt
+FEATURES_VERSION = 1
+
+FEATURES = ("distance_miles", "pace", "heart_rate", "time_of_day_x", "time_of_day_y", "trimp")
+# The difference in each feature that counts as one unit of distance. Time
+# of day is a point on a unit circle, so runs at 23:00 and 01:00 are close;
+# at scale 0.5 two hours apart is about one unit.
+FEATURE_SCALES = np.array([1.0, 0.5, 5.0, 0.5, 0.5, 20.0])
+# Squared distance charged for a feature the query has and a workout lacks
+MISSING_PENALTY = 1.0
+
+# Workout values the features come from (see source_row and SimilarityIndex.build):
+# distance, pace, HR, start time (started_at, else date) and TRIMP
+SOURCE_FIELDS = ("distance_miles", "avg_pace_min_per_mile", "avg_heart_rate", "started", "analytics__trimp")
+
+DEFAULT_NEIGHBORS = 10
+MAX_NEIGHBORS = 100
+
+# Catching up re-reads rows written this long before the last sync too, in
+# case their transaction committed after it
+CATCH_UP_OVERLAP = timedelta(minutes=5)
+
+_indexes = OrderedDict()  # user id -> SimilarityIndex, least recently used first
+_indexes_lock = threading.Lock()
+_build_locks = {}  # user id -> Lock held while building or catching up
+
+
+def _day_fraction(when, tz):
+    if when is None:
+        return None
+    local = when.astimezone(tz)
+    return (local.hour * 3600 + local.minute * 60 + local.second) / 86400
+
+
+def _as_datetime(value):
+    """
+    An instance's started_at or date as the aware datetime the database
+    would return. Until it is reloaded, a Workout can hold a date, a naive
+    datetime or a string there: a date is midnight and naive times are in
+    the default time zone, as DateTimeField stores them.
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value) or parse_date(value)
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def source_row(workout):
+    """A Workout's SOURCE_FIELDS values, like a row from .values_list()."""
+    analytics = workout.analytics or {}
+    return (
+        workout.distance_miles, workout.avg_pace_min_per_mile, workout.avg_heart_rate,
+        _as_datetime(workout.started_at or workout.date), analytics.get("trimp"),
+    )
+
+
+def feature_matrix(rows):
+    """
+    (values, present) for SOURCE_FIELDS rows: scaled features, one row per
+    workout, with 0 where a value is missing, and a 0/1 matrix of which are
+    there.
+    """
+    tz = timezone.get_current_timezone()
+    raw = np.array(
+        [(distance, pace, hr, _day_fraction(started, tz), trimp) for distance, pace, hr, started, trimp in rows],
+        dtype=np.float64,
+    ).reshape(-1, 5)
+    angle = 2 * math.pi * raw[:, 3]
+    values = np.column_stack([raw[:, :3], np.cos(angle), np.sin(angle), raw[:, 4]]) / FEATURE_SCALES
+    present = ~np.isnan(values)
+    values[~present] = 0.0
+    return values, present.astype(np.float64)
+
+
+def _pack(values, present):
+    # [x^2 | x | present]: the squared distance to a query is then one dot
+    # product per row (see SimilarityIndex.neighbors)
+    return np.hstack([values * values, values, present])
+
+
+class SimilarityIndex:
+    """
+    One user's workouts as rows of a packed feature matrix. ``version`` and
+    ``token`` are the WorkoutListVersion the contents reflect; ``synced_at``
+    is when the rows were last read from the database.
+    """
+
+    def __init__(self, user_id, ids, packed, version=0, token="", synced_at=None):
+        self.user_id = user_id
+        self.version = version
+        self.token = token
+        self.synced_at = synced_at
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._packed = np.asarray(packed, dtype=np.float64).reshape(len(self._ids), 3 * len(FEATURES))
+        self._size = len(self._ids)
+        self._rows = {workout_id: row for row, workout_id in enumerate(self._ids.tolist())}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, workout_id):
+        return workout_id in self._rows
+
+    @staticmethod
+    def _read(workouts):
+        """(ids, packed rows) for a Workout queryset."""
+        rows = list(
+            workouts.annotate(started=Coalesce("started_at", "date")).order_by("id").values_list("id", *SOURCE_FIELDS)
+        )
+        return [row[0] for row in rows], _pack(*feature_matrix(row[1:] for row in rows))
+
+    @classmethod
+    def build(cls, user_id, stamp):
+        """Index of the user's workouts as they are now; ``stamp`` is read before the rows."""
+        synced_at = timezone.now()
+        ids, packed = cls._read(Workout.objects.filter(user_id=user_id))
+        return cls(user_id, ids, packed, stamp.version, versions.stamp_token(stamp), synced_at)
+
+    def catch_up(self, stamp):
+        """
+        Bring the index up to ``stamp`` (read before calling) from the
+        database: re-read the rows written since the last sync, then drop
+        rows that no longer exist. Returns False, leaving the index as it
+        was tagged, if the result doesn't match the table and it needs a
+        rebuild instead.
+        """
+        if self.synced_at is None:
+            return False
+        synced_at = timezone.now()
+        workouts = Workout.objects.filter(user_id=self.user_id)
+        ids, packed = self._read(workouts.filter(updated_at__gte=self.synced_at - CATCH_UP_OVERLAP))
+        self._upsert(ids, packed)
+        # Everything written since is in now, so only deletes can make the
+        # index bigger than the table
+        count = workouts.count()
+        if count < len(self):
+            existing = set(workouts.values_list("id", flat=True))
+            with self._lock:
+                gone = [workout_id for workout_id in self._rows if workout_id not in existing]
+            for workout_id in gone:
+                self.remove(workout_id)
+        if count != len(self):
+            return False
+        self.version, self.token, self.synced_at = stamp.version, versions.stamp_token(stamp), synced_at
+        return True
+
+    def add(self, workout):
+        """Insert or update ``workout``'s row."""
+        self._upsert([workout.pk], _pack(*feature_matrix([source_row(workout)])))
+
+    def _upsert(self, ids, packed):
+        with self._lock:
+            for workout_id, row in zip(ids, packed):
+                position = self._rows.get(workout_id)
+                if position is None:
+                    if self._size == len(self._ids):
+                        self._grow()
+                    position = self._size
+                    self._size += 1
+                    self._ids[position] = workout_id
+                    self._rows[workout_id] = position
+                self._packed[position] = row
+
+    def remove(self, workout_id):
+        """Drop a workout's row; the last row moves into its place."""
+        with self._lock:
+            position = self._rows.pop(workout_id, None)
+            if position is None:
+                return
+            last = self._size - 1
+            if position != last:
+                moved = int(self._ids[last])
+                self._ids[position] = moved
+                self._packed[position] = self._packed[last]
+                self._rows[moved] = position
+            self._size = last
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._ids))
+        ids = np.zeros(capacity, dtype=np.int64)
+        packed = np.zeros((capacity, self._packed.shape[1]))
+        ids[:self._size] = self._ids[:self._size]
+        packed[:self._size] = self._packed[:self._size]
+        self._ids, self._packed = ids, packed
+
+    def neighbors(self, workout_id, k=DEFAULT_NEIGHBORS):
+        """
+        [(workout id, distance)] for the ``k`` workouts nearest to
+        ``workout_id``, nearest first, or None if it isn't in the index.
+        Only features the query workout has count; a neighbour missing one
+        of them pays MISSING_PENALTY for it.
+        """
+        with self._lock:
+            position = self._rows.get(workout_id)
+            if position is None:
+                return None
+            n = self._size
+            k = min(k, n - 1)
+            if k <= 0:
+                return []
+            f = len(FEATURES)
+            query = self._packed[position]
+            q, present = query[f:2 * f], query[2 * f:]
+            # Per feature, with the query's value q: x^2 - 2qx + q^2 when the
+            # workout has it, MISSING_PENALTY when it doesn't
+            weights = np.concatenate([present, -2 * q, (q * q - MISSING_PENALTY) * present])
+            d2 = self._packed[:n] @ weights + MISSING_PENALTY * present.sum()
+            d2[position] = np.inf
+            nearest = np.argpartition(d2, k - 1)[:k]
+            nearest = nearest[np.argsort(d2[nearest], kind="stable")]
+            distances = np.sqrt(np.maximum(d2[nearest], 0.0))
+            return list(zip(self._ids[nearest].tolist(), distances.tolist()))
+
+    def save(self, path):
+        """Write the index to ``path`` (.npz), atomically."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".similarity-", suffix=".npz")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(
+                        f, ids=self._ids[:self._size], packed=self._packed[:self._size],
+                        version=self.version, token=self.token, features_version=FEATURES_VERSION,
+                        synced_at=self.synced_at.timestamp() if self.synced_at else np.nan,
+                    )
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    @classmethod
+    def load(cls, user_id, path):
+        """The index saved at ``path``, or None if there is none or it's from older features."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["features_version"]) != FEATURES_VERSION:
+                    return None
+                synced_at = float(data["synced_at"])
+                synced_at = None if math.isnan(synced_at) else datetime.fromtimestamp(synced_at, tz=dt_timezone.utc)
+                return cls(user_id, data["ids"], data["packed"], int(data["version"]), str(data["token"]), synced_at)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def index_path(user_id):
+    """Where the user's index is persisted, or None if SIMILARITY_INDEX_DIR isn't set."""
+    directory = getattr(settings, "SIMILARITY_INDEX_DIR", "")
+    return os.path.join(directory, f"{user_id}.npz") if directory else None
+
+
+def _remember(index):
+    with _indexes_lock:
+        _indexes[index.user_id] = index
+        _indexes.move_to_end(index.user_id)
+        while len(_indexes) > settings.SIMILARITY_MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+
+@metrics.timed("similarity_build")
+def build_index(user_id, stamp=None, save=True):
+    """Build the user's index from the database (and persist it if configured)."""
+    stamp = stamp or versions.get_stamp_for(user_id)
+    index = SimilarityIndex.build(user_id, stamp)
+    path = index_path(user_id)
+    if save and path:
+        index.save(path)
+    _remember(index)
+    return index
+
+
+def _loaded(user_id):
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+        return index
+
+
+def _build_lock(user_id):
+    with _indexes_lock:
+        return _build_locks.setdefault(user_id, threading.Lock())
+
+
+def get_index(user_id):
+    """
+    The user's index, current as of their WorkoutListVersion: the loaded
+    one, else the persisted one, caught up from the database if it's behind,
+    else a new build.
+    """
+    stamp = versions.get_stamp_for(user_id)
+    index = _loaded(user_id)
+    if index is not None and index.token == versions.stamp_token(stamp):
+        return index
+
+    with _build_lock(user_id):
+        # Whoever held the lock before us may have just brought it up to date
+        stamp = versions.get_stamp_for(user_id)
+        token = versions.stamp_token(stamp)
+        index = _loaded(user_id)
+        path = index_path(user_id)
+        if index is None and path:
+            index = SimilarityIndex.load(user_id, path)
+        if index is not None and (index.token == token or index.catch_up(stamp)):
+            _remember(index)
+            return index
+        return build_index(user_id, stamp)
+
+
+def _apply(user_id, change):
+    index = _loaded(user_id)
+    if index is None:
+        return
+    change(index)
+    # The caller just bumped the version; if that's the only change since
+    # the index was tagged, it is current again. Otherwise the next query
+    # catches it up.
+    stamp = versions.get_stamp_for(user_id)
+    if stamp.version == index.version + 1:
+        index.version, index.token = stamp.version, versions.stamp_token(stamp)
+
+
+def workout_saved(workout):
+    """Reflect a single saved workout in its user's index, if loaded here."""
+    _apply(workout.user_id, lambda index: index.add(workout))
+
+
+def workout_deleted(workout):
+    """Reflect a single deleted workout in its user's index, if loaded here."""
+    _apply(workout.user_id, lambda index: index.remove(workout.pk))
+
+
+def clear():
+    """Forget every loaded index (tests, benchmarks)."""
+    with _indexes_lock:
+        _indexes.clear()
+        _build_locks.clear()
@@ -0,0 +1,917 @@
+# training/strava.py
+"""
+Strava sync engine.
+
+Pages through an athlete's activities (everything on the first sync, only
+activities newer than the stored cursor afterwards) over a pooled HTTP
+session and upserts them into Workout in bulk.
+
+Syncs never run inside a web request: request_sync() queues one and the
+sync_strava management command works the queue. Strava also pushes
+activity changes to the webhook (views.strava_webhook); those events are
+queued the same way and each costs one API call for the affected activity,
+instead of a sync. The async OAuth helpers
+(aexchange_code, asave_token, arequest_sync) serve the async callback view
+over the shared httpx pool in training/http.py. Every API call is counted
+against Strava's 15-minute and daily quotas, both app-wide and per user, so
+one busy athlete can't use up the whole app's budget.
+
+Synced activities only carry summary numbers. StreamImporter backfills
+their per-second streams into the same sample columns and analytics as FIT
+uploads, a bounded number of requests at a time.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import dedup, http, rollups, versions
+from .analytics import compute_analytics
+from .metrics import span, timed
+from .models import StravaApiUsage, StravaSyncState, StravaToken, StravaWebhookEvent, Workout
+from .samples import samples_path_for, write_samples
+
+logger = logging.getLogger(__name__)
+
+M_PER_MILE = 1609.34
+PER_PAGE = 200  # Strava's maximum page size
+UPSERT_BATCH_SIZE = 500
+REQUEST_TIMEOUT = 30
+SYNC_POLL_INTERVAL = 5.0
+# A claimed sync that hasn't finished in this long is assumed dead
+STALE_SYNC_AFTER = timedelta(minutes=30)
+# Likewise a claimed webhook event (one activity fetch, so much shorter)
+STALE_EVENT_AFTER = timedelta(minutes=10)
+
+# Workout columns owned by Strava; refreshed on every sync, except on rows
+# with an uploaded file (see upsert_activities)
+SYNCED_FIELDS = [
+    "date", "started_at", "distance_miles", "duration_minutes", "avg_heart_rate", "avg_pace_min_per_mile",
+]
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """One keep-alive connection pool to Strava for the whole process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def api_url(path):
+    return f"{settings.STRAVA_API_BASE.rstrip('/')}/api/v3/{path.lstrip('/')}"
+
+
+def oauth_url(path="token"):
+    return f"{settings.STRAVA_API_BASE.rstrip('/')}/oauth/{path}"
+
+
+def parse_strava_datetime(value):
+    """'2025-08-01T07:00:00Z' -> aware datetime."""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=dt_timezone.utc)
+
+
+# ---------- Tokens ----------
+class StravaTokenManager:
+    """
+    Hands out valid access tokens, refreshing them through Strava's OAuth
+    endpoint when they are about to expire.
+
+    Tokens are cached in memory until ``refresh_margin`` before they expire,
+    so the common case touches neither the database nor Strava. Refreshes
+    are single-flight per user: the first caller refreshes while the others
+    wait on the user's lock and then reuse the new token. Strava rotates
+    refresh tokens, so two parallel refreshes would leave one caller holding
+    a dead token.
+    """
+
+    def __init__(self, refresh_margin=timedelta(minutes=5)):
+        self.refresh_margin = refresh_margin
+        self._tokens = {}  # user id -> (access token, expires_at)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, user_id):
+        with self._locks_lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def _fresh(self, expires_at):
+        return expires_at - self.refresh_margin > timezone.now()
+
+    def _cached(self, user_id):
+        cached = self._tokens.get(user_id)
+        if cached and self._fresh(cached[1]):
+            return cached[0]
+        return None
+
+    def get_access_token(self, user):
+        """A valid access token for ``user``, or None if they haven't connected Strava."""
+        access_token = self._cached(user.pk)
+        if access_token:
+            return access_token
+
+        with self._lock_for(user.pk):
+            # Whoever held the lock before us may have just refreshed
+            access_token = self._cached(user.pk)
+            if access_token:
+                return access_token
+
+            token = StravaToken.objects.filter(user_id=user.pk).first()
+            if token is None:
+                return None
+            if not self._fresh(token.expires_at):
+                token = self._refresh(token)
+            self._tokens[user.pk] = (token.access_token, token.expires_at)
+            return token.access_token
+
+    def _refresh(self, token):
+        with span("strava.oauth"):
+            res = get_session().post(oauth_url("token"), data={
+                "client_id": settings.STRAVA_CLIENT_ID,
+                "client_secret": settings.STRAVA_CLIENT_SECRET,
+                "grant_type": "refresh_token",
+                "refresh_token": token.refresh_token,
+            }, timeout=REQUEST_TIMEOUT)
+        res.raise_for_status()
+        data = res.json()
+        token.access_token = data["access_token"]
+        token.refresh_token = data["refresh_token"]
+        token.expires_at = datetime.fromtimestamp(data["expires_at"], tz=dt_timezone.utc)
+        token.save(update_fields=["access_token", "refresh_token", "expires_at"])
+        return token
+
+    @staticmethod
+    def _token_fields(data):
+        return {
+            "access_token": data["access_token"],
+            "refresh_token": data["refresh_token"],
+            "expires_at": datetime.fromtimestamp(data["expires_at"], tz=dt_timezone.utc),
+            "athlete_id": str(data.get("athlete", {}).get("id", "")),
+        }
+
+    def save_token(self, user, data):
+        """Store the token response from the OAuth code exchange."""
+        with self._lock_for(user.pk):
+            token, _ = StravaToken.objects.update_or_create(user=user, defaults=self._token_fields(data))
+            self._tokens[user.pk] = (token.access_token, token.expires_at)
+        return token
+
+    async def asave_token(self, user, data):
+        """
+        save_token() for async views. A code exchange always yields a brand
+        new token, so this doesn't wait on the per-user refresh lock.
+        """
+        token, _ = await StravaToken.objects.aupdate_or_create(user=user, defaults=self._token_fields(data))
+        self._tokens[user.pk] = (token.access_token, token.expires_at)
+        return token
+
+    def invalidate(self, user):
+        """Forget the cached token, e.g. after Strava rejected it."""
+        self._tokens.pop(user.pk, None)
+
+    def clear(self):
+        self._tokens.clear()
+
+
+token_manager = StravaTokenManager()
+
+
+def get_access_token(user):
+    """The user's Strava access token, refreshed first if it is about to expire. None if not connected."""
+    return token_manager.get_access_token(user)
+
+
+@timed("strava.oauth")
+async def aexchange_code(code):
+    """Trade an OAuth authorization code for tokens. Returns Strava's JSON response."""
+    res = await http.get_async_client().post(oauth_url("token"), data={
+        "client_id": settings.STRAVA_CLIENT_ID,
+        "client_secret": settings.STRAVA_CLIENT_SECRET,
+        "code": code,
+        "grant_type": "authorization_code",
+    })
+    return res.json()
+
+
+# ---------- Rate limits ----------
+class StravaRateLimited(Exception):
+    def __init__(self, scope, retry_at):
+        super().__init__(f"Strava rate limit reached for {scope}, retry at {retry_at:%H:%M:%S}")
+        self.scope = scope
+        self.retry_at = retry_at
+
+
+def _windows(now):
+    """(period, window start, next window start) for the 15-minute and daily quotas."""
+    quarter = now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        (StravaApiUsage.FIFTEEN_MINUTES, quarter, quarter + timedelta(minutes=15)),
+        (StravaApiUsage.DAILY, day, day + timedelta(days=1)),
+    ]
+
+
+def _limits(scope):
+    if scope == "app":
+        return {
+            StravaApiUsage.FIFTEEN_MINUTES: settings.STRAVA_RATE_LIMIT_15MIN,
+            StravaApiUsage.DAILY: settings.STRAVA_RATE_LIMIT_DAILY,
+        }
+    return {
+        StravaApiUsage.FIFTEEN_MINUTES: settings.STRAVA_USER_RATE_LIMIT_15MIN,
+        StravaApiUsage.DAILY: settings.STRAVA_USER_RATE_LIMIT_DAILY,
+    }
+
+
+def _take(scope, now):
+    """
+    Count one call against ``scope`` in every window, or raise
+    StravaRateLimited without counting anything. Each increment is a
+    conditional UPDATE so concurrent workers can't overshoot the limit.
+    """
+    limits = _limits(scope)
+    taken = []
+    for period, start, reset_at in _windows(now):
+        row, _ = StravaApiUsage.objects.get_or_create(scope=scope, period=period, window_start=start)
+        ok = StravaApiUsage.objects.filter(pk=row.pk, count__lt=limits[period]).update(count=F("count") + 1)
+        if not ok:
+            StravaApiUsage.objects.filter(pk__in=taken).update(count=F("count") - 1)
+            raise StravaRateLimited(scope, reset_at)
+        taken.append(row.pk)
+    return taken
+
+
+def acquire_api_call(user):
+    """Reserve one API call for ``user`` against the per-user and app-wide quotas."""
+    now = timezone.now()
+    user_rows = _take(f"user:{user.pk}", now)
+    try:
+        _take("app", now)
+    except StravaRateLimited:
+        StravaApiUsage.objects.filter(pk__in=user_rows).update(count=F("count") - 1)
+        raise
+
+
+def record_usage_headers(response, now=None):
+    """
+    Strava reports the app's real usage in X-RateLimit-Usage ("15min,daily").
+    Catch our app-wide counters up with it, e.g. after a restart or when
+    other processes share the same API application.
+    """
+    header = response.headers.get("X-RateLimit-Usage")
+    if not header:
+        return
+    try:
+        usage = [int(v) for v in header.split(",")[:2]]
+    except ValueError:
+        return
+    for (period, start, _), used in zip(_windows(now or timezone.now()), usage):
+        StravaApiUsage.objects.get_or_create(scope="app", period=period, window_start=start)
+        StravaApiUsage.objects.filter(
+            scope="app", period=period, window_start=start, count__lt=used,
+        ).update(count=used)
+
+
+def api_get(user, path, access_token, **params):
+    """Rate-limited GET against the Strava v3 API."""
+    if user is not None:
+        acquire_api_call(user)
+    res = _send(path, access_token, params)
+    _check_response(user, res)
+    return res.json()
+
+
+def _send(path, access_token, params):
+    # Just the HTTP call: no database access, so it can run on a worker thread
+    with span("strava.api"):
+        return get_session().get(
+            api_url(path), headers={"Authorization": f"Bearer {access_token}"},
+            params=params, timeout=REQUEST_TIMEOUT,
+        )
+
+
+def _check_response(user, res):
+    """Usage bookkeeping for a response; raises on errors (StravaRateLimited on 429)."""
+    record_usage_headers(res)
+    if res.status_code == 401 and user is not None:
+        token_manager.invalidate(user)
+    if res.status_code == 429:
+        raise StravaRateLimited("app", _windows(timezone.now())[0][2])
+    res.raise_for_status()
+
+
+def iter_activities(access_token, after=None, per_page=PER_PAGE, user=None):
+    """
+    Yield pages (lists) of activity summaries, oldest first when ``after``
+    (epoch seconds) is given, until Strava returns an empty page. Calls are
+    counted against ``user``'s rate-limit budget.
+    """
+    page = 1
+    while True:
+        params = {"per_page": per_page, "page": page}
+        if after is not None:
+            params["after"] = int(after)
+        activities = api_get(user, "athlete/activities", access_token, **params)
+        if not activities:
+            return
+        yield activities
+        if len(activities) < per_page:
+            return
+        page += 1
+
+
+def workout_from_activity(user, act):
+    distance = act.get("distance") or 0
+    moving_time = act.get("moving_time") or 0
+    return Workout(
+        user=user,
+        strava_id=act["id"],
+        date=parse_strava_datetime(act.get("start_date_local")) or timezone.now(),
+        started_at=parse_strava_datetime(act.get("start_date")),
+        distance_miles=round(distance / M_PER_MILE, 2),  # meters → miles
+        duration_minutes=round(moving_time / 60, 2),  # seconds → minutes
+        avg_heart_rate=act.get("average_heartrate"),
+        avg_pace_min_per_mile=(
+            round((moving_time / 60) / (distance / M_PER_MILE), 2)
+            if distance and moving_time else None
+        ),
+    )
+
+
+def link_uploads(user, workouts):
+    """
+    Give FIT-uploaded workouts of the same run the activity's strava_id, so
+    the upsert that follows updates them rather than adding a duplicate.
+    Activities already in the table are left to the upsert.
+    """
+    ids = [w.strava_id for w in workouts]
+    known = set(Workout.objects.filter(strava_id__in=ids).values_list("strava_id", flat=True))
+    matched = dedup.match_uploads_to_activities(user, [w for w in workouts if w.strava_id not in known])
+    for strava_id, upload in matched.items():
+        Workout.objects.filter(pk=upload.pk).update(strava_id=strava_id, updated_at=timezone.now())
+    return len(matched)
+
+
+def upsert_activities(user, activities, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Insert or update Workouts for Strava activity dicts in one statement per
+    batch (INSERT ... ON CONFLICT (strava_id) DO UPDATE).
+
+    Rows with an uploaded FIT file (including uploads link_uploads just
+    matched) are left alone: their summary comes from the file, which is
+    the better record of the run.
+    """
+    workouts = [workout_from_activity(user, act) for act in activities if act.get("id")]
+    if not workouts:
+        return 0
+    link_uploads(user, workouts)
+    stored = list(
+        Workout.objects.filter(strava_id__in=[w.strava_id for w in workouts])
+        .values_list("strava_id", "date", "file_path")
+    )
+    with_files = {strava_id for strava_id, _, file_path in stored if file_path}
+    # Dates the update may move rows away from
+    old_dates = [day for _, day, file_path in stored if not file_path]
+    synced = [w for w in workouts if w.strava_id not in with_files]
+    Workout.objects.bulk_create(
+        synced,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["strava_id"],
+        update_fields=SYNCED_FIELDS + ["updated_at"],
+    )
+    # Rows may have been inserted, updated or moved, so re-derive the touched periods
+    rollups.refresh_periods(user, [w.date for w in synced] + old_dates)
+    versions.bump([user.pk])
+    return len(workouts)
+
+
+def sync_strava_activities(user, access_token=None, full=False):
+    """
+    Sync the user's Strava history into Workout. Incremental by default:
+    only activities that started after the stored cursor are fetched.
+    Returns the number of activities upserted. Raises StravaRateLimited if
+    the user's or the app's quota runs out; upserts are idempotent, so the
+    sync can simply be retried later.
+    """
+    access_token = access_token or get_access_token(user)
+    if not access_token:
+        return 0
+
+    state, _ = StravaSyncState.objects.get_or_create(user=user)
+    after = None
+    if state.last_activity_at and not full:
+        after = state.last_activity_at.timestamp()
+
+    count = 0
+    newest = state.last_activity_at
+    for page in iter_activities(access_token, after=after, user=user):
+        count += upsert_activities(user, page)
+        for act in page:
+            started = parse_strava_datetime(act.get("start_date"))
+            if started and (newest is None or started > newest):
+                newest = started
+
+    state.last_activity_at = newest
+    state.last_synced_at = timezone.now()
+    state.activities_synced += count
+    state.save()
+    logger.info("Synced %d Strava activities for %s", count, user)
+    return count
+
+
+# ---------- Activity streams ----------
+# Strava stream -> sample column ("time" becomes the timestamp column)
+STREAM_COLUMNS = {
+    "distance": "distance",
+    "velocity_smooth": "speed",
+    "heartrate": "heart_rate",
+    "cadence": "cadence",
+    "altitude": "altitude",
+}
+STREAM_KEYS = ",".join(["time", *STREAM_COLUMNS, "latlng"])
+STREAMS_BATCH_SIZE = 100
+# How long to leave the backfill alone after Strava errored or was unreachable
+STREAMS_RETRY_AFTER = timedelta(minutes=5)
+
+
+class UndecodableStreams(Exception):
+    """An activity's streams response can't be read as streams; fetching it again won't help."""
+
+
+def streams_samples_path(workout):
+    """Samples directory for a Strava workout that has no uploaded file."""
+    return samples_path_for(f"uploads/strava/{workout.user_id}/{workout.strava_id}")
+
+
+def columns_from_streams(streams, started_at):
+    """
+    Sample columns, laid out like parse_fit_samples() returns them, from an
+    activity's streams (the key_by_type dict or Strava's plain list). None
+    if there is no time stream, e.g. for a manual entry. A missing stream,
+    or one whose length doesn't match the time stream, becomes all NaN.
+    """
+    if isinstance(streams, list):
+        streams = {stream.get("type"): stream for stream in streams}
+    elapsed = (streams.get("time") or {}).get("data")
+    if not elapsed or started_at is None:
+        return None
+    n = len(elapsed)
+    columns = {"timestamp": int(started_at.timestamp()) + np.asarray(elapsed, dtype=np.int64)}
+    for key, name in STREAM_COLUMNS.items():
+        columns[name] = _stream_values(streams, key, (n,))
+    latlng = _stream_values(streams, "latlng", (n, 2))
+    columns["position_lat"] = latlng[:, 0]
+    columns["position_long"] = latlng[:, 1]
+    return columns
+
+
+def _stream_values(streams, key, shape):
+    data = (streams.get(key) or {}).get("data")
+    if data and len(data) == shape[0]:
+        try:
+            values = np.array(data, dtype=np.float64)  # nulls become NaN
+        except (TypeError, ValueError):
+            values = None
+        if values is not None and values.shape == shape:
+            return values
+    return np.full(shape, np.nan)
+
+
+def _fetch_streams(workout, access_token):
+    """
+    Runs on the import pool: fetch one activity's streams and, if there are
+    any, write its sample files and derive the analytics. No database access.
+    Returns (response, (samples_path, analytics) or None).
+    """
+    res = _send(f"activities/{workout.strava_id}/streams", access_token, {"keys": STREAM_KEYS, "key_by_type": "true"})
+    if res.status_code != 200:
+        return res, None
+    try:
+        columns = columns_from_streams(res.json(), workout.started_at or workout.date)
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+        raise UndecodableStreams(str(e)) from e
+    if columns is None:
+        return res, None
+    samples_path = write_samples(streams_samples_path(workout), columns)
+    return res, (samples_path, compute_analytics(columns))
+
+
+def pending_streams(user=None):
+    """
+    Strava workouts whose streams haven't been imported and that have no
+    uploaded samples. Users without a Strava token (never connected, or
+    deauthorized) are left out: there's no way to fetch theirs, and their
+    rows would otherwise be re-read and rejected on every worker poll.
+    """
+    workouts = Workout.objects.filter(
+        strava_id__isnull=False, samples_path__isnull=True, streams_imported_at__isnull=True,
+        user__strava_token__isnull=False,
+    )
+    if user is not None:
+        workouts = workouts.filter(user=user)
+    return workouts
+
+
+class StreamImporter:
+    """
+    Gives Strava-imported workouts the same per-record samples and analytics
+    as FIT uploads, from each activity's streams.
+
+    The HTTP calls, sample files and analytics run on a pool of ``workers``
+    threads; everything that touches the database (rate-limit accounting,
+    tokens, saving results) stays on the calling thread. Every call is
+    reserved with acquire_api_call() before it is submitted: a user who runs
+    out of quota is skipped for the rest of the run, and the app-wide limit
+    (or a 429, a 5xx, a failed request, or any error writing the samples or
+    computing the analytics) stops the run and sets ``retry_at``. Only a
+    response body that can't be decoded as streams is given up on. A workout is only marked done (streams_imported_at) once
+    its result is saved, so a run that stops or crashes part way picks up
+    where it left off and never refetches a finished activity.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or settings.STRAVA_STREAMS_WORKERS
+        self.imported = 0  # workouts that got samples
+        self.skipped = 0  # done, but nothing to import (no streams, activity gone)
+        self.failed = 0  # left for a later run
+        self.retry_at = None
+        self._skip_users = set()
+        self._touched_users = set()
+        self._in_flight = {}
+
+    def run(self, workouts, limit=None):
+        """Import streams for ``workouts`` (a queryset), at most ``limit`` of them. Returns self."""
+        submitted = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while self.retry_at is None and (limit is None or submitted < limit):
+                batch = list(
+                    workouts.filter(pk__gt=last_pk).exclude(user_id__in=self._skip_users)
+                    .select_related("user").order_by("pk")[:STREAMS_BATCH_SIZE]
+                )
+                if not batch:
+                    break
+                for workout in batch:
+                    last_pk = workout.pk
+                    if self.retry_at is not None or (limit is not None and submitted >= limit):
+                        break
+                    if workout.user_id in self._skip_users:
+                        continue
+                    access_token = self._reserve(workout)
+                    if access_token is None:
+                        continue
+                    self._in_flight[pool.submit(_fetch_streams, workout, access_token)] = workout
+                    submitted += 1
+                    self._collect(self.workers - 1)
+            self._collect(0)
+        if self._touched_users:
+            versions.bump(self._touched_users)
+        return self
+
+    def _reserve(self, workout):
+        """An access token with one API call reserved for ``workout``, or None to skip it."""
+        try:
+            access_token = get_access_token(workout.user)
+        except requests.RequestException:
+            logger.exception("Couldn't refresh the Strava token for %s", workout.user)
+            access_token = None
+        if not access_token:
+            self._skip_users.add(workout.user_id)
+            return None
+        try:
+            acquire_api_call(workout.user)
+        except StravaRateLimited as e:
+            self._rate_limited(workout, e)
+            return None
+        return access_token
+
+    def _rate_limited(self, workout, e):
+        if e.scope == "app":
+            self.retry_at = e.retry_at
+        else:
+            self._skip_users.add(workout.user_id)
+
+    def _back_off(self):
+        self.failed += 1
+        if self.retry_at is None:
+            self.retry_at = timezone.now() + STREAMS_RETRY_AFTER
+
+    def _collect(self, max_in_flight):
+        while len(self._in_flight) > max_in_flight:
+            done, _ = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._save(self._in_flight.pop(future), future)
+
+    def _save(self, workout, future):
+        try:
+            res, result = future.result()
+            _check_response(workout.user, res)
+        except StravaRateLimited as e:
+            self._rate_limited(workout, e)
+            self.failed += 1
+            return
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            if status == 401:  # access revoked
+                self._skip_users.add(workout.user_id)
+                self.failed += 1
+                return
+            if status >= 500:
+                self._back_off()
+                return
+            result = None  # deleted or made private since the sync
+        except requests.RequestException:
+            # Network errors, but also a bad STRAVA_API_BASE (MissingSchema, InvalidURL)
+            logger.warning("Strava streams request for activity %s failed", workout.strava_id, exc_info=True)
+            self._back_off()
+            return
+        except UndecodableStreams:
+            logger.exception("Couldn't decode streams for Strava activity %s", workout.strava_id)
+            result = None  # don't fetch it again
+        except Exception:
+            # e.g. OSError writing the samples or a bug in the analytics: the
+            # data may be fine, so try again later
+            logger.exception("Couldn't save streams for Strava activity %s", workout.strava_id)
+            self._back_off()
+            return
+
+        now = timezone.now()
+        fields = {"streams_imported_at": now, "updated_at": now}
+        if result is None:
+            self.skipped += 1
+        else:
+            fields["samples_path"], fields["analytics"] = result
+            self.imported += 1
+            self._touched_users.add(workout.user_id)
+        # An upload attached meanwhile keeps its own samples
+        Workout.objects.filter(pk=workout.pk, samples_path__isnull=True).update(**fields)
+
+
+def import_streams(user=None, workers=None, limit=None):
+    """Import streams for pending Strava workouts (all users by default). Returns the StreamImporter."""
+    return StreamImporter(workers).run(pending_streams(user), limit)
+
+
+# ---------- Sync queue ----------
+def _requestable(when):
+    """
+    Sync states a request at ``when`` moves: none queued, one queued later,
+    or one already claimed by a running sync. The running sync won't see
+    activities arriving now, so the request moves past sync_started_at and
+    run_sync leaves it queued.
+    """
+    return (
+        Q(sync_requested_at__isnull=True) | Q(sync_requested_at__gt=when)
+        | Q(sync_started_at__isnull=False, sync_requested_at__lte=F("sync_started_at"))
+    )
+
+
+def request_sync(user, when=None):
+    """Queue a sync for ``user`` (no-op if one is already queued earlier)."""
+    when = when or timezone.now()
+    state, created = StravaSyncState.objects.get_or_create(user=user, defaults={"sync_requested_at": when})
+    if not created:
+        StravaSyncState.objects.filter(pk=state.pk).filter(_requestable(when)).update(sync_requested_at=when)
+
+
+async def arequest_sync(user, when=None):
+    """request_sync() for async views."""
+    when = when or timezone.now()
+    state, created = await StravaSyncState.objects.aget_or_create(user=user, defaults={"sync_requested_at": when})
+    if not created:
+        await StravaSyncState.objects.filter(pk=state.pk).filter(_requestable(when)).aupdate(sync_requested_at=when)
+
+
+def schedule_all_syncs():
+    """Queue a sync for every user with a Strava connection. Returns the count."""
+    users = StravaToken.objects.values_list("user_id", flat=True)
+    now = timezone.now()
+    for user_id in users:
+        StravaSyncState.objects.get_or_create(user_id=user_id)
+    return StravaSyncState.objects.filter(user_id__in=users, sync_requested_at__isnull=True).update(
+        sync_requested_at=now,
+    )
+
+
+def claim_due_sync():
+    """Claim the oldest due sync (same conditional-UPDATE pattern as jobs.claim_next_job)."""
+    now = timezone.now()
+    stale = now - STALE_SYNC_AFTER
+    due = StravaSyncState.objects.filter(sync_requested_at__lte=now).filter(
+        Q(sync_started_at__isnull=True) | Q(sync_started_at__lt=stale),
+    )
+    while True:
+        state = due.order_by("sync_requested_at").select_related("user").first()
+        if state is None:
+            return None
+        claimed = StravaSyncState.objects.filter(
+            pk=state.pk, sync_started_at=state.sync_started_at,
+        ).update(sync_started_at=now)
+        if claimed:
+            state.sync_started_at = now
+            return state
+
+
+def _finish_sync(state, last_error):
+    # Dequeue only the request this run claimed; one that came in meanwhile
+    # (see _requestable) stays queued for another run
+    finished = StravaSyncState.objects.filter(pk=state.pk)
+    if not finished.filter(sync_requested_at=state.sync_requested_at).update(
+        sync_requested_at=None, sync_started_at=None, last_error=last_error,
+    ):
+        finished.update(sync_started_at=None, last_error=last_error)
+
+
+def run_sync(state):
+    """Run a claimed sync. Rate-limited syncs are re-queued for when the window resets."""
+    user = state.user
+    try:
+        sync_strava_activities(user)
+    except StravaRateLimited as e:
+        logger.info("%s; deferring sync for %s", e, user)
+        StravaSyncState.objects.filter(pk=state.pk).update(
+            sync_requested_at=e.retry_at, sync_started_at=None, last_error=str(e),
+        )
+        return False
+    except Exception as e:
+        logger.exception("Strava sync failed for %s", user)
+        _finish_sync(state, str(e))
+        return False
+    _finish_sync(state, "")
+    return True
+
+
+def run_due_syncs(limit=None):
+    """Work the sync queue until nothing is due. Returns the number of syncs run."""
+    done = 0
+    while limit is None or done < limit:
+        state = claim_due_sync()
+        if state is None:
+            break
+        run_sync(state)
+        done += 1
+    return done
+
+
+# ---------- Webhook events ----------
+def enqueue_webhook_event(payload):
+    """
+    Store an event from the webhook. Redeliveries of an event already stored
+    are ignored. Raises KeyError / TypeError / ValueError on a malformed payload.
+    """
+    event = StravaWebhookEvent(
+        object_type=str(payload["object_type"]),
+        object_id=int(payload["object_id"]),
+        aspect_type=str(payload["aspect_type"]),
+        owner_id=int(payload["owner_id"]),
+        event_time=int(payload["event_time"]),
+        updates=payload.get("updates") or {},
+    )
+    StravaWebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
+
+
+def claim_next_event():
+    """
+    Claim the oldest queued event that is due, or one whose worker died
+    mid-event (conditional UPDATE, as in claim_due_sync).
+    """
+    now = timezone.now()
+    stale = now - STALE_EVENT_AFTER
+    due = StravaWebhookEvent.objects.filter(
+        Q(status=StravaWebhookEvent.QUEUED) & (Q(available_at__isnull=True) | Q(available_at__lte=now))
+        | Q(status=StravaWebhookEvent.PROCESSING, updated_at__lt=stale),
+    )
+    while True:
+        event = due.order_by("created_at", "id").first()
+        if event is None:
+            return None
+        claimed = StravaWebhookEvent.objects.filter(
+            pk=event.pk, status=event.status, updated_at=event.updated_at,
+        ).update(status=StravaWebhookEvent.PROCESSING, updated_at=now)
+        if claimed:
+            event.status = StravaWebhookEvent.PROCESSING
+            return event
+
+
+def remove_activity(user, strava_id):
+    """
+    Drop a deleted Strava activity. A workout that also has an uploaded FIT
+    file stays, just unlinked from Strava. Safe to repeat.
+    """
+    for workout in Workout.objects.filter(user=user, strava_id=strava_id):
+        if workout.content_hash:
+            Workout.objects.filter(pk=workout.pk).update(strava_id=None, updated_at=timezone.now())
+            versions.bump([user.pk])
+        else:
+            workout.delete()
+
+
+def _access_revoked(user, access_token):
+    """True if Strava turns the user's token away (401), i.e. the athlete revoked our access."""
+    try:
+        api_get(user, "athlete", access_token)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 401:
+            return True
+        raise
+    return False
+
+
+def apply_event(event):
+    """
+    Bring the database in line with one webhook event. The webhook isn't
+    authenticated beyond its subscription id, so events are only hints:
+    every kind fetches that activity by id and upserts it on strava_id,
+    removing it only if Strava answers 404, and a deauthorization drops the
+    token only once Strava refuses it. Replaying an event (or processing a
+    create after its update) changes nothing.
+    """
+    token = StravaToken.objects.filter(athlete_id=str(event.owner_id)).select_related("user").first()
+    if token is None:
+        return  # not (or no longer) connected
+    user = token.user
+    if event.object_type not in ("athlete", "activity"):
+        return
+    access_token = get_access_token(user)
+    if not access_token:
+        return
+
+    if event.object_type == "athlete":
+        if str(event.updates.get("authorized", "")).lower() == "false" and _access_revoked(user, access_token):
+            token.delete()
+            token_manager.invalidate(user)
+        return
+    try:
+        activity = api_get(user, f"activities/{event.object_id}", access_token)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            remove_activity(user, event.object_id)  # deleted (or made private) since
+            return
+        raise
+    upsert_activities(user, [activity])
+
+
+def process_event(event):
+    """Apply a claimed event. Rate-limited events go back on the queue for the next window."""
+    try:
+        apply_event(event)
+    except StravaRateLimited as e:
+        logger.info("%s; deferring Strava event %s", e, event.pk)
+        StravaWebhookEvent.objects.filter(pk=event.pk).update(
+            status=StravaWebhookEvent.QUEUED, available_at=e.retry_at, error=str(e),
+        )
+        return False
+    except Exception as e:
+        logger.exception("Strava event %s failed", event.pk)
+        StravaWebhookEvent.objects.filter(pk=event.pk).update(status=StravaWebhookEvent.FAILED, error=str(e))
+        return False
+    StravaWebhookEvent.objects.filter(pk=event.pk).update(status=StravaWebhookEvent.DONE, error="")
+    return True
+
+
+def run_pending_events(limit=None):
+    """Work the webhook event queue until nothing is due. Returns the number of events handled."""
+    done = 0
+    while limit is None or done < limit:
+        event = claim_next_event()
+        if event is None:
+            break
+        process_event(event)
+        done += 1
+    return done
+
+
+def run_sync_worker(poll_interval=SYNC_POLL_INTERVAL):
+    """
+    Worker loop: handle webhook events and due syncs, then import a batch
+    of activity streams, sleep when idle, repeat.
+    """
+    streams_due = None
+    while True:
+        busy = run_pending_events() + run_due_syncs()
+        if streams_due is None or timezone.now() >= streams_due:
+            importer = import_streams(limit=STREAMS_BATCH_SIZE)
+            busy += importer.imported + importer.skipped
+            streams_due = importer.retry_at
+        if not busy:
+            time.sleep(poll_interval)
@@ -0,0 +1,28 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def clock(seconds):
+    """Seconds -> "m:ss" (or "h:mm:ss"); "-" for missing values."""
+    if seconds is None or seconds == "":
+        return "-"
+    total = int(round(float(seconds)))
+    hours, rest = divmod(total, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+@register.filter
+def zone_rows(hr_zones):
+    """[(label, seconds), ...] for the analytics["hr_zones"] dict."""
+    if not hr_zones:
+        return []
+    bounds = [int(b) for b in hr_zones["bounds"]]
+    labels = [f"Z1 (<{bounds[0]})"]
+    labels += [f"Z{i + 2} ({lo}–{hi})" for i, (lo, hi) in enumerate(zip(bounds, bounds[1:]))]
+    labels.append(f"Z{len(bounds) + 1} ({bounds[-1]}+)")
+    return list(zip(labels, hr_zones["seconds"]))
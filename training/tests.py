@@ -1,3 +1,2057 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import load_handler
+from django.http.multipartparser import MultiPartParser
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from fitparse import FitFile
+from fitparse.utils import FitCRCError, FitEOFError, FitParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import batch, jobs, metrics, rollups, series, services, similarity, strava, versions
+from .analytics import compute_analytics
+from . import benchmarks
+from .benchmarks import _seed_workouts, analytics_naive, lttb_naive, parse_fit_two_pass, similar_brute_force
+from .fake_openai import FakeOpenAI
+from .fake_strava import FakeStrava, make_activities
+from .fit_synth import build_fit
+from .fit_utils import (
+    CRC_LANES_MIN_BYTES, PROBE_BYTES, file_crc, fit_crc, parse_fit, parse_fit_samples, probe_fit, probe_fit_safe,
+)
+from .models import (
+    StravaApiUsage, StravaSyncState, StravaToken, StravaWebhookEvent, UploadJob, Workout, WorkoutInsight,
+    WorkoutRollup,
+)
+from .pagination import WorkoutCursorPagination as Pagination
+from .samples import write_samples
+from .serializers import WORKOUT_VALUES, WorkoutSerializer, serialize_workout_rows
+from .views import DASHBOARD_PAGE_SIZE
+from .uploads import FitUploadHandler, StoredFitFile
+
+User = get_user_model()
+
+
+class MediaRootMixin:
+    """Point MEDIA_ROOT at a throwaway directory for the test."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ProbeFitTests(SimpleTestCase):
+    def test_reads_header_and_file_id(self):
+        data = build_fit(duration_s=600, start=datetime(2025, 3, 1, 6, 30, tzinfo=dt_timezone.utc))
+        probe = probe_fit(data, len(data))
+        self.assertEqual(probe["header_size"], 14)
+        self.assertEqual(probe["file_size"], len(data))
+        self.assertEqual((probe["manufacturer"], probe["product"], probe["serial_number"]), (1, 3415, 123456789))
+        self.assertEqual(probe["time_created"].isoformat(), "2025-03-01T06:40:00+00:00")
+        self.assertEqual(probe["fit_file_id"], f"1-3415-123456789-{int(probe['time_created'].timestamp()) - 631065600}")
+
+        # Only the head is needed, and a 12-byte header (no CRC) works too
+        self.assertEqual(probe_fit(data[:PROBE_BYTES], len(data)), probe)
+        legacy = bytes([12]) + data[1:12] + data[14:]
+        self.assertEqual(probe_fit(legacy, len(legacy))["fit_file_id"], probe["fit_file_id"])
+
+    def test_rejects(self):
+        data = build_fit(duration_s=60)
+        bad_crc = data[:12] + bytes([data[12] ^ 1]) + data[13:]
+        self.assertRaises(FitCRCError, probe_fit, bad_crc)
+        self.assertRaises(FitEOFError, probe_fit, data[:-1], len(data) - 1)
+        file_id_end = 14 + (6 + 3 * 5) + (1 + 13)  # header, file_id definition, file_id message
+        no_file_id = data[:14] + data[file_id_end:]
+        self.assertRaisesRegex(FitParseError, "file_id", probe_fit, no_file_id)
+        course = bytearray(data)
+        course[14 + 6 + 3 * 5 + 1] = 6  # file_id.type = course
+        self.assertRaisesRegex(FitParseError, "activity", probe_fit, bytes(course))
+
+    def test_fuzz(self):
+        rng = np.random.default_rng(23)
+        data = build_fit(duration_s=60)
+        blobs = [bytes(rng.integers(0, 256, n, dtype=np.uint8)) for n in (0, 1, 11, 12, 14, 64, 2048) for _ in range(40)]
+        # Garbage behind a valid header, and every truncation of the file
+        blobs += [data[:14] + bytes(rng.integers(0, 256, 200, dtype=np.uint8)) for _ in range(200)]
+        blobs += [data[:n] for n in range(len(data))]
+        for blob in blobs:
+            probe, error = probe_fit_safe(blob, len(blob))  # never raises
+            self.assertTrue(probe is None and error, blob[:40])
+        # Any single bit flip in the header is caught by its CRC
+        for pos in range(14):
+            for bit in range(8):
+                flipped = bytearray(data)
+                flipped[pos] ^= 1 << bit
+                self.assertIsNone(probe_fit_safe(flipped, len(flipped))[0], (pos, bit))
+        # Flips further in either still parse as a file_id or fail cleanly
+        for pos in range(14, 14 + 40):
+            flipped = bytearray(data)
+            flipped[pos] ^= 0xFF
+            probe_fit_safe(flipped, len(flipped))
+
+    def test_benchmark(self):
+        (row,) = benchmarks.bench_probe(sizes={"2h": 2 * 3600}, repeat=3, calls=100)
+        self.assertLess(row["seconds"], 0.001)
+        self.assertLess(row["reject_seconds"], 0.001)
+        self.assertGreater(row["speedup"], 20)
+
+
+class ParseFitTests(SimpleTestCase):
+    def test_matches_two_pass_parser(self):
+        for kwargs in ({}, {"session_hr": False}, {"with_hr": False}, {"interval_s": 5}):
+            data = build_fit(duration_s=900, **kwargs)
+            self.assertEqual(parse_fit(io.BytesIO(data)), parse_fit_two_pass(io.BytesIO(data)), kwargs)
+
+    def test_session_totals(self):
+        metrics = parse_fit(io.BytesIO(build_fit(duration_s=3600, pace_min_per_mile=8.0)))
+        self.assertEqual(metrics["date"], date(2025, 8, 1))
+        self.assertEqual(metrics["duration_minutes"], 60.0)
+        self.assertAlmostEqual(metrics["distance_miles"], 7.5, delta=0.05)
+        self.assertAlmostEqual(metrics["avg_pace_min_per_mile"], 8.0, delta=0.05)
+        self.assertIsNotNone(metrics["avg_heart_rate"])
+
+    def test_falls_back_to_records_without_session(self):
+        data = build_fit(duration_s=1200)
+        with_session = parse_fit(io.BytesIO(data))
+        without = parse_fit(io.BytesIO(build_fit(duration_s=1200, with_session=False)))
+        self.assertEqual(without, with_session)
+
+    def test_samples_come_from_the_same_pass(self):
+        data = build_fit(duration_s=600, interval_s=2, session_hr=False)
+        metrics, columns = parse_fit_samples(io.BytesIO(data))
+        self.assertEqual(metrics, parse_fit(io.BytesIO(data)))
+        self.assertEqual(len(columns["timestamp"]), 301)
+        self.assertEqual(columns["timestamp"][0], 1754049600)  # 2025-08-01 12:00 UTC
+        self.assertEqual(columns["timestamp"][-1] - columns["timestamp"][0], 600)
+        self.assertEqual(set(columns["cadence"]), {85.0})
+        self.assertAlmostEqual(columns["distance"][-1] / 1609.344, metrics["distance_miles"], places=2)
+        self.assertTrue(all(-90 <= lat <= 90 for lat in columns["position_lat"]))
+
+        _, without_hr = parse_fit_samples(io.BytesIO(build_fit(duration_s=60, with_hr=False)))
+        self.assertTrue(all(hr != hr for hr in without_hr["heart_rate"]))  # all NaN
+
+    def test_matches_fitparse_on_compressed_timestamps_and_developer_fields(self):
+        for kwargs in (
+            {"compressed_timestamps": True},
+            {"developer_fields": True},
+            {"compressed_timestamps": True, "developer_fields": True, "interval_s": 7, "session_hr": False},
+        ):
+            data = build_fit(duration_s=900, **kwargs)
+            self.assertEqual(parse_fit(io.BytesIO(data)), parse_fit_two_pass(io.BytesIO(data)), kwargs)
+
+            records = [m.get_values() for m in FitFile(io.BytesIO(data)).get_messages("record")]
+            _, columns = parse_fit_samples(io.BytesIO(data))
+            self.assertEqual(len(columns["timestamp"]), len(records), kwargs)
+            expected = [int(r["timestamp"].replace(tzinfo=dt_timezone.utc).timestamp()) for r in records]
+            self.assertEqual(list(columns["timestamp"]), expected, kwargs)
+            for name in ("distance", "speed", "heart_rate", "cadence", "altitude"):
+                np.testing.assert_allclose(columns[name], [r[name] for r in records], err_msg=name)
+            if kwargs.get("developer_fields"):
+                self.assertIn("unnamed_dev_field_0", records[0])
+
+    def test_rejects_non_fit_data(self):
+        with self.assertRaises(FitParseError):
+            parse_fit(io.BytesIO(b"definitely not a fit file"))
+        with self.assertRaises(FitParseError):
+            parse_fit(io.BytesIO(build_fit(duration_s=60)[:-200]))
+
+    def test_checks_the_file_crc(self):
+        for duration_s in (60, 7200):  # below and above CRC_LANES_MIN_BYTES
+            data = bytearray(build_fit(duration_s=duration_s))
+            parse_fit(io.BytesIO(bytes(data)))
+            data[len(data) // 2] ^= 0x10  # a flipped bit in some record
+            with self.assertRaises(FitCRCError):
+                parse_fit(io.BytesIO(bytes(data)))
+            with self.assertRaises(FitCRCError):
+                parse_fit_samples(bytes(data))
+
+    def test_file_crc_matches_byte_loop(self):
+        rng = np.random.default_rng(7)
+        for size in (0, 1, 100, CRC_LANES_MIN_BYTES - 1, CRC_LANES_MIN_BYTES + 1, 300_007):
+            data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+            self.assertEqual(file_crc(data), fit_crc(data), size)
+
+
+class AnalyticsTests(SimpleTestCase):
+    def assertMatchesNaive(self, columns):
+        fast = compute_analytics(columns)
+        slow = analytics_naive(columns)
+        self.assertEqual(fast["splits"], slow["splits"])
+        self.assertEqual(fast["best_efforts"], slow["best_efforts"])
+        self.assertEqual(fast["hr_zones"]["seconds"], slow["hr_zones"])
+        self.assertEqual(fast["trimp"], slow["trimp"])
+        self.assertEqual(
+            fast["normalized_graded_pace_min_per_mile"], slow["normalized_graded_pace_min_per_mile"],
+        )
+        return fast
+
+    def test_matches_pure_python_loops(self):
+        for kwargs in ({}, {"interval_s": 5}, {"with_hr": False}, {"pace_min_per_mile": 6.5}):
+            _, columns = parse_fit_samples(build_fit(duration_s=3600, **kwargs))
+            self.assertMatchesNaive(columns)
+
+    def test_steady_run(self):
+        _, columns = parse_fit_samples(build_fit(duration_s=3600, pace_min_per_mile=8.0))
+        a = self.assertMatchesNaive(columns)
+        self.assertEqual(len(a["splits"]["mile"]), 7)
+        self.assertEqual(len(a["splits"]["km"]), 12)
+        # Pace wobbles +-5% around 8:00/mi, so the best mile is a little quicker
+        self.assertTrue(450 < a["best_efforts"]["1mi"] < 480, a["best_efforts"])
+        self.assertLessEqual(a["best_efforts"]["1mi"], min(s["seconds"] for s in a["splits"]["mile"]))
+        self.assertGreater(a["best_efforts"]["10k"], 2 * a["best_efforts"]["5k"] - 1)
+        self.assertAlmostEqual(sum(a["hr_zones"]["seconds"]), 3600, delta=1)
+        self.assertTrue(7.5 < a["normalized_graded_pace_min_per_mile"] < 8.5)
+
+    def test_pauses_and_missing_values(self):
+        _, columns = parse_fit_samples(build_fit(duration_s=1800))
+        columns = {name: np.array(values) for name, values in columns.items()}
+        columns["timestamp"][900:] += 600  # a 10 minute stop
+        columns["distance"][100:110] = np.nan  # dropouts
+        columns["heart_rate"][::7] = np.nan
+        a = self.assertMatchesNaive(columns)
+        self.assertAlmostEqual(sum(a["hr_zones"]["seconds"]), 1800 * 6 / 7, delta=10)
+        self.assertIsNone(a["best_efforts"]["10k"])
+
+    def test_too_short(self):
+        _, columns = parse_fit_samples(build_fit(duration_s=20))
+        a = compute_analytics(columns)
+        self.assertEqual(a["splits"], {"mile": [], "km": []})
+        self.assertIsNone(a["normalized_graded_pace_min_per_mile"])
+
+
+class UploadJobTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, data, name="run.fit"):
+        return self.client.post(
+            reverse("upload-fit"), {"file": SimpleUploadedFile(name, data)}, format="multipart",
+        )
+
+    def test_upload_is_queued_then_parsed_by_worker(self):
+        res = self.upload(build_fit(duration_s=600))
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(res.data["status"], UploadJob.QUEUED)
+        self.assertFalse(Workout.objects.exists())
+
+        self.assertEqual(jobs.run_pending(), 1)
+
+        res = self.client.get(res.data["status_url"])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["status"], UploadJob.DONE)
+        workout = Workout.objects.get(user=self.user)
+        self.assertEqual(res.data["workout"]["id"], workout.id)
+        self.assertEqual(workout.duration_minutes, 10.0)
+
+        self.assertEqual(res.data["workout"]["analytics"]["best_efforts"]["1k"], workout.analytics["best_efforts"]["1k"])
+
+        # The record stream was stored next to the upload and maps lazily
+        self.assertEqual(workout.samples_path, workout.file_path + ".samples")
+        samples = workout.samples
+        self.assertEqual(len(samples), 601)
+        self.assertIsInstance(samples["heart_rate"], np.memmap)
+        self.assertEqual(samples.elapsed[-1], 600)
+
+        web = self.client_class()
+        web.force_login(self.user)
+        with mock.patch.object(services, "_run_in_background"):
+            page = web.get(reverse("web-workout-detail", args=[workout.pk]))
+        self.assertContains(page, "Best efforts")
+        self.assertContains(page, "Time in heart rate zones")
+
+    def test_bad_file_is_rejected_before_storage(self):
+        res = self.upload(b"not a fit file at all")
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("Invalid .FIT File Header", res.data["detail"])
+        self.assertEqual([name for _, _, names in os.walk(self.media_root) for name in names], [])
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_corrupt_records_mark_job_failed(self):
+        data = bytearray(build_fit(duration_s=600))
+        data[400:420] = b"\x0f" * 20  # data messages of an undefined local type
+        job = jobs.enqueue_fit_upload(self.user, *jobs.save_fit_upload(SimpleUploadedFile("run.fit", bytes(data))))
+        with self.assertLogs("training.jobs", "ERROR"):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.FAILED)
+        self.assertTrue(job.error)
+        self.assertFalse(Workout.objects.exists())
+
+    def test_reexport_of_same_recording_is_a_duplicate(self):
+        self.upload(build_fit(duration_s=600))
+        jobs.run_pending()
+        workout = Workout.objects.get()
+        self.assertEqual(workout.fit_file_id, f"1-3415-123456789-{1122984000 + 600}")
+
+        # Same device and creation time, different bytes
+        res = self.upload(build_fit(duration_s=600, pace_min_per_mile=8.5), name="export.fit")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["workout"]["id"], workout.id)
+        self.assertEqual(Workout.objects.count(), 1)
+
+    def test_claim_is_exclusive(self):
+        self.upload(build_fit(duration_s=60))
+        job = jobs.claim_next_job()
+        self.assertEqual(job.status, UploadJob.PARSING)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_pool_replaces_dead_workers_and_requeues_their_jobs(self):
+        self.upload(build_fit(duration_s=60))
+        jobs.claim_next_job()  # then its worker dies
+        UploadJob.objects.update(updated_at=timezone.now() - jobs.STALE_AFTER - timedelta(seconds=1))
+        started = []
+
+        def start(poll_interval):
+            worker = mock.Mock(pid=len(started), exitcode=-9)
+            worker.is_alive.return_value = bool(started)  # the first one dies
+            started.append(worker)
+            return worker
+
+        with mock.patch.object(jobs, "_start_worker", side_effect=start), \
+                mock.patch.object(jobs.time, "sleep", side_effect=[None, KeyboardInterrupt]), \
+                self.assertLogs("training.jobs", "WARNING") as logs:
+            jobs.start_worker_pool(2)
+        self.assertEqual(len(started), 3)
+        self.assertIn("FIT worker 0 exited with code -9", "\n".join(logs.output))
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.QUEUED)
+        for worker in started[1:]:
+            worker.terminate.assert_called_once()
+
+    def test_status_is_private_to_owner(self):
+        res = self.upload(build_fit(duration_s=60))
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user("other", password="pw"))
+        self.assertEqual(other.get(res.data["status_url"]).status_code, 404)
+
+    def test_dashboard_upload_enqueues(self):
+        self.client.force_login(self.user)
+        res = self.client.post(
+            reverse("web-dashboard"), {"file": SimpleUploadedFile("run.fit", build_fit(duration_s=60))},
+        )
+        self.assertRedirects(res, reverse("web-dashboard"), fetch_redirect_response=False)
+        self.assertEqual(UploadJob.objects.filter(user=self.user, status=UploadJob.QUEUED).count(), 1)
+
+    def test_reupload_returns_existing_workout_without_parsing(self):
+        data = build_fit(duration_s=600)
+        first = self.upload(data)
+        self.assertEqual(self.upload(data, name="copy.fit").data["job_id"], first.data["job_id"])  # still queued
+        jobs.run_pending()
+        workout = Workout.objects.get(user=self.user)
+        self.assertEqual(workout.file_path, jobs.fit_path_for(workout.content_hash))
+        self.assertEqual(workout.started_at.isoformat(), "2025-08-01T12:00:00+00:00")
+
+        with mock.patch.object(jobs, "parse_fit_samples") as parse:
+            res = self.upload(data, name="again.fit")
+        parse.assert_not_called()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["status"], "duplicate")
+        self.assertEqual(res.data["workout"]["id"], workout.id)
+        self.assertEqual(Workout.objects.count(), 1)
+        self.assertEqual(UploadJob.objects.count(), 1)
+
+        # Another user's identical file is their own workout
+        other = User.objects.create_user("other", password="pw")
+        job = jobs.enqueue_fit_upload(other, *jobs.save_fit_upload(SimpleUploadedFile("run.fit", data)))
+        jobs.process_job(job)
+        self.assertEqual(Workout.objects.filter(content_hash=workout.content_hash).count(), 2)
+
+    def test_upload_attaches_to_matching_strava_workout(self):
+        strava_run = Workout.objects.create(
+            user=self.user, strava_id=42, date="2025-08-01T07:00:00Z",
+            started_at="2025-08-01T12:01:00Z",
+            distance_miles=1.12, duration_minutes=10.0,
+        )
+        self.upload(build_fit(duration_s=600))
+        jobs.run_pending()
+        self.assertEqual(Workout.objects.count(), 1)
+        strava_run.refresh_from_db()
+        job = UploadJob.objects.get()
+        self.assertEqual(job.workout, strava_run)
+        self.assertEqual(strava_run.content_hash, job.content_hash)
+        self.assertEqual(strava_run.file_path, job.file_path)
+        self.assertEqual(len(strava_run.samples), 601)
+        self.assertEqual(strava_run.distance_miles, 1.12)  # Strava's summary is kept
+
+
+class FitUploadHandlerTests(MediaRootMixin, TestCase):
+    def parse(self, files, **handler_settings):
+        body = encode_multipart(BOUNDARY, files)
+        meta = {
+            "CONTENT_TYPE": MULTIPART_CONTENT, "CONTENT_LENGTH": str(len(body)), "REQUEST_METHOD": "POST",
+        }
+        with override_settings(**handler_settings):
+            handlers = [FitUploadHandler()] + [load_handler(h) for h in settings.FILE_UPLOAD_HANDLERS]
+            return MultiPartParser(meta, io.BytesIO(body), handlers).parse()[1]
+
+    def stored(self, rel_path):
+        with open(f"{self.media_root}/{rel_path}", "rb") as f:
+            return f.read()
+
+    def test_fit_files_are_stored_and_buffered_in_one_pass(self):
+        data = build_fit(duration_s=600)
+        zipped = io.BytesIO()
+        with zipfile.ZipFile(zipped, "w") as zf:
+            zf.writestr("a.fit", data)
+        files = self.parse({
+            "file": SimpleUploadedFile("run.fit", data), "zip": SimpleUploadedFile("a.zip", zipped.getvalue()),
+        })
+
+        f = files["file"]
+        self.assertIsInstance(f, StoredFitFile)
+        self.assertEqual(f.rel_path, jobs.fit_path_for(f.content_hash))
+        self.assertEqual(self.stored(f.rel_path), data)
+        self.assertIsInstance(f.file, io.BytesIO)  # parsed from memory, not re-read
+        self.assertEqual(parse_fit(f)["duration_minutes"], 10.0)
+        self.assertEqual(jobs.save_fit_upload(f), (f.rel_path, f.content_hash))
+        self.assertEqual(os.listdir(jobs.fit_tmp_dir()), [])
+        # Other files go through Django's own handlers
+        self.assertNotIsInstance(files["zip"], StoredFitFile)
+
+    def test_memory_budget_falls_back_to_stored_file(self):
+        datas = [build_fit(duration_s=300 + i) for i in range(2)]
+        files = self.parse(
+            {"files": [SimpleUploadedFile(f"{i}.fit", d) for i, d in enumerate(datas)]},
+            FIT_UPLOAD_MEMORY_BYTES=len(datas[0]) + 10,
+        ).getlist("files")
+        self.assertIsInstance(files[0].file, io.BytesIO)
+        self.assertEqual([f.read() for f in files], datas)
+        self.assertNotIsInstance(files[1].file, io.BytesIO)
+        for f in files:
+            f.close()
+
+    @override_settings(FIT_UPLOAD_MAX_BYTES=1000)
+    def test_size_cap(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("runner", password="pw"))
+        res = client.post(
+            reverse("upload-fit"), {"file": SimpleUploadedFile("big.fit", build_fit(duration_s=600))},
+            format="multipart",
+        )
+        self.assertEqual(res.status_code, 413)
+        self.assertEqual(os.listdir(jobs.fit_tmp_dir()), [])
+        self.assertFalse(UploadJob.objects.exists())
+
+        res = client.post(
+            reverse("upload-fit-batch"), {"files": [SimpleUploadedFile("big.fit", build_fit(duration_s=600))]},
+            format="multipart",
+        )
+        self.assertEqual(res.data["results"][0]["error"], "File too large")
+
+    def test_invalid_files_never_touch_disk(self):
+        data = build_fit(duration_s=600)
+        files = self.parse({"files": [
+            SimpleUploadedFile("garbage.fit", os.urandom(5000)),
+            SimpleUploadedFile("tiny.fit", data[:20]),
+            SimpleUploadedFile("cut.fit", data[:-100]),  # header and file_id intact
+        ]}).getlist("files")
+        self.assertEqual(
+            [f.error for f in files],
+            ["Invalid .FIT File Header", "Truncated .FIT file", "Truncated .FIT file"],
+        )
+        self.assertEqual([f.rel_path for f in files], [None, None, None])
+        self.assertEqual([name for _, _, names in os.walk(self.media_root) for name in names], [])
+
+    def test_dashboard_rejects_invalid_file(self):
+        web = self.client_class()
+        web.force_login(User.objects.create_user("runner", password="pw"))
+        res = web.post(reverse("web-dashboard"), {"file": SimpleUploadedFile("run.fit", b"\x0e" * 64)})
+        self.assertContains(res, "Not a valid .fit file")
+        self.assertFalse(UploadJob.objects.exists())
+
+    @override_settings(FIT_UPLOAD_MAX_BYTES=1000)
+    def test_dashboard_rejects_oversize_file(self):
+        web = self.client_class()
+        web.force_login(User.objects.create_user("runner", password="pw"))
+        res = web.post(reverse("web-dashboard"), {"file": SimpleUploadedFile("big.fit", build_fit(duration_s=600))})
+        self.assertContains(res, "File too large.")
+        self.assertNotContains(res, "The submitted file is empty")
+        self.assertEqual(os.listdir(jobs.fit_tmp_dir()), [])
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_dashboard_upload_still_checks_csrf(self):
+        web = self.client_class(enforce_csrf_checks=True)
+        web.force_login(User.objects.create_user("runner", password="pw"))
+        upload = {"file": SimpleUploadedFile("run.fit", build_fit(duration_s=60))}
+        self.assertEqual(web.post(reverse("web-dashboard"), upload).status_code, 403)
+        self.assertFalse(UploadJob.objects.exists())
+
+
+class BatchUploadTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, files):
+        return self.client.post(reverse("upload-fit-batch"), {"files": files}, format="multipart")
+
+    def test_multiple_files(self):
+        files = [SimpleUploadedFile(f"run{i}.fit", build_fit(duration_s=300 + 60 * i)) for i in range(5)]
+        files.append(SimpleUploadedFile("broken.fit", b"garbage"))
+        res = self.post(files)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data["created"], 5)
+        self.assertEqual(res.data["failed"], 1)
+        self.assertEqual([r["name"] for r in res.data["results"]], [f.name for f in files])
+        self.assertEqual(res.data["results"][-1]["status"], "error")
+        durations = sorted(Workout.objects.filter(user=self.user).values_list("duration_minutes", flat=True))
+        self.assertEqual(durations, [5.0, 6.0, 7.0, 8.0, 9.0])
+        lengths = sorted(len(w.samples) for w in Workout.objects.filter(user=self.user))
+        self.assertEqual(lengths, [301, 361, 421, 481, 541])
+
+    def test_zip_archive(self):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("export/a.fit", build_fit(duration_s=600))
+            zf.writestr("export/b.FIT", build_fit(duration_s=1200))
+            zf.writestr("export/readme.txt", "ignored")
+            zf.writestr("export/bad.fit", b"nope")
+        res = self.post([SimpleUploadedFile("export.zip", buf.getvalue())])
+        self.assertEqual(res.status_code, 201)
+        by_name = {r["name"]: r for r in res.data["results"]}
+        self.assertEqual(set(by_name), {"export/a.fit", "export/b.FIT", "export/bad.fit"})
+        self.assertEqual(by_name["export/bad.fit"]["status"], "error")
+        workout = Workout.objects.get(pk=by_name["export/b.FIT"]["workout_id"])
+        self.assertEqual(workout.duration_minutes, 20.0)
+        self.assertEqual(workout.file_path, jobs.fit_path_for(workout.content_hash))
+
+    def test_chunks_are_bounded_by_size(self):
+        files = [SimpleUploadedFile(f"run{i}.fit", build_fit(duration_s=300 + 60 * i)) for i in range(5)]
+        limit = sum(f.size for f in files[:2])
+        with mock.patch.object(batch, "CHUNK_BYTES", limit), \
+                mock.patch.object(batch, "_ingest_chunk", wraps=batch._ingest_chunk) as ingest:
+            res = self.post(files)
+        self.assertEqual(res.data["created"], 5)
+        self.assertEqual([len(call.args[1]) for call in ingest.call_args_list], [2, 1, 1, 1])
+        for call in ingest.call_args_list:
+            self.assertLessEqual(sum(len(data) for _, data, _, _ in call.args[1]), limit)
+
+    def test_duplicates_are_skipped(self):
+        data = build_fit(duration_s=300)
+        res = self.post([SimpleUploadedFile("a.fit", data), SimpleUploadedFile("a-copy.fit", data)])
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual((res.data["created"], res.data["duplicates"]), (1, 1))
+        first, copy = res.data["results"]
+        self.assertEqual(copy["status"], "duplicate")
+        self.assertEqual(copy["workout_id"], first["workout_id"])
+
+        res = self.post([SimpleUploadedFile("again.fit", data)])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.data["results"][0], {"name": "again.fit", "status": "duplicate", "workout_id": first["workout_id"]},
+        )
+        self.assertEqual(Workout.objects.count(), 1)
+
+    def test_duplicate_inserted_meanwhile(self):
+        data = build_fit(duration_s=300)
+        parse_all = batch._parse_all
+        raced = []
+
+        def parse_then_race(datas):
+            # The worker finishes a single upload of the same file while the batch parses
+            raced.append(Workout.objects.create(
+                user=self.user, date=timezone.now(), distance_miles=1.0, duration_minutes=5.0,
+                content_hash=hashlib.sha256(data).hexdigest(),
+            ))
+            return parse_all(datas)
+
+        with mock.patch.object(batch, "_parse_all", parse_then_race):
+            res = self.post([SimpleUploadedFile("a.fit", data), SimpleUploadedFile("b.fit", build_fit(duration_s=600))])
+        self.assertEqual(res.status_code, 201)
+        first, second = res.data["results"]
+        self.assertEqual(first, {"name": "a.fit", "status": "duplicate", "workout_id": raced[0].pk})
+        self.assertEqual(second["status"], "created")
+        self.assertEqual(Workout.objects.count(), 2)
+        self.assertEqual(Workout.objects.get(pk=second["workout_id"]).duration_minutes, 10.0)
+
+    def test_rejects_other_files(self):
+        res = self.post([SimpleUploadedFile("notes.txt", b"hi")])
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data["results"][0]["status"], "error")
+
+
+class StubCompletions:
+    """Stands in for client.chat.completions; records prompts."""
+
+    def __init__(self, reply="Run easy tomorrow.", error=None):
+        self.reply = reply
+        self.error = error
+        self.prompts = []
+
+    def create(self, model, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        if self.error:
+            raise self.error
+        reply = self.reply(messages[-1]["content"]) if callable(self.reply) else self.reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+def stub_client(**kwargs):
+    return SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(**kwargs)))
+
+
+class CachedInsightTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("runner", password="pw")
+        self.workout = Workout.objects.create(
+            user=self.user, date="2025-08-01T12:00:00Z", distance_miles=5.0,
+            duration_minutes=45.0, avg_heart_rate=150, avg_pace_min_per_mile=9.0,
+        )
+        self.client.force_login(self.user)
+        services.reset_insight_cache_stats()
+        self.openai = FakeOpenAI().start()
+        self.addCleanup(self.openai.stop)
+        override = override_settings(OPENAI_BASE_URL=self.openai.url)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.scheduled = []
+        patcher = mock.patch.object(services, "_run_in_background", lambda fn, *args: self.scheduled.append((fn, args)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_scheduled(self):
+        while self.scheduled:
+            fn, args = self.scheduled.pop(0)
+            async_to_sync(fn)(*args)
+
+    def test_miss_renders_placeholder_then_hit_serves_cache(self):
+        res = services.get_cached_insights(self.workout)
+        self.assertEqual(res, (WorkoutInsight.PENDING, None))
+        self.assertEqual(len(self.scheduled), 1)
+
+        # A second miss while pending doesn't schedule another generation
+        self.assertEqual(services.get_cached_insights(self.workout), (WorkoutInsight.PENDING, None))
+        self.assertEqual(len(self.scheduled), 1)
+
+        self.run_scheduled()
+        for _ in range(3):
+            self.assertEqual(services.get_cached_insights(self.workout), (WorkoutInsight.READY, "Run easy tomorrow."))
+
+        self.assertEqual(len(self.openai.prompts), 1)
+        self.assertEqual(services.get_insight_cache_stats(), {"hits": 3, "misses": 2})
+        self.assertEqual(WorkoutInsight.objects.get().status, WorkoutInsight.READY)
+
+    def test_metrics_change_invalidates(self):
+        key = services.insight_key(self.workout)
+        self.workout.distance_miles = 6.0
+        self.assertNotEqual(services.insight_key(self.workout), key)
+        with mock.patch.object(services, "PROMPT_VERSION", services.PROMPT_VERSION + 1):
+            self.workout.distance_miles = 5.0
+            self.assertNotEqual(services.insight_key(self.workout), key)
+
+    def test_failure_is_retried_later(self):
+        self.openai.status = 429
+        services.get_cached_insights(self.workout)
+        with self.assertLogs("training.services", "ERROR"):
+            self.run_scheduled()
+        self.assertEqual(WorkoutInsight.objects.get().status, WorkoutInsight.FAILED)
+
+        # Too soon: no retry
+        self.assertEqual(services.get_cached_insights(self.workout), (WorkoutInsight.FAILED, None))
+        self.assertEqual(self.scheduled, [])
+
+        WorkoutInsight.objects.update(updated_at=WorkoutInsight.objects.get().updated_at - timedelta(minutes=10))
+        self.openai.status, self.openai.reply = 200, "Recovered"
+        services.get_cached_insights(self.workout)
+        self.run_scheduled()
+        self.assertEqual(services.get_cached_insights(self.workout), (WorkoutInsight.READY, "Recovered"))
+
+    def test_page_shows_failure_and_retries_on_request(self):
+        self.workout.refresh_from_db()  # the key hashes the stored date, not the string above
+        WorkoutInsight.objects.create(key=services.insight_key(self.workout), status=WorkoutInsight.FAILED)
+        url = reverse("web-workout-detail", args=[self.workout.id])
+        res = self.client.get(url)
+        self.assertTrue(res.context["insights_failed"])
+        self.assertFalse(res.context["insights_pending"])
+        self.assertNotContains(res, 'http-equiv="refresh"')
+        self.assertContains(res, 'href="?retry=1"')
+        self.assertEqual(self.scheduled, [])
+
+        self.assertRedirects(self.client.get(url + "?retry=1"), url, fetch_redirect_response=False)
+        self.assertEqual(len(self.scheduled), 1)
+        self.assertEqual(WorkoutInsight.objects.get().status, WorkoutInsight.PENDING)
+        self.run_scheduled()
+        self.assertEqual(self.client.get(url).context["insights"], "Run easy tomorrow.")
+
+    def test_page_renders_without_waiting(self):
+        WorkoutInsight.objects.create(key=services.insight_key(self.workout), status=WorkoutInsight.PENDING)
+        res = self.client.get(reverse("web-workout-detail", args=[self.workout.id]))
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.context["insights_pending"])
+        self.assertContains(res, 'http-equiv="refresh"')
+        self.assertContains(res, "Hi runner")
+        self.assertEqual(self.openai.prompts, [])
+
+    def test_page_miss_schedules_generation(self):
+        res = self.client.get(reverse("web-workout-detail", args=[self.workout.id]))
+        self.assertTrue(res.context["insights_pending"])
+        self.run_scheduled()
+        res = self.client.get(reverse("web-workout-detail", args=[self.workout.id]))
+        self.assertEqual(res.context["insights"], "Run easy tomorrow.")
+        self.assertIn("Distance: 5.00 miles", self.openai.prompts[0])
+
+    def test_page_is_private_to_owner(self):
+        other = self.client_class()
+        other.force_login(User.objects.create_user("other", password="pw"))
+        self.assertEqual(other.get(reverse("web-workout-detail", args=[self.workout.id])).status_code, 404)
+
+
+def batch_reply(prompt, skip=()):
+    """JSON answer for every workout id found in a batch prompt."""
+    ids = [int(i) for i in re.findall(r'"id": (\d+)', prompt)]
+    return json.dumps({"insights": [{"id": i, "tips": f"Tips for {i}"} for i in ids if i not in skip]})
+
+
+class BatchInsightTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("runner", password="pw")
+        for i in range(7):
+            Workout.objects.create(
+                user=self.user, date=f"2025-08-0{i + 1}T12:00:00Z", distance_miles=3.0 + i,
+                duration_minutes=30.0 + 9 * i, avg_heart_rate=140 + i, avg_pace_min_per_mile=9.0,
+            )
+        self.workouts = list(Workout.objects.order_by("id"))
+
+    def test_one_call_for_many_workouts(self):
+        client = stub_client(reply=batch_reply)
+        with mock.patch.object(services, "client", client):
+            self.assertEqual(services.generate_insights_batch(self.workouts), 7)
+            # Everything is cached now, nothing left to ask for
+            self.assertEqual(services.generate_insights_batch(self.workouts), 0)
+        self.assertEqual(len(client.chat.completions.prompts), 1)
+        for w in self.workouts:
+            insight = WorkoutInsight.objects.get(key=services.insight_key(w))
+            self.assertEqual(insight.content, f"Tips for {w.id}")
+
+    def test_missing_entries_are_marked_failed(self):
+        skipped = self.workouts[2].id
+        with mock.patch.object(services, "client", stub_client(reply=lambda p: batch_reply(p, skip={skipped}))):
+            self.assertEqual(services.generate_insights_batch(self.workouts), 6)
+        insight = WorkoutInsight.objects.get(key=services.insight_key(self.workouts[2]))
+        self.assertEqual(insight.status, WorkoutInsight.FAILED)
+
+    def test_backfill_command(self):
+        with mock.patch.object(services, "client", stub_client(reply=batch_reply)):
+            services.generate_insights_batch(self.workouts[:2])
+            client = stub_client(reply=batch_reply)
+            with mock.patch.object(services, "client", client):
+                call_command("backfill_insights", batch_size=2, concurrency=1, stdout=io.StringIO())
+        # 5 remaining workouts in batches of 2
+        self.assertEqual(len(client.chat.completions.prompts), 3)
+        self.assertEqual(WorkoutInsight.objects.filter(status=WorkoutInsight.READY).count(), 7)
+
+
+class FakeStravaMixin:
+    """Runs a FakeStrava server and points STRAVA_API_BASE at it."""
+    activity_count = 0
+
+    def setUp(self):
+        super().setUp()
+        self.fake = FakeStrava(activities=make_activities(self.activity_count)).start()
+        self.addCleanup(self.fake.stop)
+        override = override_settings(STRAVA_API_BASE=self.fake.url)
+        override.enable()
+        self.addCleanup(override.disable)
+        strava.token_manager.clear()
+        self.addCleanup(strava.token_manager.clear)
+
+    def connect_strava(self, user, expires_in=timedelta(hours=6)):
+        return StravaToken.objects.create(
+            user=user, access_token=self.fake.access_token, refresh_token=self.fake.refresh_token,
+            expires_at=timezone.now() + expires_in, athlete_id=str(user.pk),
+        )
+
+
+class StravaSyncTests(FakeStravaMixin, TestCase):
+    activity_count = 450
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.connect_strava(self.user)
+
+    def test_full_history_then_incremental(self):
+        self.assertEqual(strava.sync_strava_activities(self.user), 450)
+        self.assertEqual(Workout.objects.filter(user=self.user).count(), 450)
+        self.assertEqual(self.fake.count("/api/v3/athlete/activities"), 3)  # 200 + 200 + 50
+        state = StravaSyncState.objects.get(user=self.user)
+        self.assertEqual(state.last_activity_at.isoformat(), "2025-03-25T07:00:00+00:00")
+
+        # Nothing new: a single (empty) page request
+        self.assertEqual(strava.sync_strava_activities(self.user), 0)
+        self.assertEqual(self.fake.requests[-1][2]["after"], str(int(state.last_activity_at.timestamp())))
+
+        self.fake.activities += make_activities(
+            5, start=state.last_activity_at + timedelta(days=1), start_id=9000,
+        )
+        self.assertEqual(strava.sync_strava_activities(self.user), 5)
+        self.assertEqual(Workout.objects.filter(user=self.user).count(), 455)
+
+    def test_upsert_updates_existing_rows_in_one_query(self):
+        acts = make_activities(50)  # small enough for one statement within SQLite's parameter limit
+        strava.upsert_activities(self.user, acts)
+        for act in acts:
+            act["distance"] = 10000.0
+        with CaptureQueriesContext(connection) as ctx:
+            strava.upsert_activities(self.user, acts)
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "training_workout"')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(Workout.objects.count(), 50)
+        self.assertEqual(set(Workout.objects.values_list("distance_miles", flat=True)), {6.21})
+
+    def test_sync_links_earlier_upload_of_the_same_run(self):
+        act = make_activities(1)[0]
+        started = strava.parse_strava_datetime(act["start_date"])
+        upload = Workout.objects.create(
+            user=self.user, date=started, started_at=started + timedelta(seconds=20),
+            distance_miles=round(act["distance"] / strava.M_PER_MILE, 2) * 1.01, duration_minutes=30,
+            content_hash="ab" * 32, file_path="uploads/fit/ab/run.fit",
+        )
+        self.fake.activities = [act]
+        self.assertEqual(strava.sync_strava_activities(self.user), 1)
+        upload.refresh_from_db()
+        self.assertEqual(Workout.objects.count(), 1)
+        self.assertEqual(upload.strava_id, act["id"])
+        self.assertEqual(upload.file_path, "uploads/fit/ab/run.fit")
+
+        # Syncing again matches on strava_id as usual
+        strava.upsert_activities(self.user, [act])
+        self.assertEqual(Workout.objects.count(), 1)
+
+    def test_expired_token_is_refreshed(self):
+        StravaToken.objects.filter(user=self.user).update(
+            expires_at=StravaToken.objects.get(user=self.user).expires_at - timedelta(days=1),
+        )
+        self.fake.activities = self.fake.activities[:10]
+        self.assertEqual(strava.sync_strava_activities(self.user), 10)
+        self.assertEqual(StravaToken.objects.get(user=self.user).access_token, self.fake.access_token)
+
+
+class StravaSyncQueueTests(FakeStravaMixin, TestCase):
+    activity_count = 250
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.client.force_login(self.user)
+
+    def test_callback_only_exchanges_token_and_queues_sync(self):
+        res = self.client.get(reverse("strava-callback"), {"code": "abc"})
+        self.assertRedirects(res, reverse("dashboard"), fetch_redirect_response=False)
+        self.assertEqual(self.fake.count("/api/v3/"), 0)
+        self.assertIsNotNone(StravaSyncState.objects.get(user=self.user).sync_requested_at)
+
+        self.assertEqual(strava.run_due_syncs(), 1)
+        self.assertEqual(Workout.objects.filter(user=self.user).count(), 250)
+        state = StravaSyncState.objects.get(user=self.user)
+        self.assertIsNone(state.sync_requested_at)
+        self.assertIsNone(state.sync_started_at)
+        self.assertEqual(strava.run_due_syncs(), 0)
+
+    async def test_callbacks_wait_on_strava_concurrently(self):
+        self.fake.latency = 0.3
+        client = AsyncClient()
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.get(reverse("strava-callback"), {"code": f"code-{i}"}) for i in range(8)
+        ))
+        elapsed = time.perf_counter() - started
+        self.assertEqual({r.status_code for r in responses}, {302})
+        self.assertEqual(self.fake.count("/oauth/token"), 8)
+        # Eight exchanges back to back would take 2.4 s
+        self.assertLess(elapsed, 1.2)
+        self.assertTrue(await StravaToken.objects.filter(user=self.user).aexists())
+
+    def test_dashboard_reads_only_from_the_database(self):
+        self.connect_strava(self.user)
+        strava.upsert_activities(self.user, self.fake.activities[:5])
+        res = self.client.get(reverse("dashboard"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.context["workouts"]), 5)
+        self.assertEqual(self.fake.requests, [])
+
+    def test_sync_endpoint_queues_for_worker(self):
+        self.connect_strava(self.user)
+        res = self.client.post(reverse("strava-sync"))
+        self.assertRedirects(res, reverse("dashboard"), fetch_redirect_response=False)
+        self.assertEqual(self.fake.requests, [])
+        call_command("sync_strava", stdout=io.StringIO())
+        self.assertEqual(Workout.objects.filter(user=self.user).count(), 250)
+
+    def test_request_during_a_run_is_kept(self):
+        self.connect_strava(self.user)
+        strava.request_sync(self.user)
+        runs = []
+
+        def sync(user):
+            runs.append(user)
+            if len(runs) == 1:
+                strava.request_sync(user)  # e.g. a webhook event mid-run
+
+        with mock.patch.object(strava, "sync_strava_activities", sync):
+            self.assertEqual(strava.run_due_syncs(), 2)
+        state = StravaSyncState.objects.get(user=self.user)
+        self.assertIsNone(state.sync_requested_at)
+        self.assertIsNone(state.sync_started_at)
+
+    @override_settings(STRAVA_USER_RATE_LIMIT_15MIN=1)
+    def test_rate_limited_sync_is_deferred_to_next_window(self):
+        self.connect_strava(self.user)
+        strava.request_sync(self.user)
+        with self.assertLogs("training.strava", "INFO"):
+            strava.run_due_syncs()
+        # First page stored, second call refused before it reached Strava
+        self.assertEqual(self.fake.count("/api/v3/athlete/activities"), 1)
+        self.assertEqual(Workout.objects.filter(user=self.user).count(), 200)
+        state = StravaSyncState.objects.get(user=self.user)
+        self.assertIsNone(state.sync_started_at)
+        self.assertGreater(state.sync_requested_at, timezone.now())
+        self.assertIn("rate limit", state.last_error)
+        self.assertEqual(state.sync_requested_at.minute % 15, 0)
+        self.assertEqual(strava.run_due_syncs(), 0)  # not due until the window resets
+
+    @override_settings(STRAVA_RATE_LIMIT_15MIN=3, STRAVA_USER_RATE_LIMIT_15MIN=100)
+    def test_app_quota_is_shared_between_users(self):
+        other = User.objects.create_user("other", password="pw")
+        strava.acquire_api_call(self.user)
+        strava.acquire_api_call(self.user)
+        strava.acquire_api_call(other)
+        with self.assertRaises(strava.StravaRateLimited):
+            strava.acquire_api_call(other)
+        # The refused call isn't charged to the user
+        self.assertEqual(
+            StravaApiUsage.objects.get(scope=f"user:{other.pk}", period=StravaApiUsage.FIFTEEN_MINUTES).count, 1,
+        )
+
+    def test_usage_headers_catch_up_app_counter(self):
+        self.connect_strava(self.user)
+        self.fake.rate_limit_usage = (150, 900)
+        strava.api_get(self.user, "athlete/activities", self.fake.access_token, per_page=1)
+        counts = dict(StravaApiUsage.objects.filter(scope="app").values_list("period", "count"))
+        self.assertEqual(counts, {StravaApiUsage.FIFTEEN_MINUTES: 150, StravaApiUsage.DAILY: 900})
+
+
+# Recorded deliveries (from Strava's webhook docs); ids are swapped in per test
+STRAVA_ACTIVITY_EVENT = {
+    "aspect_type": "update",
+    "event_time": 1516126040,
+    "object_id": 1360128428,
+    "object_type": "activity",
+    "owner_id": 134815,
+    "subscription_id": 120475,
+    "updates": {"title": "Messy"},
+}
+STRAVA_DEAUTHORIZE_EVENT = {
+    "aspect_type": "update",
+    "event_time": 1516126040,
+    "object_id": 134815,
+    "object_type": "athlete",
+    "owner_id": 134815,
+    "subscription_id": 120475,
+    "updates": {"authorized": "false"},
+}
+
+
+@override_settings(STRAVA_WEBHOOK_VERIFY_TOKEN="verify-me", STRAVA_WEBHOOK_SUBSCRIPTION_ID=120475)
+class StravaWebhookTests(FakeStravaMixin, TestCase):
+    activity_count = 3
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.connect_strava(self.user)
+        self.url = reverse("strava-webhook")
+
+    def deliver(self, aspect_type, object_id, event_time=1516126040, **overrides):
+        payload = {
+            **STRAVA_ACTIVITY_EVENT, "aspect_type": aspect_type, "object_id": object_id,
+            "owner_id": self.user.pk, "event_time": event_time, **overrides,
+        }
+        if aspect_type != "update":
+            payload["updates"] = {}
+        return self.client.post(self.url, payload, content_type="application/json")
+
+    def test_subscription_handshake(self):
+        ok = self.client.get(self.url, {
+            "hub.mode": "subscribe", "hub.verify_token": "verify-me", "hub.challenge": "15f7d1a91c1f40f8a748fd134752feb3",
+        })
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(ok.json(), {"hub.challenge": "15f7d1a91c1f40f8a748fd134752feb3"})
+        bad = self.client.get(self.url, {"hub.mode": "subscribe", "hub.verify_token": "nope", "hub.challenge": "x"})
+        self.assertEqual(bad.status_code, 403)
+
+    def test_events_are_acknowledged_without_calling_strava(self):
+        res = self.deliver("create", self.fake.activities[0]["id"])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.fake.requests, [])
+        self.assertEqual(StravaWebhookEvent.objects.get().status, StravaWebhookEvent.QUEUED)
+
+    def test_create_update_delete(self):
+        act = self.fake.activities[0]
+        self.deliver("create", act["id"], event_time=1)
+        self.assertEqual(strava.run_pending_events(), 1)
+        self.assertEqual(self.fake.requests[-1][1], f"/api/v3/activities/{act['id']}")
+        workout = Workout.objects.get(user=self.user, strava_id=act["id"])
+        self.assertEqual(workout.distance_miles, round(act["distance"] / strava.M_PER_MILE, 2))
+        self.assertEqual(self.fake.count("/api/v3/athlete/activities"), 0)  # no sync
+
+        act["distance"] = 10000.0
+        self.deliver("update", act["id"], event_time=2)
+        strava.run_pending_events()
+        workout.refresh_from_db()
+        self.assertEqual(workout.distance_miles, round(10000.0 / strava.M_PER_MILE, 2))
+
+        self.fake.activities.remove(act)
+        self.deliver("delete", act["id"], event_time=3)
+        strava.run_pending_events()
+        self.assertFalse(Workout.objects.filter(strava_id=act["id"]).exists())
+        self.assertEqual(self.fake.requests[-1][1], f"/api/v3/activities/{act['id']}")  # confirmed with Strava
+        self.assertEqual(
+            set(StravaWebhookEvent.objects.values_list("status", flat=True)), {StravaWebhookEvent.DONE},
+        )
+
+    def test_redelivered_and_replayed_events_are_idempotent(self):
+        act = self.fake.activities[1]
+        for _ in range(3):
+            self.assertEqual(self.deliver("create", act["id"]).status_code, 200)
+        self.assertEqual(StravaWebhookEvent.objects.count(), 1)
+        self.deliver("update", act["id"], event_time=1516126041)
+        self.assertEqual(strava.run_pending_events(), 2)
+        self.assertEqual(Workout.objects.filter(strava_id=act["id"]).count(), 1)
+        self.assertEqual(WorkoutRollup.objects.filter(user=self.user, period="week").get().workout_count, 1)
+
+        self.fake.activities.remove(act)
+        self.deliver("delete", act["id"], event_time=1516126042)
+        self.deliver("delete", act["id"], event_time=1516126043)
+        self.assertEqual(strava.run_pending_events(), 2)
+        self.assertFalse(Workout.objects.filter(strava_id=act["id"]).exists())
+
+    def test_activity_gone_by_the_time_it_is_fetched(self):
+        strava.upsert_activities(self.user, self.fake.activities[:1])
+        gone = self.fake.activities.pop(0)
+        self.deliver("update", gone["id"])
+        strava.run_pending_events()
+        self.assertFalse(Workout.objects.filter(strava_id=gone["id"]).exists())
+        self.assertEqual(StravaWebhookEvent.objects.get().status, StravaWebhookEvent.DONE)
+
+    def test_deleting_a_linked_activity_keeps_the_upload(self):
+        act = self.fake.activities[2]
+        strava.upsert_activities(self.user, [act])
+        Workout.objects.filter(strava_id=act["id"]).update(content_hash="ab" * 32, file_path="uploads/fit/x.fit")
+        self.fake.activities.remove(act)
+        self.deliver("delete", act["id"])
+        strava.run_pending_events()
+        workout = Workout.objects.get(user=self.user, content_hash="ab" * 32)
+        self.assertIsNone(workout.strava_id)
+
+    def test_forged_delete_keeps_the_workout(self):
+        act = self.fake.activities[0]
+        strava.upsert_activities(self.user, [act])
+        self.deliver("delete", act["id"])
+        strava.run_pending_events()
+        self.assertTrue(Workout.objects.filter(strava_id=act["id"]).exists())
+        self.assertEqual(StravaWebhookEvent.objects.get().status, StravaWebhookEvent.DONE)
+
+    def test_deauthorization(self):
+        payload = {**STRAVA_DEAUTHORIZE_EVENT, "object_id": self.user.pk, "owner_id": self.user.pk}
+        self.client.post(self.url, payload, content_type="application/json")
+        # Strava still accepts the token: not a real deauthorization
+        strava.run_pending_events()
+        self.assertTrue(StravaToken.objects.filter(user=self.user).exists())
+
+        self.fake.revoke()
+        self.client.post(self.url, {**payload, "event_time": 1516126041}, content_type="application/json")
+        strava.run_pending_events()
+        self.assertFalse(StravaToken.objects.filter(user=self.user).exists())
+        self.assertEqual(self.fake.count("/api/v3/athlete"), 2)
+
+    def test_event_left_by_a_dead_worker_is_reclaimed(self):
+        act = self.fake.activities[0]
+        self.deliver("create", act["id"])
+        self.assertIsNotNone(strava.claim_next_event())  # ...and the worker dies
+        self.assertIsNone(strava.claim_next_event())
+        StravaWebhookEvent.objects.update(updated_at=timezone.now() - strava.STALE_EVENT_AFTER - timedelta(seconds=1))
+        self.assertEqual(strava.run_pending_events(), 1)
+        self.assertEqual(StravaWebhookEvent.objects.get().status, StravaWebhookEvent.DONE)
+        self.assertTrue(Workout.objects.filter(strava_id=act["id"]).exists())
+
+    @override_settings(STRAVA_USER_RATE_LIMIT_15MIN=0)
+    def test_rate_limited_events_wait_for_the_next_window(self):
+        self.deliver("create", self.fake.activities[0]["id"])
+        strava.run_pending_events()
+        event = StravaWebhookEvent.objects.get()
+        self.assertEqual(event.status, StravaWebhookEvent.QUEUED)
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertEqual(strava.run_pending_events(), 0)
+
+    def test_rejects_unknown_subscriptions_and_junk(self):
+        self.assertEqual(self.deliver("create", 1, subscription_id=999).status_code, 403)
+        bad = self.client.post(self.url, "not json", content_type="application/json")
+        self.assertEqual(bad.status_code, 400)
+        missing = self.client.post(self.url, {"subscription_id": 120475}, content_type="application/json")
+        self.assertEqual(missing.status_code, 400)
+        with self.settings(STRAVA_WEBHOOK_SUBSCRIPTION_ID=0):
+            self.assertEqual(self.deliver("create", 1).status_code, 403)
+            self.assertEqual(self.deliver("create", 1, subscription_id=0).status_code, 403)
+        self.assertFalse(StravaWebhookEvent.objects.exists())
+
+    def test_unknown_athletes_are_ignored(self):
+        self.deliver("create", self.fake.activities[0]["id"], owner_id=987654)
+        strava.run_pending_events()
+        self.assertEqual(self.fake.requests, [])
+        self.assertFalse(Workout.objects.exists())
+
+
+class StravaStreamsTests(MediaRootMixin, FakeStravaMixin, TestCase):
+    activity_count = 5
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.connect_strava(self.user)
+        strava.sync_strava_activities(self.user)
+
+    def test_columns_from_streams(self):
+        started = datetime(2025, 8, 1, 7, 0, tzinfo=dt_timezone.utc)
+        columns = strava.columns_from_streams([
+            {"type": "time", "data": [0, 1, 3]},
+            {"type": "distance", "data": [0.0, 2.9, 8.7]},
+            {"type": "altitude", "data": [10.0, None, 10.4]},
+            {"type": "heartrate", "data": [140, 141]},  # truncated
+            {"type": "latlng", "data": [[41.88, -87.63], [41.8801, -87.63], [41.8802, -87.63]]},
+        ], started)
+        self.assertEqual(list(columns["timestamp"]), [int(started.timestamp()) + t for t in (0, 1, 3)])
+        self.assertEqual(columns["timestamp"].dtype, np.int64)
+        self.assertTrue(np.isnan(columns["altitude"][1]))
+        self.assertTrue(np.isnan(columns["heart_rate"]).all())
+        self.assertTrue(np.isnan(columns["cadence"]).all())
+        self.assertEqual(columns["position_lat"][2], 41.8802)
+        self.assertIsNone(strava.columns_from_streams({}, started))
+
+    def test_backfill_writes_samples_and_analytics(self):
+        importer = strava.import_streams(workers=3)
+        self.assertEqual((importer.imported, importer.skipped, importer.failed), (5, 0, 0))
+        self.assertEqual(self.fake.count("/api/v3/activities/"), 5)
+        for workout, act in zip(Workout.objects.order_by("started_at"), self.fake.activities):
+            samples = workout.samples
+            self.assertEqual(len(samples), act["moving_time"] + 1)
+            self.assertEqual(samples["timestamp"][0], int(workout.started_at.timestamp()))
+            self.assertEqual(samples["heart_rate"].dtype, np.float32)
+            self.assertIsNotNone(workout.streams_imported_at)
+            self.assertEqual(workout.analytics, compute_analytics(samples))
+            self.assertTrue(workout.analytics["splits"]["mile"])
+
+        # Nothing left to fetch
+        self.assertEqual(strava.import_streams().imported, 0)
+        self.assertEqual(self.fake.count("/api/v3/activities/"), 5)
+
+    def test_users_without_a_token_are_not_pending(self):
+        StravaToken.objects.filter(user=self.user).delete()
+        self.assertFalse(strava.pending_streams().exists())
+        with self.assertNumQueries(1):  # just the empty batch
+            importer = strava.import_streams()
+        self.assertEqual((importer.imported, importer.skipped, importer.failed), (0, 0, 0))
+        self.assertEqual(self.fake.count("/api/v3/activities/"), 0)
+
+    def test_rate_limit_stops_and_resumes(self):
+        with override_settings(STRAVA_RATE_LIMIT_15MIN=3):  # one call already went to the sync
+            importer = strava.import_streams(workers=2)
+        self.assertEqual(importer.imported, 2)
+        self.assertIsNotNone(importer.retry_at)
+        StravaApiUsage.objects.all().delete()  # the window resets
+
+        out = io.StringIO()
+        call_command("import_strava_streams", stdout=out)
+        self.assertIn("Imported streams for 3 workout(s)", out.getvalue())
+        self.assertEqual(self.fake.count("/api/v3/activities/"), 5)  # none fetched twice
+        self.assertFalse(strava.pending_streams().exists())
+
+    def test_activities_without_streams_are_not_refetched(self):
+        manual, gone = self.fake.activities[:2]
+        manual["manual"] = True
+        self.fake.activities.remove(gone)
+        uploaded = Workout.objects.get(strava_id=self.fake.activities[-1]["id"])
+        Workout.objects.filter(pk=uploaded.pk).update(samples_path="uploads/fit/run.fit.samples")
+
+        importer = strava.import_streams()
+        self.assertEqual((importer.imported, importer.skipped), (2, 2))
+        self.assertEqual(self.fake.count("/api/v3/activities/"), 4)  # not the uploaded run
+        self.assertIsNone(Workout.objects.get(strava_id=manual["id"]).samples_path)
+        strava.import_streams()
+        self.assertEqual(self.fake.count("/api/v3/activities/"), 4)
+
+    def test_write_errors_back_off(self):
+        with mock.patch.object(strava, "write_samples", side_effect=OSError(28, "No space left on device")), \
+                self.assertLogs("training.strava", "ERROR"):
+            importer = strava.import_streams(workers=1)
+        self.assertEqual((importer.imported, importer.skipped), (0, 0))
+        self.assertGreaterEqual(importer.failed, 1)
+        self.assertIsNotNone(importer.retry_at)
+        self.assertEqual(strava.pending_streams().count(), 5)  # nothing given up on
+
+        self.assertEqual(strava.import_streams().imported, 5)
+
+    def test_bad_api_base_backs_off(self):
+        with override_settings(STRAVA_API_BASE="strava.invalid"), self.assertLogs("training.strava", "WARNING"):
+            importer = strava.import_streams(workers=1)
+        self.assertEqual((importer.imported, importer.skipped), (0, 0))
+        self.assertIsNotNone(importer.retry_at)
+        self.assertEqual(strava.pending_streams().count(), 5)
+
+    def test_analytics_errors_back_off(self):
+        with mock.patch.object(strava, "compute_analytics", side_effect=AttributeError("bug")), \
+                self.assertLogs("training.strava", "ERROR"):
+            importer = strava.import_streams(workers=1)
+        self.assertEqual((importer.imported, importer.skipped), (0, 0))
+        self.assertIsNotNone(importer.retry_at)
+        self.assertEqual(strava.pending_streams().count(), 5)
+
+    def test_undecodable_streams_are_given_up(self):
+        bad = self.fake.activities[0]
+        self.fake.streams[bad["id"]] = {"time": ["soon", "later"]}
+        with self.assertLogs("training.strava", "ERROR"):
+            importer = strava.import_streams()
+        self.assertEqual((importer.imported, importer.skipped, importer.failed), (4, 1, 0))
+        self.assertFalse(strava.pending_streams().exists())
+        self.assertIsNone(Workout.objects.get(strava_id=bad["id"]).samples_path)
+
+
+class StravaTokenManagerTests(FakeStravaMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+        self.manager = strava.StravaTokenManager()
+
+    def test_valid_token_is_cached(self):
+        token = self.connect_strava(self.user)
+        self.assertEqual(self.manager.get_access_token(self.user), token.access_token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.manager.get_access_token(self.user), token.access_token)
+        self.assertEqual(self.fake.count("/oauth/token"), 0)
+
+    def test_token_near_expiry_is_refreshed_proactively(self):
+        self.connect_strava(self.user, expires_in=timedelta(minutes=2))
+        self.assertEqual(self.manager.get_access_token(self.user), self.fake.access_token)
+        self.assertEqual(self.fake.count("/oauth/token"), 1)
+        self.assertEqual(StravaToken.objects.get(user=self.user).refresh_token, self.fake.refresh_token)
+
+    def test_concurrent_callers_share_one_refresh(self):
+        self.connect_strava(self.user, expires_in=-timedelta(hours=1))
+        self.fake.latency = 0.05  # keep the refresh in flight while the others pile up
+        threads = 16
+        barrier = threading.Barrier(threads)
+        results, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(self.manager.get_access_token(self.user))
+            except Exception as e:  # surfaced by the assertions below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.fake.count("/oauth/token"), 1)
+        self.assertEqual(results, [self.fake.access_token] * threads)
+        self.assertEqual(StravaToken.objects.get(user=self.user).access_token, self.fake.access_token)
+
+    def test_rejected_token_is_dropped_from_cache(self):
+        self.connect_strava(self.user)
+        self.manager.get_access_token(self.user)
+        self.manager.invalidate(self.user)
+        with self.assertNumQueries(1):
+            self.manager.get_access_token(self.user)
+
+    def test_not_connected(self):
+        self.assertIsNone(self.manager.get_access_token(self.user))
+
+
+class WorkoutListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("runner", password="pw")
+        _seed_workouts(cls.user, 130)
+        # Same date and created_at: only the id tells these apart
+        first = Workout.objects.filter(user=cls.user).order_by("date").first()
+        for _ in range(3):
+            first.pk = None
+            first.save()
+        Workout.objects.filter(user=cls.user, date=first.date).update(created_at=first.created_at)
+        other = User.objects.create_user("other", password="pw")
+        _seed_workouts(other, 10)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def walk(self, url, **params):
+        ids, pages = [], 0
+        res = self.api.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, 200)
+            ids += [w["id"] for w in res.data["results"]]
+            pages += 1
+            if not res.data["next"]:
+                return ids, pages
+            res = self.api.get(res.data["next"])
+
+    def test_walks_every_row_once_in_order(self):
+        url = reverse("workout-list")
+        ids, pages = self.walk(url, page_size=25)
+        expected = list(
+            Workout.objects.filter(user=self.user).order_by("-date", "-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 6)  # 133 rows
+
+    def test_previous_link_returns_the_same_page(self):
+        url = reverse("workout-list")
+        first = self.api.get(url, {"page_size": 10})
+        self.assertIsNone(first.data["previous"])
+        second = self.api.get(first.data["next"])
+        back = self.api.get(second.data["previous"])
+        self.assertEqual([w["id"] for w in back.data["results"]], [w["id"] for w in first.data["results"]])
+        self.assertIsNone(back.data["previous"])
+
+    def test_filters(self):
+        ids, _ = self.walk(reverse("workout-list"), min_distance=5, max_distance=8, max_pace=9,
+                           date_from="2015-01-05T00:00:00Z")
+        expected = set(Workout.objects.filter(
+            user=self.user, distance_miles__gte=5, distance_miles__lte=8,
+            avg_pace_min_per_mile__lte=9, date__gte="2015-01-05T00:00:00Z",
+        ).values_list("id", flat=True))
+        self.assertTrue(expected)
+        self.assertEqual(set(ids), expected)
+
+    def test_bad_input(self):
+        url = reverse("workout-list")
+        self.assertEqual(self.api.get(url, {"cursor": "garbage"}).status_code, 404)
+        self.assertEqual(self.api.get(url, {"min_distance": "far"}).status_code, 400)
+        self.assertEqual(self.api.get(url, {"min_pace": 9, "max_pace": 8}).status_code, 400)
+
+    def test_page_query_uses_the_composite_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN output checked for SQLite only")
+        w = Workout.objects.filter(user=self.user).order_by("-date")[60]
+        qs = (
+            Workout.objects.filter(user=self.user)
+            .filter(Pagination._after(w.date, w.created_at, w.pk))
+            .order_by(*Pagination.ordering)[:50]
+        )
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("workout_user_date_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class DashboardCacheTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user("runner", password="pw")
+        _seed_workouts(self.user, DASHBOARD_PAGE_SIZE + 5)
+        versions.bump([self.user.pk])  # bulk_create sends no signals
+        self.client.force_login(self.user)
+        self.url = reverse("web-dashboard")
+        self.client.get(self.url)  # first visit sets the CSRF cookie, which is part of the ETag
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        self.assertIn("private", first["Cache-Control"])
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+    def test_create_and_delete_change_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        w = Workout.objects.create(user=self.user, date=timezone.now(), distance_miles=5, duration_minutes=40)
+        created = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(created.status_code, 200)
+        self.assertNotEqual(created["ETag"], etag)
+        w.delete()
+        deleted = self.client.get(self.url, HTTP_IF_NONE_MATCH=created["ETag"])
+        self.assertEqual(deleted.status_code, 200)
+        self.assertNotEqual(deleted["ETag"], etag)
+
+    def test_api_delete_changes_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        workout = Workout.objects.filter(user=self.user).latest("date")
+        api = APIClient()
+        api.force_authenticate(self.user)
+        self.assertEqual(api.get(reverse("workout-detail", args=[workout.pk])).data["id"], workout.pk)
+        self.assertEqual(api.delete(reverse("workout-detail", args=[workout.pk])).status_code, 204)
+        self.assertFalse(Workout.objects.filter(pk=workout.pk).exists())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_strava_workouts_link_to_their_page(self):
+        workout = Workout.objects.filter(user=self.user).latest("date")
+        Workout.objects.filter(pk=workout.pk).update(strava_id=987654321)
+        versions.bump([self.user.pk])
+        link = reverse("workout_detail", kwargs={"strava_id": 987654321})
+        self.assertContains(self.client.get(self.url), f'href="{link}"')
+        with mock.patch.object(services, "_run_in_background"):  # no insight generation
+            self.assertEqual(self.client.get(link).context["workout"].pk, workout.pk)
+
+    def test_table_is_rendered_from_cache(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        table = Workout._meta.db_table
+        self.assertFalse([q for q in queries if f'FROM "{table}"' in q["sql"]])
+
+    def test_pages(self):
+        first = self.client.get(self.url).content.decode()
+        self.assertIn("Page 1 of 2", first)
+        self.assertEqual(first.count("<tr>") - 1, DASHBOARD_PAGE_SIZE)
+        self.assertEqual(first.count("<td>"), 6 * DASHBOARD_PAGE_SIZE)  # one per header
+        second = self.client.get(self.url, {"page": 2})
+        self.assertEqual(second.content.decode().count("<tr>") - 1, 5)
+        self.assertNotEqual(second["ETag"], self.client.get(self.url)["ETag"])
+        self.assertEqual(self.client.get(self.url, {"page": "x"}).status_code, 200)
+
+    def test_pending_messages_are_not_hidden_by_304(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.client.post(self.url, {"file": SimpleUploadedFile("run.fit", build_fit(duration_s=60))})
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "Upload received")
+
+
+class WorkoutRowSerializationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("runner", password="pw")
+        paths = [
+            None, "", "uploads/fit/ab/abc123.fit", "uploads/fit/2025/08/01/my run é.fit",
+            "uploads/./fit/x.fit", "uploads/fit/a%20b.fit", ".hidden/x.fit",
+        ]
+        for i, path in enumerate(paths):
+            Workout.objects.create(
+                user=cls.user, date=datetime(2025, 8, 1 + i, 6, 30, 15, 123456 * (i % 2), tzinfo=dt_timezone.utc),
+                distance_miles=3.1 + i / 3, duration_minutes=25 + i, file_path=path,
+                avg_heart_rate=None if i % 3 == 0 else 140 + i,
+                avg_pace_min_per_mile=None if i == 2 else 8.0 + i / 7,
+                analytics={"trimp": 50.5 + i, "zones": [1, 2, i]} if i % 2 else None,
+            )
+
+    def assert_same(self, request):
+        qs = Workout.objects.filter(user=self.user).order_by("id")
+        expected = WorkoutSerializer(qs, many=True, context={"request": request}).data
+        self.assertEqual(serialize_workout_rows(qs.values(*WORKOUT_VALUES), request), [dict(d) for d in expected])
+
+    def test_matches_workout_serializer(self):
+        self.assert_same(APIRequestFactory().get("/api/workouts/", secure=True))
+        self.assert_same(None)
+
+    def test_matches_in_other_time_zones(self):
+        request = APIRequestFactory().get("/api/workouts/")
+        with timezone.override("America/Chicago"):
+            self.assert_same(request)
+
+    def test_list_endpoint_bytes_match(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        res = api.get(reverse("workout-list"))
+        self.assertEqual(res["Content-Type"], "application/json")
+        qs = Workout.objects.filter(user=self.user).order_by(*Pagination.ordering)
+        expected = WorkoutSerializer(qs, many=True, context={"request": res.wsgi_request}).data
+        body = JSONRenderer().render({"next": None, "previous": None, "results": expected})
+        self.assertEqual(res.content, body)
+
+    def test_paths_are_normalized_on_save(self):
+        w = Workout.objects.filter(user=self.user).first()
+        w.file_path = "uploads\\fit\\old.fit"
+        w.save()
+        w.refresh_from_db()
+        self.assertEqual(w.file_path, "uploads/fit/old.fit")
+
+
+class WorkoutRollupTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("runner", password="pw")
+
+    def add(self, day, miles=5.0, minutes=45.0, hr=150):
+        return Workout.objects.create(
+            user=self.user, date=f"{day}T07:00:00Z", distance_miles=miles,
+            duration_minutes=minutes, avg_heart_rate=hr,
+        )
+
+    def snapshot(self):
+        return {
+            (r.user_id, r.period, r.period_start): (
+                r.workout_count, round(r.distance_miles, 6), round(r.duration_minutes, 6),
+                r.heart_rate_sum, r.heart_rate_count,
+            )
+            for r in WorkoutRollup.objects.all()
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_create_and_delete_update_totals(self):
+        self.add("2025-09-01", miles=4, minutes=40)  # Monday
+        self.add("2025-09-07", miles=6, minutes=48, hr=None)  # Sunday, same ISO week
+        last = self.add("2025-09-08", miles=10, minutes=90)
+        week = WorkoutRollup.objects.get(period="week", period_start=date(2025, 9, 1))
+        self.assertEqual((week.workout_count, week.distance_miles, week.avg_pace_min_per_mile), (2, 10, 8.8))
+        self.assertEqual(week.avg_heart_rate, 150)
+        month = WorkoutRollup.objects.get(period="month", period_start=date(2025, 9, 1))
+        self.assertEqual(month.workout_count, 3)
+        self.assertMatchesRebuild()
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("web-workout-delete", args=[last.pk]))
+        self.assertFalse(WorkoutRollup.objects.filter(period="week", period_start=date(2025, 9, 8)).exists())
+        self.assertEqual(WorkoutRollup.objects.get(period="month").workout_count, 2)
+        self.assertMatchesRebuild()
+
+    def test_bulk_paths_keep_rollups_current(self):
+        from .batch import ingest_fit_batch
+        files = [SimpleUploadedFile(f"run{i}.fit", build_fit(duration_s=600 + i)) for i in range(3)]
+        ingest_fit_batch(self.user, files)
+        strava.upsert_activities(self.user, make_activities(20))
+        self.assertEqual(sum(
+            WorkoutRollup.objects.filter(period="month").values_list("workout_count", flat=True),
+        ), 23)
+        self.assertMatchesRebuild()
+
+        # Re-syncing changed activities replaces rather than adds their totals
+        acts = make_activities(20)
+        for act in acts:
+            act["distance"] *= 2
+        strava.upsert_activities(self.user, acts)
+        self.assertMatchesRebuild()
+
+    def test_moving_a_workout_refreshes_the_period_it_left(self):
+        workout = self.add("2025-09-01")
+        workout.date = "2025-10-15T07:00:00Z"
+        workout.save()
+        self.assertMatchesRebuild()
+
+        workout = Workout.objects.get(pk=workout.pk)
+        workout.date = datetime(2025, 11, 20, 7, tzinfo=dt_timezone.utc)
+        workout.save()
+        self.assertFalse(WorkoutRollup.objects.filter(period="month", period_start=date(2025, 10, 1)).exists())
+        self.assertMatchesRebuild()
+
+    def test_sync_keeps_the_summary_of_a_linked_upload(self):
+        started = datetime(2025, 8, 1, 2, 0, tzinfo=dt_timezone.utc)
+        upload = Workout.objects.create(
+            user=self.user, date=started, started_at=started, distance_miles=6.2, duration_minutes=50.0,
+            avg_heart_rate=151, content_hash="ab" * 32, file_path="uploads/fit/ab/run.fit",
+        )
+        act = make_activities(1, start=started + timedelta(seconds=10))[0]
+        act.update(start_date_local="2025-07-31T19:00:10Z", distance=6.3 * strava.M_PER_MILE, moving_time=2900)
+        for _ in range(2):
+            strava.upsert_activities(self.user, [act])
+            linked = Workout.objects.get()
+            self.assertEqual(linked.pk, upload.pk)
+            self.assertEqual(linked.strava_id, act["id"])
+            self.assertEqual(
+                (linked.date, linked.distance_miles, linked.duration_minutes, linked.avg_heart_rate),
+                (started, 6.2, 50.0, 151),
+            )
+        months = WorkoutRollup.objects.filter(period="month").values_list("period_start", flat=True)
+        self.assertEqual(list(months), [date(2025, 8, 1)])
+        self.assertMatchesRebuild()
+
+    def test_sync_moving_an_activity_refreshes_the_period_it_left(self):
+        act = make_activities(1, start=datetime(2025, 9, 30, 7, tzinfo=dt_timezone.utc))[0]
+        strava.upsert_activities(self.user, [act])
+        act["start_date_local"] = "2025-10-01T07:00:00Z"
+        strava.upsert_activities(self.user, [act])
+        self.assertFalse(WorkoutRollup.objects.filter(period="month", period_start=date(2025, 9, 1)).exists())
+        self.assertMatchesRebuild()
+
+    def test_stats_endpoint_reads_rollups_only(self):
+        for i in range(60):
+            self.add((date(2025, 1, 1) + timedelta(days=i)).isoformat())
+        api = APIClient()
+        api.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            res = api.get(reverse("workout-stats"), {"period": "month"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [(r["period_start"], r["workout_count"], r["distance_miles"]) for r in res.data],
+            [("2025-01-01", 31, 155.0), ("2025-02-01", 28, 140.0), ("2025-03-01", 1, 5.0)],
+        )
+        self.assertEqual(res.data[0]["avg_pace_min_per_mile"], 9.0)
+
+        weeks = api.get(reverse("workout-stats"), {"date_from": "2025-02-01", "date_to": "2025-02-28"})
+        self.assertEqual([r["period_start"] for r in weeks.data], ["2025-02-03", "2025-02-10", "2025-02-17", "2025-02-24"])
+        self.assertEqual(api.get(reverse("workout-stats"), {"period": "year"}).status_code, 400)
+
+    def test_rebuild_command(self):
+        self.add("2025-09-01")
+        WorkoutRollup.objects.all().delete()
+        out = io.StringIO()
+        call_command("rebuild_rollups", stdout=out)
+        self.assertIn("Rebuilt 2", out.getvalue())
+        self.assertEqual(WorkoutRollup.objects.count(), 2)
+
+
+def sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("runner", password="pw")
+        _seed_workouts(self.user, 3)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_view_latency_and_queries_are_recorded(self):
+        labels = {"view": "workout-list", "method": "GET", "status": "200"}
+        before = sample("coach_request_seconds_count", **labels)
+        queries_before = sample("coach_request_db_queries_sum", view="workout-list")
+        self.assertEqual(self.api.get(reverse("workout-list")).status_code, 200)
+        self.assertEqual(sample("coach_request_seconds_count", **labels), before + 1)
+        self.assertGreater(sample("coach_request_db_queries_sum", view="workout-list"), queries_before)
+
+    def test_unresolved_paths_share_a_label(self):
+        before = sample("coach_request_seconds_count", view="<unresolved>", method="GET", status="404")
+        self.client.get("/no/such/page/")
+        self.client.get("/nor/this/")
+        after = sample("coach_request_seconds_count", view="<unresolved>", method="GET", status="404")
+        self.assertEqual(after, before + 2)
+
+    def test_unknown_methods_share_a_label(self):
+        before = sample("coach_request_seconds_count", view="<unresolved>", method="other", status="404")
+        self.client.generic("PROPFIND", "/no/such/page/")
+        self.client.generic("X-MADE-UP", "/no/such/page/")
+        after = sample("coach_request_seconds_count", view="<unresolved>", method="other", status="404")
+        self.assertEqual(after, before + 2)
+        self.assertEqual(sample("coach_request_seconds_count", view="<unresolved>", method="PROPFIND", status="404"), 0)
+
+    def test_spans(self):
+        before = sample("coach_span_seconds_count", span="parse_fit")
+        parse_fit(io.BytesIO(build_fit(duration_s=60)))
+        self.assertEqual(sample("coach_span_seconds_count", span="parse_fit"), before + 1)
+
+    @override_settings(METRICS_TIMING_HEADER=True)
+    def test_timing_header(self):
+        res = self.api.get(reverse("workout-list"))
+        timing = res["Server-Timing"]
+        self.assertRegex(timing, r"^total;dur=[\d.]+")
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+x"')
+
+    @override_settings(METRICS_TIMING_HEADER=True)
+    async def test_timing_header_counts_queries_of_async_views(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        res = await client.get(reverse("dashboard"))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("db;dur=", res["Server-Timing"])
+
+    @override_settings(METRICS_TIMING_HEADER=False)
+    def test_timing_header_off(self):
+        self.assertNotIn("Server-Timing", self.api.get(reverse("workout-list")))
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_endpoint(self):
+        self.api.get(reverse("workout-list"))
+        res = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+        body = res.content.decode()
+        self.assertIn('coach_request_seconds_bucket{le="0.005",method="GET",status="200",view="workout-list"}', body)
+        self.assertIn("coach_db_queries_total", body)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cre").status_code, 401)
+        res = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_metrics_closed_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def report(self, **values):
+        results = [
+            {"name": name, "value": value, "unit": "s" if name.endswith("seconds") else "records/s",
+             "better": "lower" if name.endswith("seconds") else "higher"}
+            for name, value in values.items()
+        ]
+        return {"meta": {}, "results": results}
+
+    def test_compare(self):
+        baseline = self.report(list_seconds=0.010, parse_per_second=1000.0, gone_seconds=1.0)
+        current = self.report(list_seconds=0.011, parse_per_second=700.0, new_seconds=2.0)
+        rows = {r["name"]: r for r in benchmarks.compare(current, baseline, tolerance=0.25)}
+        self.assertEqual(set(rows), {"list_seconds", "parse_per_second"})
+        self.assertFalse(rows["list_seconds"]["regressed"])  # 10% slower
+        self.assertTrue(rows["parse_per_second"]["regressed"])  # 30% less throughput
+        self.assertAlmostEqual(rows["list_seconds"]["ratio"], 1.1)
+
+    def test_command_fails_on_regression(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        baseline = os.path.join(tmp, "baseline.json")
+        output = os.path.join(tmp, "report.json")
+        with open(baseline, "w") as f:
+            json.dump(self.report(list_seconds=0.010), f)
+
+        with mock.patch.object(benchmarks, "run_suite", return_value=self.report(list_seconds=0.011)):
+            call_command("benchmark", baseline=baseline, output=output, stderr=io.StringIO())
+        with open(output) as f:
+            self.assertEqual(json.load(f)["results"][0]["value"], 0.011)
+
+        with mock.patch.object(benchmarks, "run_suite", return_value=self.report(list_seconds=0.020)):
+            with self.assertRaisesMessage(CommandError, "list_seconds"):
+                call_command("benchmark", baseline=baseline, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    def open(self, **overrides):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        db = DatabaseWrapper(dict(connection.settings_dict, NAME=os.path.join(tmp, "db.sqlite3")))
+        with override_settings(**overrides):
+            db.connect()
+        self.addCleanup(db.close)
+        return db
+
+    def pragmas(self, db):
+        with db.cursor() as cursor:
+            return {
+                name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ("journal_mode", "busy_timeout", "synchronous")
+            }
+
+    def test_new_connections_are_tuned(self):
+        db = self.open(SQLITE_TUNED=True, SQLITE_BUSY_TIMEOUT_MS=1234)
+        self.assertEqual(self.pragmas(db), {"journal_mode": "wal", "busy_timeout": 1234, "synchronous": 1})
+
+    def test_tuning_can_be_turned_off(self):
+        db = self.open(SQLITE_TUNED=False)
+        self.assertEqual(self.pragmas(db)["journal_mode"], "delete")
+
+
+class SampleStorageTests(MediaRootMixin, TestCase):
+    def test_extract_samples_backfills_existing_uploads(self):
+        user = User.objects.create_user("runner", password="pw")
+        rel_path, _ = jobs.save_fit_upload(SimpleUploadedFile("old.fit", build_fit(duration_s=120)))
+        old = Workout.objects.create(
+            user=user, date="2025-08-01T12:00:00Z", distance_miles=0.2, duration_minutes=2, file_path=rel_path,
+        )
+        self.assertIsNone(old.samples)
+        call_command("extract_samples", stdout=io.StringIO())
+        old.refresh_from_db()
+        self.assertEqual(len(old.samples), 121)
+        self.assertEqual(sorted(old.samples.to_dict()), sorted(old.samples.columns))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class WorkoutSeriesTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user("runner", password="pw")
+        _, columns = parse_fit_samples(build_fit(duration_s=3600))
+        self.workout = Workout.objects.create(
+            user=self.user, date=timezone.now(), distance_miles=6, duration_minutes=60,
+            samples_path=write_samples("uploads/fit/run.fit.samples", columns),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("workout-series", args=[self.workout.pk])
+
+    def test_lttb_matches_reference(self):
+        rng = np.random.default_rng(7)
+        for n, points in ((10, 3), (10, 9), (1000, 100), (5000, 333), (20000, 2000)):
+            x = np.cumsum(rng.uniform(0.5, 1.5, n))
+            y = np.cumsum(rng.normal(size=n))
+            expected = lttb_naive(x.tolist(), y.tolist(), points)
+            self.assertEqual(series.lttb(x, y, points).tolist(), expected)
+            with mock.patch.object(series, "LTTB_SWEEPS", 0):
+                self.assertEqual(series.lttb(x, y, points).tolist(), expected)
+        self.assertEqual(series.lttb(np.arange(5.0), np.zeros(5), 10).tolist(), [0, 1, 2, 3, 4])
+
+    def test_series_are_downsampled(self):
+        res = self.client.get(self.url, {"points": 200})
+        self.assertEqual(res.status_code, 200)
+        data = res.json()
+        self.assertEqual(sorted(data["series"]), sorted(series.SERIES))
+        for name, s in data["series"].items():
+            self.assertEqual(len(s["t"]), 200, name)
+            self.assertEqual(len(s["values"]), 200, name)
+            self.assertEqual(s["t"][0], 0)
+            self.assertEqual(s["t"][-1], 3600)
+        pace = data["series"]["pace"]
+        self.assertEqual(pace["unit"], "min/mi")
+        self.assertTrue(all(4 < v < 20 for v in pace["values"]))
+
+        only = self.client.get(self.url, {"series": "heart_rate", "points": 50}).json()
+        self.assertEqual(list(only["series"]), ["heart_rate"])
+        self.assertEqual(len(only["series"]["heart_rate"]["t"]), 50)
+
+    def test_not_modified_without_reading_samples(self):
+        first = self.client.get(self.url)
+        self.assertTrue(first["ETag"].startswith('"'))
+        self.assertIn("private", first["Cache-Control"])
+        with mock.patch.object(Workout, "samples", new_callable=mock.PropertyMock) as samples:
+            again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        samples.assert_not_called()
+        other = self.client.get(self.url, {"points": 100}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other["ETag"], first["ETag"])
+
+    def test_rewritten_samples_change_etag_and_cache(self):
+        first = self.client.get(self.url, {"points": 100})
+        self.assertEqual(first.json()["series"]["pace"]["t"][-1], 3600)
+        _, columns = parse_fit_samples(build_fit(duration_s=1800))
+        write_samples(self.workout.samples_path, columns)  # same path, e.g. a re-import
+        again = self.client.get(self.url, {"points": 100}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again["ETag"], first["ETag"])
+        self.assertEqual(again.json()["series"]["pace"]["t"][-1], 1800)
+
+    def test_series_are_cached_per_resolution(self):
+        with mock.patch.object(series, "series_for", wraps=series.series_for) as compute:
+            self.client.get(self.url, {"series": "pace,elevation", "points": 100})
+            self.assertEqual(compute.call_count, 2)
+            self.client.get(self.url, {"series": "elevation,pace,heart_rate", "points": 100})
+            self.assertEqual(compute.call_count, 3)
+            self.client.get(self.url, {"series": "pace", "points": 101})
+            self.assertEqual(compute.call_count, 4)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url, {"points": 2}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"series": "power"}).status_code, 400)
+        bare = Workout.objects.create(user=self.user, date=timezone.now(), distance_miles=3, duration_minutes=30)
+        self.assertEqual(self.client.get(reverse("workout-series", args=[bare.pk])).status_code, 404)
+        other = User.objects.create_user("other", password="pw")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class SimilarWorkoutTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        similarity.clear()
+        self.addCleanup(similarity.clear)
+        self.user = User.objects.create_user("runner", password="pw")
+        rng = np.random.default_rng(3)
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        Workout.objects.bulk_create([
+            Workout(
+                user=self.user,
+                date=start + timedelta(days=i, minutes=int(rng.integers(0, 1440))),
+                distance_miles=float(rng.uniform(2, 15)),
+                duration_minutes=60,
+                avg_pace_min_per_mile=float(rng.uniform(6, 11)),
+                avg_heart_rate=None if i % 7 == 0 else int(rng.integers(120, 180)),
+                analytics={"trimp": float(rng.uniform(20, 200))} if i % 3 else None,
+            )
+            for i in range(60)
+        ])
+        versions.bump([self.user.pk])  # bulk_create sends no signals
+        self.ids = list(Workout.objects.filter(user=self.user).order_by("id").values_list("id", flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_neighbors_match_brute_force(self):
+        index = similarity.get_index(self.user.pk)
+        self.assertEqual(len(index), 60)
+        for target in (self.ids[0], self.ids[1], self.ids[30]):  # without HR, without TRIMP, with both
+            expected = similar_brute_force(self.user.pk, target, 8)
+            found = index.neighbors(target, 8)
+            self.assertEqual([pk for pk, _ in found], [pk for pk, _ in expected])
+            for (_, a), (_, b) in zip(found, expected):
+                self.assertAlmostEqual(a, b, places=9)
+
+    def test_time_of_day_wraps_around_midnight(self):
+        late, early, noon = (datetime(2025, 1, 1, h, 30, tzinfo=dt_timezone.utc) for h in (23, 0, 12))
+        values, _ = similarity.feature_matrix([(5, 8, 150, when, None) for when in (late, early, noon)])
+        self.assertLess(np.linalg.norm(values[0] - values[1]), 0.6)
+        self.assertGreater(np.linalg.norm(values[0] - values[2]), 3)
+
+    def test_endpoint(self):
+        url = reverse("workout-similar", args=[self.ids[5]])
+        res = self.client.get(url, {"k": 4})
+        self.assertEqual(res.status_code, 200)
+        results = res.json()["results"]
+        self.assertEqual([r["id"] for r in results], [pk for pk, _ in similar_brute_force(self.user.pk, self.ids[5], 4)])
+        distances = [r["similarity_distance"] for r in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertIn("distance_miles", results[0])
+        self.assertEqual(len(self.client.get(url, {"k": 100}).json()["results"]), 59)
+        self.assertEqual(self.client.get(url, {"k": 0}).status_code, 400)
+
+        other = User.objects.create_user("other", password="pw")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_single_saves_and_deletes_update_the_index_in_place(self):
+        index = similarity.get_index(self.user.pk)
+        w = Workout.objects.create(
+            user=self.user, date=timezone.now(), distance_miles=5, duration_minutes=40, avg_pace_min_per_mile=8,
+        )
+        self.assertIs(similarity.get_index(self.user.pk), index)
+        self.assertIn(w.pk, index)
+        w.distance_miles = 14
+        w.save()
+        self.assertIs(similarity.get_index(self.user.pk), index)
+        self.assertEqual(
+            [pk for pk, _ in index.neighbors(w.pk, 5)], [pk for pk, _ in similar_brute_force(self.user.pk, w.pk, 5)],
+        )
+        Workout.objects.get(pk=self.ids[0]).delete()
+        self.assertIs(similarity.get_index(self.user.pk), index)
+        self.assertNotIn(self.ids[0], index)
+        self.assertEqual(len(index), 60)
+        self.assertEqual(
+            [pk for pk, _ in index.neighbors(self.ids[10], 5)],
+            [pk for pk, _ in similar_brute_force(self.user.pk, self.ids[10], 5)],
+        )
+
+    def test_changes_from_other_processes_are_caught_up(self):
+        index = similarity.get_index(self.user.pk)
+        # What the upload worker, batch and Strava paths do: no signals reach this index
+        with mock.patch.object(similarity, "_apply"):
+            _seed_workouts(self.user, 3)
+            Workout.objects.filter(pk=self.ids[4]).update(distance_miles=14.5, updated_at=timezone.now())
+            Workout.objects.filter(pk__in=self.ids[:2]).delete()
+        versions.bump([self.user.pk])
+
+        with mock.patch.object(similarity.SimilarityIndex, "build") as build:
+            caught_up = similarity.get_index(self.user.pk)
+        build.assert_not_called()
+        self.assertIs(caught_up, index)
+        self.assertEqual(len(index), 61)
+        self.assertEqual(index.token, versions.stamp_token(versions.get_stamp(self.user)))
+        for target in (self.ids[4], self.ids[20], Workout.objects.latest("id").pk):
+            self.assertEqual(
+                [pk for pk, _ in index.neighbors(target, 6)],
+                [pk for pk, _ in similar_brute_force(self.user.pk, target, 6)],
+            )
+
+        # Nothing to catch up from: rebuilt
+        index.synced_at = None
+        versions.bump([self.user.pk])
+        rebuilt = similarity.get_index(self.user.pk)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(len(rebuilt), 61)
+
+    def test_unsaved_dates_are_normalised(self):
+        for value, expected in [
+            (date(2025, 8, 2), datetime(2025, 8, 2, tzinfo=dt_timezone.utc)),
+            (datetime(2025, 8, 2, 7, 30), datetime(2025, 8, 2, 7, 30, tzinfo=dt_timezone.utc)),
+            ("2025-08-02T07:30:00", datetime(2025, 8, 2, 7, 30, tzinfo=dt_timezone.utc)),
+            ("2025-08-02", datetime(2025, 8, 2, tzinfo=dt_timezone.utc)),
+        ]:
+            workout = Workout(user=self.user, date=value, distance_miles=5.0, duration_minutes=45.0)
+            self.assertEqual(similarity.source_row(workout)[3], expected)
+
+    def test_upload_without_timestamps_is_indexed(self):
+        index = similarity.get_index(self.user.pk)
+        data = build_fit(duration_s=600, timestamps=False, with_session=False)
+        res = self.client.post(reverse("upload-fit"), {"file": SimpleUploadedFile("run.fit", data)}, format="multipart")
+        self.assertEqual(res.status_code, 202)
+        jobs.run_pending()
+        job = UploadJob.objects.get()
+        self.assertEqual(job.status, UploadJob.DONE)
+        self.assertTrue(timezone.is_aware(job.workout.date))
+        self.assertIn(job.workout.pk, index)
+        self.assertIn(job.workout.pk, similarity.get_index(self.user.pk))
+
+    def test_concurrent_queries_refresh_once(self):
+        stamp = versions.get_stamp(self.user)
+        built = []
+
+        def build(user_id, stamp):
+            built.append(user_id)
+            time.sleep(0.05)
+            return similarity.SimilarityIndex(user_id, [], np.zeros((0, 18)), stamp.version, "t")
+
+        with mock.patch.object(versions, "get_stamp_for", return_value=stamp), \
+                mock.patch.object(versions, "stamp_token", return_value="t"), \
+                mock.patch.object(similarity.SimilarityIndex, "build", side_effect=build):
+            threads = [threading.Thread(target=similarity.get_index, args=(self.user.pk,)) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(built, [self.user.pk])
+
+    def test_persistence(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(SIMILARITY_INDEX_DIR=directory):
+            call_command("build_similarity_index", stdout=io.StringIO())
+            self.assertTrue(os.path.exists(similarity.index_path(self.user.pk)))
+            with mock.patch.object(similarity.SimilarityIndex, "build") as build:
+                loaded = similarity.get_index(self.user.pk)
+            build.assert_not_called()
+            self.assertEqual(loaded.neighbors(self.ids[3], 5), similarity.SimilarityIndex.build(
+                self.user.pk, versions.get_stamp(self.user)).neighbors(self.ids[3], 5))
+
+            similarity.clear()
+            Workout.objects.filter(pk=self.ids[0]).delete()  # signals, but no index loaded to update
+            with mock.patch.object(similarity.SimilarityIndex, "build") as build:
+                self.assertNotIn(self.ids[0], similarity.get_index(self.user.pk))  # caught up from disk
+            build.assert_not_called()
@@ -0,0 +1,203 @@
+# training/uploads.py
+"""
+Single-pass handling of .fit uploads.
+
+Django's default handlers buffer an upload (in memory, or in a temp file
+once it passes FILE_UPLOAD_MAX_MEMORY_SIZE) and the view then copies it
+into MEDIA_ROOT. FitUploadHandler instead tees each chunk as it arrives:
+
+    -> the file's final home under MEDIA_ROOT (renamed into place by hash)
+    -> sha256, for the content-addressed path and dedup
+    -> an in-memory buffer the parser reads, so the stored file is never
+       opened again during the request
+
+Nothing is written until the first PROBE_BYTES have passed
+fit_utils.probe_fit(), so files that aren't FIT activities are turned
+away without touching the disk.
+
+Other files (e.g. ZIP archives) pass through to Django's handlers.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .fit_utils import PROBE_BYTES, probe_fit_safe
+from .jobs import fit_tmp_dir, store_fit_tmp
+
+FILE_TOO_LARGE = "File too large"
+
+
+class StoredFitFile(UploadedFile):
+    """
+    A .fit upload that FitUploadHandler has already written to ``rel_path``.
+    Reads come from the in-memory copy when there is one, otherwise from
+    the stored file, opened on first use. ``error`` is set (and nothing is
+    stored) when the file was rejected; ``fit_probe`` caches the
+    probe_fit_safe() result for probe_upload().
+    """
+
+    def __init__(self, buffer, name, content_type, size, charset, content_type_extra=None,
+                 rel_path=None, content_hash=None, error=None, fit_probe=None):
+        self.rel_path = rel_path
+        self.content_hash = content_hash
+        self.error = error
+        self.fit_probe = fit_probe or ((None, error) if error else None)
+        super().__init__(buffer, name, content_type, size, charset, content_type_extra)
+
+    @property
+    def file(self):
+        if self._file is None and self.rel_path:
+            self._file = open(os.path.join(settings.MEDIA_ROOT, self.rel_path), "rb")
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class FitUploadHandler(FileUploadHandler):
+    """
+    Upload handler for .fit files; see the module docstring. Files over
+    FIT_UPLOAD_MAX_BYTES, or that fail the probe, are discarded as they
+    stream and come back as a StoredFitFile with ``error`` set. Up to
+    FIT_UPLOAD_MEMORY_BYTES per request is kept in memory; later files are
+    read back from storage.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = settings.FIT_UPLOAD_MAX_BYTES
+        self.memory_left = settings.FIT_UPLOAD_MEMORY_BYTES
+        self.active = False
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.active = (file_name or "").lower().endswith(".fit")
+        if not self.active:
+            return
+        self.out = None  # opened once the head passes the probe
+        self.head = bytearray()
+        self.probe = None
+        self.digest = hashlib.sha256()
+        self.buffer = io.BytesIO()
+        self.size = 0
+        self.error = None
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error:
+            return None
+        self.size += len(raw_data)
+        if self.size > self.max_bytes:
+            self._reject(FILE_TOO_LARGE)
+            return None
+        self.digest.update(raw_data)
+        if self.buffer is not None:
+            if self.size <= self.memory_left:
+                self.buffer.write(raw_data)
+            else:
+                self.buffer = None
+        if self.out is not None:
+            self.out.write(raw_data)
+            return None
+        self.head += raw_data
+        if len(self.head) >= PROBE_BYTES:
+            self._open()
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        if self.out is None and not self.error:
+            self._open(size=file_size)  # smaller than PROBE_BYTES
+        if not self.error and file_size < self.probe["file_size"]:
+            self._reject("Truncated .FIT file")
+        if self.error:
+            return StoredFitFile(
+                io.BytesIO(), self.file_name, self.content_type, file_size, self.charset, self.content_type_extra,
+                error=self.error,
+            )
+        self.out.close()
+        content_hash = self.digest.hexdigest()
+        rel_path = store_fit_tmp(self.tmp_path, content_hash)
+        if self.buffer is not None:
+            self.memory_left -= file_size
+            self.buffer.seek(0)
+        return StoredFitFile(
+            self.buffer, self.file_name, self.content_type, file_size, self.charset, self.content_type_extra,
+            rel_path=rel_path, content_hash=content_hash, fit_probe=(self.probe, None),
+        )
+
+    def upload_interrupted(self):
+        if self.active:
+            self._discard()
+
+    def _open(self, size=None):
+        """Probe the head; if it's a FIT file, start writing it to disk."""
+        self.probe, error = probe_fit_safe(self.head, size)
+        if error:
+            self._reject(error)
+            return
+        fd, self.tmp_path = tempfile.mkstemp(dir=fit_tmp_dir(), suffix=".fit")
+        self.out = os.fdopen(fd, "wb")
+        self.out.write(self.head)
+        self.head = None
+
+    def _reject(self, error):
+        self.error = error
+        self._discard()
+
+    def _discard(self):
+        if self.out is not None:
+            self.out.close()
+            if os.path.exists(self.tmp_path):
+                os.unlink(self.tmp_path)
+            self.out = None
+        self.head = None
+        self.buffer = None
+
+
+def probe_upload(f):
+    """
+    fit_utils.probe_fit_safe() for an uploaded file, worked out once per
+    file: FitUploadHandler probes its files while they stream, anything
+    else is probed here from its first PROBE_BYTES. Returns (probe, None)
+    or (None, error message).
+    """
+    result = getattr(f, "fit_probe", None)
+    if result is None:
+        f.seek(0)
+        head = f.read(PROBE_BYTES)
+        f.seek(0)
+        result = probe_fit_safe(head, f.size)
+        f.fit_probe = result
+    return result
+
+
+def use_fit_upload_handler(request):
+    """
+    Put FitUploadHandler in front of ``request``'s upload handlers. Must run
+    before anything reads request.POST or request.FILES (CSRF checks included).
+    """
+    request.upload_handlers.insert(0, FitUploadHandler(request))
+
+
+class FitUploadHandlerMixin:
+    """For APIViews: install FitUploadHandler before authentication parses the body."""
+
+    def initial(self, request, *args, **kwargs):
+        if request.method == "POST":
+            use_fit_upload_handler(request._request)
+        super().initial(request, *args, **kwargs)
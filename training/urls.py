@@ -1,8 +1,11 @@
 from django.urls import path
 from .views import (
     FitUploadView,
+    FitBatchUploadView,
+    UploadJobStatusView,
     WorkoutListView,
     WorkoutDetailView,
+    WorkoutStatsView,
     strava_login,
     strava_callback,
 )
@@ -10,12 +13,19 @@ from . import views
 
 urlpatterns = [
     path("upload/fit/", FitUploadView.as_view(), name="upload-fit"),
+    path("upload/fit/batch/", FitBatchUploadView.as_view(), name="upload-fit-batch"),
+    path("upload/jobs/<int:pk>/", UploadJobStatusView.as_view(), name="upload-job-status"),
     path("workouts/", WorkoutListView.as_view(), name="workout-list"),
-    path("workouts/<uuid:id>/", WorkoutDetailView.as_view(), name="workout-detail"),
+    path("workouts/<int:id>/", WorkoutDetailView.as_view(), name="workout-detail"),
+    path("workouts/<int:pk>/series/", views.WorkoutSeriesView.as_view(), name="workout-series"),
+    path("workouts/<int:pk>/similar/", views.WorkoutSimilarView.as_view(), name="workout-similar"),
+    path("stats/", WorkoutStatsView.as_view(), name="workout-stats"),
     path("strava/login/", strava_login, name="strava-login"),
     path("strava/callback/", strava_callback, name="strava-callback"),
     path("api/strava/login/", views.strava_login, name="strava-login"),
     path("api/strava/callback/", views.strava_callback, name="strava-callback"),
-    path("workouts/<int:strava_id>/", views.workout_detail, name="workout_detail"),
+    path("strava/sync/", views.strava_sync, name="strava-sync"),
+    path("strava/webhook/", views.strava_webhook, name="strava-webhook"),
+    path("workouts/strava/<int:strava_id>/", views.workout_detail, name="workout_detail"),
     # path("workout/<int:pk>/delete/", views.workout_delete, name="web-workout-delete"),
 ]
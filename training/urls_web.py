@@ -1,11 +1,11 @@
 # training/urls_web.py
 from django.urls import path
 from . import views
-from .views import DashboardView, WorkoutPageView, WorkoutDeleteView
+from .views import DashboardView, WorkoutDeleteView
 
 urlpatterns = [
     path("", DashboardView.as_view(), name="web-dashboard"),
-    path("workout/<uuid:id>/", WorkoutPageView.as_view(), name="web-workout-detail"),
-    path("workout/<uuid:id>/delete/", WorkoutDeleteView.as_view(), name="web-workout-delete"),
+    path("workout/<int:id>/", views.workout_page, name="web-workout-detail"),
+    path("workout/<int:id>/delete/", WorkoutDeleteView.as_view(), name="web-workout-delete"),
     path("dashboard/", views.dashboard, name="dashboard"),
 ]
@@ -0,0 +1,47 @@
+# training/versions.py
+"""
+Per-user workout list version stamps (WorkoutListVersion).
+
+Every path that writes workouts bumps the stamp: the signal handlers in
+training/signals.py for single rows, and the bulk paths (batch upload,
+Strava upsert) themselves, like they do for rollups. Readers get an ETag /
+cache key component and a Last-Modified time from one primary-key lookup,
+without touching the Workout table.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import WorkoutListVersion
+
+
+def bump(user_ids):
+    """Mark the workouts of ``user_ids`` as changed."""
+    now = timezone.now()
+    for user_id in set(user_ids):
+        updated = WorkoutListVersion.objects.filter(user_id=user_id).update(version=F("version") + 1, changed_at=now)
+        if not updated:
+            _, created = WorkoutListVersion.objects.get_or_create(
+                user_id=user_id, defaults={"version": 1, "changed_at": now},
+            )
+            if not created:  # someone else created it meanwhile; still count our change
+                WorkoutListVersion.objects.filter(user_id=user_id).update(version=F("version") + 1, changed_at=now)
+
+
+def get_stamp(user):
+    """The user's WorkoutListVersion; version 0 with no changed_at if they never had workouts."""
+    return get_stamp_for(user.pk)
+
+
+def get_stamp_for(user_id):
+    """get_stamp() by user id, for callers that don't have the user loaded."""
+    stamp = WorkoutListVersion.objects.filter(user_id=user_id).first()
+    return stamp or WorkoutListVersion(user_id=user_id, version=0, changed_at=None)
+
+
+def stamp_token(stamp):
+    """
+    Short string identifying ``stamp``. The change time is part of it, so
+    tokens don't repeat if the database is recreated and versions restart.
+    """
+    changed = int(stamp.changed_at.timestamp() * 1_000_000) if stamp.changed_at else 0
+    return f"{stamp.version}.{changed:x}"
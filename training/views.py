@@ -1,42 +1,66 @@
+import hashlib
+import json
 import os
 import posixpath
-from openai import OpenAI
 
 
-from datetime import datetime, timezone as dt_timezone, date as date_cls
-
 from django.conf import settings
-from django.core.files.storage import FileSystemStorage
 from django.contrib.auth import get_user_model
 
 from rest_framework import status, permissions, generics, serializers
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 # Django imports
 from django.views import View
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
 # from django.http import HttpResponse
 from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition, require_http_methods, require_POST
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from django.template.loader import render_to_string
+from django.urls import reverse
 
 # Local imports
-from .fit_utils import parse_fit
-from .models import Workout, StravaToken
-from .serializers import WorkoutSerializer
+from . import dedup, metrics, series, services, similarity, strava, versions
+from .batch import ingest_fit_batch
+from .jobs import save_fit_upload, enqueue_fit_upload
+from .models import Workout, WorkoutInsight, WorkoutRollup, StravaSyncState, StravaToken, UploadJob
+from .pagination import WorkoutCursorPagination
+from .samples import samples_version
+from .renderers import ORJSONRenderer
+from .serializers import (
+    WorkoutSerializer, WorkoutFilterSerializer, WorkoutRollupSerializer, StatsFilterSerializer, UploadJobSerializer,
+    SeriesParamsSerializer, SimilarParamsSerializer,
+    WORKOUT_VALUES, serialize_workout_rows,
+)
+from .uploads import FILE_TOO_LARGE, FitUploadHandlerMixin, probe_upload, use_fit_upload_handler
 from .forms import FitUploadForm
 
-# External library
-import requests
-
 # from django.utils.timezone import now
 from django.utils import timezone
 
 
 User = get_user_model()
 
+# Most recent Strava workouts shown on the dashboard
+DASHBOARD_WORKOUTS = 20
+
+# Web dashboard workout table: rows per page, and how long a rendered page
+# stays cached (entries are keyed by the list version, so never stale)
+DASHBOARD_PAGE_SIZE = 25
+DASHBOARD_TABLE_TIMEOUT = 60 * 60
+
 
 # ---------- Auth: Register ----------
 class RegisterSerializer(serializers.ModelSerializer):
@@ -63,7 +87,7 @@ class RegisterView(generics.CreateAPIView):
 
 
 # ---------- Workouts (API Upload + List + Detail) ----------
-class FitUploadView(APIView):
+class FitUploadView(FitUploadHandlerMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -72,50 +96,120 @@ class FitUploadView(APIView):
             return Response({"detail": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
         if not f.name.lower().endswith(".fit"):
             return Response({"detail": "Only .fit files are allowed"}, status=status.HTTP_400_BAD_REQUEST)
+        if getattr(f, "error", None) == FILE_TOO_LARGE:
+            return Response({"detail": f.error}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        probe, error = probe_upload(f)
+        if error:
+            return Response({"detail": f"Not a valid .fit file: {error}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save to media/uploads/fit/YYYY/MM/DD/
-        subdir = os.path.join("uploads", "fit", datetime.now().strftime("%Y/%m/%d"))
-        storage = FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, subdir))
-        filename = storage.save(f.name, f)
-
-        # Normalize for URL
-        rel_path = f"{subdir}/{filename}".replace("\\", "/")
+        # Store the bytes and hand parsing off to the worker pool (run_fit_worker)
+        rel_path, content_hash = save_fit_upload(f)
 
         # Absolute, clickable URL
         file_url = request.build_absolute_uri(
             posixpath.join(settings.MEDIA_URL.rstrip("/"), rel_path)
         )
 
-        # Parse metrics
-        saved_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-        with open(saved_path, "rb") as saved_file:
-            metrics = parse_fit(saved_file)
-
-        if not metrics.get("date"):
-            metrics["date"] = date_cls.today()
-
-        # Persist (attach to current user)
-        w = Workout.objects.create(
-            user=request.user,
-            date=metrics["date"],
-            distance_miles=metrics["distance_miles"],
-            duration_minutes=metrics["duration_minutes"],
-            avg_heart_rate=metrics["avg_heart_rate"],
-            avg_pace_min_per_mile=metrics["avg_pace_min_per_mile"],
-            file_path=rel_path,
+        # Same file (or another export of the same recording) uploaded before: nothing to parse
+        existing = (
+            dedup.find_duplicate(request.user, content_hash)
+            or dedup.find_same_recording(request.user, probe["fit_file_id"])
         )
+        if existing is not None:
+            return Response({
+                "status": "duplicate",
+                "workout": WorkoutSerializer(existing, context={"request": request}).data,
+                "file_url": file_url,
+            }, status=status.HTTP_200_OK)
+
+        job = enqueue_fit_upload(request.user, rel_path, content_hash)
+
+        return Response({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": request.build_absolute_uri(reverse("upload-job-status", args=[job.id])),
+            "file_url": file_url,
+        }, status=status.HTTP_202_ACCEPTED)
 
-        data = WorkoutSerializer(w, context={"request": request}).data
-        data["file_url"] = file_url
-        return Response(data, status=status.HTTP_201_CREATED)
+
+class FitBatchUploadView(FitUploadHandlerMixin, APIView):
+    """Many .fit files (form-data key ``files``) and/or ZIP archives in one request."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        files = request.FILES.getlist("files") or request.FILES.getlist("file")
+        if not files:
+            return Response({"detail": "No files provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = ingest_fit_batch(request.user, files)
+        counts = {key: 0 for key in ("created", "linked", "duplicate", "error")}
+        for r in results:
+            counts[r["status"]] += 1
+        if counts["created"]:
+            code = status.HTTP_201_CREATED
+        elif counts["linked"] or counts["duplicate"]:
+            code = status.HTTP_200_OK
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response({
+            "created": counts["created"],
+            "linked": counts["linked"],
+            "duplicates": counts["duplicate"],
+            "failed": counts["error"],
+            "results": results,
+        }, status=code)
+
+
+class UploadJobStatusView(generics.RetrieveAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = UploadJobSerializer
+
+    def get_queryset(self):
+        return UploadJob.objects.filter(user=self.request.user).select_related("workout")
 
 
 class WorkoutListView(generics.ListAPIView):
+    """
+    Newest workouts first, one cursor-paginated page at a time. Optional
+    filters: date_from/date_to, min_distance/max_distance (miles),
+    min_pace/max_pace (min/mile).
+    """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = WorkoutSerializer
+    pagination_class = WorkoutCursorPagination
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        filters = WorkoutFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        return filters.filter_queryset(Workout.objects.filter(user=self.request.user))
+
+    def list(self, request, *args, **kwargs):
+        # Plain rows through serialize_workout_rows(): same output as WorkoutSerializer
+        rows = self.paginate_queryset(self.get_queryset().values(*WORKOUT_VALUES))
+        return self.get_paginated_response(serialize_workout_rows(rows, request))
+
+
+class WorkoutStatsView(generics.ListAPIView):
+    """
+    Weekly (?period=week, the default) or monthly (?period=month) totals,
+    oldest first, read from the precomputed rollups. Optional date_from /
+    date_to bound the period start dates.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = WorkoutRollupSerializer
+    pagination_class = None
 
     def get_queryset(self):
-        return Workout.objects.filter(user=self.request.user).order_by("-date", "-created_at")
+        params = StatsFilterSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+        qs = WorkoutRollup.objects.filter(user=self.request.user, period=filters["period"])
+        if "date_from" in filters:
+            qs = qs.filter(period_start__gte=filters["date_from"])
+        if "date_to" in filters:
+            qs = qs.filter(period_start__lte=filters["date_to"])
+        return qs.order_by("period_start")
 
 
 class WorkoutDetailView(generics.RetrieveDestroyAPIView):
@@ -127,101 +221,211 @@ class WorkoutDetailView(generics.RetrieveDestroyAPIView):
         return Workout.objects.filter(user=self.request.user)
 
 
+
+class WorkoutSeriesView(APIView):
+    """
+    Pace, heart rate and elevation over elapsed time, downsampled with LTTB
+    (training/series.py) for charts: ?series=pace,heart_rate,elevation
+    (default all) and ?points= per series (default 500). Each series is
+    cached per resolution, and the strong ETag lets clients revalidate
+    without the samples being read at all.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, pk):
+        params = SeriesParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        names, points = params.validated_data["series"], params.validated_data["points"]
+        workout = get_object_or_404(Workout.objects.only("id", "samples_path"), pk=pk, user=request.user)
+        version = samples_version(workout.samples_path)
+        if version is None:
+            return Response({"detail": "This workout has no samples."}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{series.series_etag(workout, version, names, points)}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = self._series(workout, version, names, points)
+            if data is None:
+                return Response({"detail": "This workout has no samples."}, status=status.HTTP_404_NOT_FOUND)
+            response = Response({"id": workout.pk, "points": points, "series": data})
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @staticmethod
+    def _series(workout, version, names, points):
+        keys = {name: series.series_key(workout, version, name, points) for name in names}
+        cached = cache.get_many(list(keys.values()))
+        missing = [name for name in names if keys[name] not in cached]
+        if missing:
+            samples = workout.samples
+            if samples is None:
+                return None
+            with metrics.span("series_downsample"):
+                computed = {keys[name]: series.series_for(samples, name, points) for name in missing}
+            cache.set_many(computed, series.SERIES_CACHE_TIMEOUT)
+            cached.update(computed)
+        return {name: cached[keys[name]] for name in names}
+
+
+
+class WorkoutSimilarView(APIView):
+    """
+    The user's k workouts most like this one (?k=, default 10): similar
+    distance, pace, heart rate, time of day and training load, nearest
+    first. ``similarity_distance`` is in the feature units described in
+    training/similarity.py; lower is closer.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, pk):
+        params = SimilarParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        index = similarity.get_index(request.user.pk)
+        with metrics.span("similarity_query"):
+            neighbors = index.neighbors(pk, params.validated_data["k"])
+        if neighbors is None:  # not one of this user's workouts
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        rows = {row["id"]: row for row in Workout.objects.filter(
+            user=request.user, pk__in=[workout_id for workout_id, _ in neighbors],
+        ).values(*WORKOUT_VALUES)}
+        found = [(rows[workout_id], distance) for workout_id, distance in neighbors if workout_id in rows]
+        results = serialize_workout_rows([row for row, _ in found], request)
+        for item, (_, distance) in zip(results, found):
+            item["similarity_distance"] = round(distance, 4)
+        return Response({"id": pk, "results": results})
+
+
 # ---------- Dashboard (Web upload + list) ----------
+# The upload handler has to be installed before the CSRF check reads the
+# body, so CSRF is checked in post() instead of by the middleware.
+def _dashboard_page(request):
+    page = request.GET.get("page") or "1"
+    return int(page) if page.isdigit() and int(page) > 0 else 1
+
+
+def _dashboard_stamp(request):
+    """
+    The user's list version, or None when the page must be rendered anyway
+    (flash messages are pending and would be lost behind a 304).
+    """
+    if not hasattr(request, "_dashboard_stamp"):
+        pending = len(messages.get_messages(request))
+        request._dashboard_stamp = None if pending else versions.get_stamp(request.user)
+    return request._dashboard_stamp
+
+
+def _dashboard_etag(request):
+    stamp = _dashboard_stamp(request)
+    if stamp is None:
+        return None
+    # The page embeds the CSRF token, so a rotated token is a new page
+    csrf = hashlib.sha256(request.COOKIES.get(settings.CSRF_COOKIE_NAME, "").encode()).hexdigest()[:8]
+    return f"{request.user.pk}-{versions.stamp_token(stamp)}-{_dashboard_page(request)}-{csrf}"
+
+
+def _dashboard_last_modified(request):
+    stamp = _dashboard_stamp(request)
+    return stamp.changed_at if stamp is not None else None
+
+
+def _workout_table(request):
+    """
+    Rendered workout table for the requested page, cached per list version:
+    any change to the user's workouts bumps the version, which moves every
+    page to a fresh cache key.
+    """
+    page = _dashboard_page(request)
+    stamp = getattr(request, "_dashboard_stamp", None) or versions.get_stamp(request.user)
+    key = f"dashboard-table:{request.user.pk}:{versions.stamp_token(stamp)}:{page}"
+    html = cache.get(key)
+    if html is None:
+        workouts = Workout.objects.filter(user=request.user).order_by("-date", "-created_at")
+        page_obj = Paginator(workouts, DASHBOARD_PAGE_SIZE).get_page(page)
+        html = render_to_string(
+            "training/_workout_table.html", {"workouts": page_obj.object_list, "page_obj": page_obj},
+        )
+        cache.set(key, html, DASHBOARD_TABLE_TIMEOUT)
+    return mark_safe(html)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
 class DashboardView(LoginRequiredMixin, View):
+    @method_decorator(condition(etag_func=_dashboard_etag, last_modified_func=_dashboard_last_modified))
     def get(self, request):
         form = FitUploadForm()
-        workouts = Workout.objects.filter(user=request.user).order_by("-date", "-created_at")
-        return render(request, "training/dashboard.html", {"form": form, "workouts": workouts})
+        response = render(request, "training/dashboard.html", {"form": form, "workout_table": _workout_table(request)})
+        # Always revalidate; the ETag makes that a 304 while nothing changed
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     def post(self, request):
+        use_fit_upload_handler(request)
+        return self._post(request)
+
+    @method_decorator(csrf_protect)
+    def _post(self, request):
         form = FitUploadForm(request.POST, request.FILES)
-        workouts = Workout.objects.filter(user=request.user).order_by("-date", "-created_at")
 
         if form.is_valid():
             f = form.cleaned_data["file"]
             if not f.name.lower().endswith(".fit"):
                 messages.error(request, "Only .fit files are allowed.")
-                return render(request, "training/dashboard.html", {"form": form, "workouts": workouts})
-
-            # Save file
-            subdir = os.path.join("uploads", "fit", datetime.now().strftime("%Y/%m/%d"))
-            storage = FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, subdir))
-            filename = storage.save(f.name, f)
-
-            rel_path = f"{subdir}/{filename}".replace("\\", "/")
-
-            saved_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-            with open(saved_path, "rb") as saved_file:
-                metrics = parse_fit(saved_file)
-
-            if not metrics.get("date"):
-                metrics["date"] = date_cls.today()
-
-            Workout.objects.create(
-                user=request.user,
-                date=metrics["date"],
-                distance_miles=metrics["distance_miles"],
-                duration_minutes=metrics["duration_minutes"],
-                avg_heart_rate=metrics["avg_heart_rate"],
-                avg_pace_min_per_mile=metrics["avg_pace_min_per_mile"],
-                file_path=rel_path,
-            )
-            messages.success(request, "Workout uploaded successfully!")
+                return render(request, "training/dashboard.html", {"form": form, "workout_table": _workout_table(request)})
+            rel_path, content_hash = save_fit_upload(f)
+            probe, _ = probe_upload(f)  # already checked by the form
+            if (dedup.find_duplicate(request.user, content_hash) is not None
+                    or dedup.find_same_recording(request.user, probe["fit_file_id"]) is not None):
+                messages.info(request, "You've already uploaded this file.")
+                return redirect("web-dashboard")
+            enqueue_fit_upload(request.user, rel_path, content_hash)
+            messages.success(request, "Upload received – your workout will appear once it's processed.")
             return redirect("web-dashboard")
 
-        return render(request, "training/dashboard.html", {"form": form, "workouts": workouts})
+        # The page shows messages, not the form's own error list
+        for error in form.errors.get("file", ()):
+            messages.error(request, error)
+        return render(request, "training/dashboard.html", {"form": form, "workout_table": _workout_table(request)})
 
 
 # ---------- Workout detail with AI insights ----------
-class WorkoutPageView(LoginRequiredMixin, View):
-    def get(self, request, id):
-        from .services import get_workout_insights   # lazy import avoids circular issues
-        workout = get_object_or_404(Workout, id=id, user=request.user)
-        file_url = workout.file_path
-        insights = get_workout_insights(workout)
+# The async views below await the ORM and outside HTTP calls instead of
+# holding a worker thread, so under ASGI one worker serves many at once.
+async def _load_user(request):
+    """Resolve request.user up front; templates can't load it lazily from async code."""
+    request.user = await request.auser()
+    return request.user
 
-        return render(request, "training/workout_detail.html", {
-            "workout": workout,
-            "file_url": file_url,
-            "insights": insights,
-        })
-    
-from django.shortcuts import render, get_object_or_404
-from .models import Workout
-from openai import OpenAI
-import os
 
-def workout_detail(request, strava_id):
-    workout = get_object_or_404(Workout, strava_id=strava_id)
+@login_required
+async def workout_page(request, id):
+    user = await _load_user(request)
+    workout = await aget_object_or_404(Workout, id=id, user=user)
+    return await _render_workout(request, workout, file_url=workout.file_path)
 
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)  # initialize here
 
-    prompt = f"""
-    You are a running coach. Give me short, actionable insights on this workout:
-    - Distance: {workout.distance_miles:.2f} miles
-    - Duration: {workout.duration_minutes:.2f} minutes
-    - Average Heart Rate: {workout.avg_heart_rate if workout.avg_heart_rate else "N/A"} bpm
-    - Average Pace: {workout.avg_pace_min_per_mile if workout.avg_pace_min_per_mile else "N/A"} min/mi
-    """
+async def workout_detail(request, strava_id):
+    await _load_user(request)
+    workout = await aget_object_or_404(Workout, strava_id=strava_id)
+    return await _render_workout(request, workout)
 
-    insights = None
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert running coach."},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=500,
-        )
-        insights = response.choices[0].message.content.strip()
-    except Exception as e:
-        insights = f"(Error generating insights: {e})"
+
+async def _render_workout(request, workout, **context):
+    # Served from the insight cache; on a miss it's generated in the background
+    retry = "retry" in request.GET
+    status, insights = await services.aget_cached_insights(workout, retry=retry)
+    if retry:
+        # Drop ?retry so the pending page's auto-refresh doesn't retry again
+        return redirect(request.path)
 
     return render(request, "training/workout_detail.html", {
         "workout": workout,
         "insights": insights,
+        "insights_pending": status == WorkoutInsight.PENDING,
+        "insights_failed": status == WorkoutInsight.FAILED,
+        **context,
     })
 
 # def workout_delete(request, pk):
@@ -255,23 +459,14 @@ def strava_login(request):
     return redirect(auth_url)
 
 
-def strava_callback(request):
+async def strava_callback(request):
     code = request.GET.get("code")
 
     if not code:
         return JsonResponse({"error": "Missing code"}, status=400)
 
     # Step 1: Exchange code for token
-    token_url = "https://www.strava.com/oauth/token"
-    payload = {
-        "client_id": settings.STRAVA_CLIENT_ID,
-        "client_secret": settings.STRAVA_CLIENT_SECRET,
-        "code": code,
-        "grant_type": "authorization_code",
-    }
-
-    res = requests.post(token_url, data=payload)
-    data = res.json()
+    data = await strava.aexchange_code(code)
 
     if "access_token" not in data:
         return JsonResponse(
@@ -279,127 +474,73 @@ def strava_callback(request):
         )
 
     # Step 2: Save tokens to DB
-    user = User.objects.first()  # TODO: replace with request.user once auth is in place
-    StravaToken.objects.update_or_create(
-    user=user,
-    defaults={
-        "access_token": data["access_token"],
-        "refresh_token": data["refresh_token"],
-        "expires_at": datetime.fromtimestamp(data["expires_at"], tz=dt_timezone.utc),  # use stdlib utc
-        "updated_at": timezone.now(),  # Django’s timezone
-        },
-    )
+    user = await User.objects.afirst()  # TODO: replace with request.user once auth is in place
+    await strava.token_manager.asave_token(user, data)
 
-    # Step 3: Fetch activities from Strava
-    headers = {"Authorization": f"Bearer {data['access_token']}"}
-    activities_url = "https://www.strava.com/api/v3/athlete/activities"
-    activities_res = requests.get(activities_url, headers=headers, params={"per_page": 3})
-    activities = activities_res.json()
-
-    # Step 4: Save activities to DB
-    for act in activities:
-        Workout.objects.update_or_create(
-            strava_id=act["id"],
-            user=user,
-            defaults={
-                "date": act.get("start_date_local", timezone.now()),
-                "distance_miles": round(act.get("distance", 0) / 1609.34, 2),
-                "duration_minutes": round(act.get("moving_time", 0) / 60, 2),
-                "avg_heart_rate": act.get("average_heartrate"),
-                "avg_pace_min_per_mile": (
-                    round((act["moving_time"] / 60) / (act["distance"] / 1609.34), 2)
-                    if act.get("distance") and act.get("moving_time")
-                    else None
-                ),
-            },
-        )
+    # Step 3: Queue the import; the sync worker pages through the history
+    await strava.arequest_sync(user)
 
-    # Step 5: Redirect to dashboard (data now in DB)
+    # Step 4: Redirect to dashboard (workouts appear as the sync lands)
     return redirect("dashboard")
 
 def save_strava_activities(user, activities):
     """
     Takes a list of Strava activity dicts and saves/updates them in the DB.
     """
-    for act in activities:
-        Workout.objects.update_or_create(
-            strava_id=act["id"],   # unique identifier from Strava
-            user=user,
-            defaults={
-                "date": act.get("start_date_local", timezone.now()),
-                "distance_miles": round(act.get("distance", 0) / 1609.34, 2),  # meters → miles
-                "duration_minutes": round(act.get("moving_time", 0) / 60, 2),  # seconds → minutes
-                "avg_heart_rate": act.get("average_heartrate"),
-                "avg_pace_min_per_mile": (
-                    round((act["moving_time"] / 60) / (act["distance"] / 1609.34), 2)
-                    if act.get("distance") and act.get("moving_time") else None
-                ),
-            }
-        )
+    return strava.upsert_activities(user, activities)
+
+
+@login_required
+@require_POST
+def strava_sync(request):
+    """Ask the sync worker to pull new Strava activities for this user."""
+    if not StravaToken.objects.filter(user=request.user).exists():
+        messages.error(request, "Connect your Strava account first.")
+    else:
+        strava.request_sync(request.user)
+        messages.success(request, "Strava sync queued – new activities will appear shortly.")
+    return redirect("dashboard")
 
 
-def dashboard(request):
-    user = request.user
-    activities = get_strava_activities(user, per_page=3)
-
-    workouts = []
-    for a in activities:
-        distance_miles = a["distance"] / 1609.34  # meters → miles
-        duration_minutes = a["moving_time"] / 60  # seconds → minutes
-        avg_pace = (duration_minutes / distance_miles) if distance_miles > 0 else None
-
-        workouts.append({
-            "date": a["start_date_local"][:10],
-            "distance_miles": distance_miles,
-            "duration_minutes": duration_minutes,
-            "avg_heart_rate": a.get("average_heartrate"),
-            "avg_pace_min_per_mile": avg_pace,
-            "id": a["id"],
-        })
-
-    return render(request, "training/dashboard.html", {"workouts": workouts})
-
-def refresh_strava_token(user):
-    token = user.strava_token
-    if datetime.now().timestamp() > token.expires_at.timestamp():
-        url = "https://www.strava.com/oauth/token"
-        payload = {
-            "client_id": "YOUR_CLIENT_ID",
-            "client_secret": "YOUR_CLIENT_SECRET",
-            "grant_type": "refresh_token",
-            "refresh_token": token.refresh_token
-        }
-        res = requests.post(url, data=payload).json()
-        token.access_token = res["access_token"]
-        token.refresh_token = res["refresh_token"]
-        token.expires_at = datetime.fromtimestamp(res["expires_at"])
-        token.save()
-    return token.access_token
-
-def get_strava_activities(user, per_page=3):
-    try:
-        token = StravaToken.objects.get(user=user)
-    except StravaToken.DoesNotExist:
-        return []
-
-    # refresh if expired
-    if token.expires_at <= timezone.now():
-        refresh_url = "https://www.strava.com/oauth/token"
-        refresh_payload = {
-            "client_id": settings.STRAVA_CLIENT_ID,
-            "client_secret": settings.STRAVA_CLIENT_SECRET,
-            "grant_type": "refresh_token",
-            "refresh_token": token.refresh_token,
-        }
-        res = requests.post(refresh_url, data=refresh_payload)
-        data = res.json()
-        token.access_token = data["access_token"]
-        token.refresh_token = data["refresh_token"]
-        token.expires_at = datetime.fromtimestamp(data["expires_at"])
-        token.save()
-
-    headers = {"Authorization": f"Bearer {token.access_token}"}
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    res = requests.get(url, headers=headers, params={"per_page": per_page})
-    return res.json()
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def strava_webhook(request):
+    """
+    Strava push subscription. GET answers the subscription handshake; POST
+    receives an event, which is queued for the sync worker. Strava expects
+    the 200 within two seconds, so nothing else happens here.
+    """
+    if request.method == "GET":
+        if (
+            request.GET.get("hub.mode") != "subscribe"
+            or not settings.STRAVA_WEBHOOK_VERIFY_TOKEN
+            or request.GET.get("hub.verify_token") != settings.STRAVA_WEBHOOK_VERIFY_TOKEN
+        ):
+            return JsonResponse({"error": "Verification failed"}, status=403)
+        return JsonResponse({"hub.challenge": request.GET.get("hub.challenge", "")})
 
+    try:
+        payload = json.loads(request.body)
+        subscription_id = int(payload.get("subscription_id", 0))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({"error": "Invalid event"}, status=400)
+    # Without a configured subscription there is nothing to check events against
+    if not settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID or subscription_id != settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID:
+        return JsonResponse({"error": "Unknown subscription"}, status=403)
+    try:
+        strava.enqueue_webhook_event(payload)
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Invalid event"}, status=400)
+    return JsonResponse({"status": "queued"})
+
+
+@login_required
+async def dashboard(request):
+    # Only reads what the sync worker has stored; never calls Strava inline
+    user = await _load_user(request)
+    workouts = [
+        w async for w in Workout.objects.filter(user=user, strava_id__isnull=False)
+        .order_by("-date")[:DASHBOARD_WORKOUTS]
+    ]
+    sync_state = await StravaSyncState.objects.filter(user=user).afirst()
+    return render(request, "training/dashboard.html", {"workouts": workouts, "sync_state": sync_state})